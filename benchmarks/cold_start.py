@@ -0,0 +1,116 @@
+# standard library imports
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Sequence
+
+OUTPUT_FILE = "out/benchmarks/cold_start.json"
+DEFAULT_RUNS = 5
+# NOTE: budgets of a fresh interpreter with the lexicon cache already built,
+# the import is dominated by pandas, the stats command by loading the csv
+IMPORT_BUDGET_SECONDS = 1.0
+STATS_BUDGET_SECONDS = 3.0
+PLOTTING_MODULES = ("matplotlib", "seaborn", "wordcloud")
+
+# NOTE: runs in the fresh interpreter, prints the seconds and the plotting
+# modules that were imported
+MEASURE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+if sys.argv[1:]:
+    main.cli(sys.argv[1:])
+print(json.dumps({
+    "import_seconds": imported - start,
+    "run_seconds": time.perf_counter() - imported,
+    "plotting_modules": [m for m in %r if m in sys.modules],
+}))
+""" % (PLOTTING_MODULES,)
+
+
+def measure(command: Sequence[str]) -> dict:
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT, *command],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    measurement = json.loads(completed.stdout.strip().splitlines()[-1])
+    # NOTE: the wall time includes the interpreter start up
+    measurement["wall_seconds"] = time.perf_counter() - start
+    return measurement
+
+
+def summarize(name: str, measurements: List[dict], budget: float) -> dict:
+    wall_seconds = [measurement["wall_seconds"] for measurement in measurements]
+    return {
+        "name": name,
+        "runs": len(measurements),
+        "median_seconds": statistics.median(wall_seconds),
+        "max_seconds": max(wall_seconds),
+        "median_import_seconds": statistics.median(
+            measurement["import_seconds"] for measurement in measurements
+        ),
+        "budget_seconds": budget,
+        "within_budget": statistics.median(wall_seconds) <= budget,
+        "plotting_modules": sorted(
+            {
+                module
+                for measurement in measurements
+                for module in measurement["plotting_modules"]
+            }
+        ),
+    }
+
+
+def run_benchmark(
+    runs: int = DEFAULT_RUNS,
+    import_budget: float = IMPORT_BUDGET_SECONDS,
+    stats_budget: float = STATS_BUDGET_SECONDS,
+) -> List[dict]:
+    # NOTE: one warm up run builds missing caches, it is not measured
+    measure(["stats"])
+    imports = [measure([]) for _ in range(runs)]
+    stats = [measure(["stats"]) for _ in range(runs)]
+    return [
+        summarize("import main", imports, import_budget),
+        summarize("main.py stats", stats, stats_budget),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET_SECONDS)
+    parser.add_argument("--stats-budget", type=float, default=STATS_BUDGET_SECONDS)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    results = run_benchmark(args.runs, args.import_budget, args.stats_budget)
+    os.makedirs(Path(args.output).parent, exist_ok=True)
+    with open(args.output, "w") as json_file:
+        json.dump(results, json_file, indent=2)
+
+    print(f"{'command':<16} {'median s':>9} {'max s':>9} {'budget s':>9} plotting")
+    for result in results:
+        print(
+            f"{result['name']:<16} {result['median_seconds']:>9.3f} "
+            f"{result['max_seconds']:>9.3f} {result['budget_seconds']:>9.3f} "
+            f"{','.join(result['plotting_modules']) or '-'}"
+        )
+    # NOTE: a failing exit status lets a ci job guard the budget
+    failed = [
+        result["name"]
+        for result in results
+        if not result["within_budget"] or result["plotting_modules"]
+    ]
+    if failed:
+        print(f"over budget or importing the plotting libraries: {failed}")
+        sys.exit(1)
@@ -0,0 +1,71 @@
+# standard library imports
+import random
+import string
+import timeit
+
+# local services imports
+from services.lexicon import CompoundLexicon, CompoundMatcher, Lexicon
+from services.utilities import filter_words
+
+LEXICON_SIZES = [100, 1_000, 10_000, 100_000]
+TOKENS_PER_BATCH = 10_000
+
+
+def random_words(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12)))
+        for _ in range(count)
+    ]
+
+
+def time_per_token(func, tokens: list, repeat: int = 3) -> float:
+    number = 1
+    duration = min(timeit.repeat(func, number=number, repeat=repeat))
+    return duration / (number * len(tokens))
+
+
+def run_benchmark() -> list:
+    results = []
+    for size in LEXICON_SIZES:
+        stopwords_list = random_words(size, seed=1)
+        nouns_list = random_words(size, seed=2)
+        # NOTE: half of the tokens are nouns, the rest misses both lexicons
+        tokens = random.Random(3).sample(nouns_list, min(size, TOKENS_PER_BATCH // 2))
+        tokens += random_words(TOKENS_PER_BATCH - len(tokens), seed=4)
+        stopwords, nouns = Lexicon(stopwords_list), Lexicon(nouns_list)
+        kept_words = nouns.difference(stopwords)
+
+        lexicon_cost = time_per_token(lambda: kept_words.filter(tokens), tokens)
+        # NOTE: the list scan is quadratic, so it is only sampled on a slice
+        sample = tokens[: max(10, TOKENS_PER_BATCH * 100 // size)]
+        list_cost = time_per_token(
+            lambda: filter_words(sample, stopwords_list, nouns_list), sample
+        )
+
+        # NOTE: every token missing from the lexicon walks the head trie, cold
+        # with an empty memo per batch, warm with the tokens already matched
+        compounds = CompoundLexicon(nouns_list, CompoundMatcher(nouns_list))
+        compounds = compounds.difference(stopwords)
+
+        def filter_cold() -> list:
+            compounds.matcher.memo.clear()
+            return compounds.filter(tokens)
+
+        cold_cost = time_per_token(filter_cold, tokens)
+        compounds.filter(tokens)
+        warm_cost = time_per_token(lambda: compounds.filter(tokens), tokens)
+        results.append((size, list_cost, lexicon_cost, cold_cost, warm_cost))
+    return results
+
+
+if __name__ == "__main__":
+    print(
+        f"{'lexicon size':>12} {'list ns/token':>14} {'Lexicon ns/token':>17} "
+        f"{'compound cold':>14} {'compound warm':>14}"
+    )
+    for size, list_cost, lexicon_cost, cold_cost, warm_cost in run_benchmark():
+        print(
+            f"{size:>12} {list_cost * 1e9:>14.1f} {lexicon_cost * 1e9:>17.1f} "
+            f"{cold_cost * 1e9:>14.1f} {warm_cost * 1e9:>14.1f}"
+        )
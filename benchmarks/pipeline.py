@@ -0,0 +1,445 @@
+# standard library imports
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, NamedTuple
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+# local services imports
+from services.aggregation import (
+    aggregate_reviews,
+    get_ratings_in_total_from_aggregates,
+    get_sentiment_counts_from_aggregates,
+    get_top_ten_words_df_from_aggregates,
+)
+from services.cleaning import clean_text_values
+from services.dataloaders import (
+    load_data,
+    load_filter_nouns,
+    load_sentiment_lexicon,
+    load_stopwords,
+)
+from services.plotting import PlotJob, init_plot_worker, render_plot
+from services.terms import build_product_term_matrix, get_distinctive_terms
+from services.transformation import (
+    WordFrequencies,
+    filter_token_store,
+    get_filtered_text_df,
+    get_sentiment_from_text_df,
+    tokenize_text_values,
+)
+from services.utilities import get_input_file
+
+NLP_RESOURCES_PATH = "resources/nlp_resources"
+SENTIWS_FILES = ["SentiWS_v2.0_Negative.txt", "SentiWS_v2.0_Positive.txt"]
+DATA_FOLDER = "resources/cache/benchmarks"
+OUTPUT_FILE = "out/benchmarks/pipeline.json"
+DEFAULT_SIZES = [10_000, 100_000]
+DEFAULT_PRODUCTS = 10
+GENERATOR_CHUNKSIZE = 100_000
+PLOTTED_PRODUCTS = 10
+
+# NOTE: shares of bonprix.csv, ratings 1 to 5 and about 16 words per review
+RATING_WEIGHTS = [0.063, 0.04, 0.086, 0.296, 0.515]
+MEAN_WORDS_PER_REVIEW = 16
+MAX_WORDS_PER_REVIEW = 160
+STOPWORD_SHARE = 0.55
+NEUTRAL_SHARE = 0.2
+# NOTE: chance of a sentiment word to be positive per rating 1 to 5
+POSITIVE_SHARE_PER_RATING = np.array([0.1, 0.25, 0.5, 0.75, 0.9])
+NEUTRAL_SCORE = 0.05
+
+
+class Vocabulary(NamedTuple):
+    """Word pools the synthetic reviews are drawn from
+    :param stopwords: german stopwords
+    :param neutral: SentiWS words close to a zero score and additional nouns
+    :param positive: positive SentiWS words with all inflections
+    :param negative: negative SentiWS words with all inflections
+    """
+
+    stopwords: np.ndarray
+    neutral: np.ndarray
+    positive: np.ndarray
+    negative: np.ndarray
+
+
+def read_sentiws(filename: Path) -> pd.DataFrame:
+    sentiws_df = pd.read_csv(
+        filename,
+        sep="\t",
+        names=["word", "score", "inflections"],
+        encoding="utf-8",
+        quoting=3,
+    )
+    words = sentiws_df.word.str.split("|").str[0]
+    inflections = sentiws_df.inflections.fillna("").str.split(",")
+    sentiws_df = pd.DataFrame(
+        {"word": [[word] + forms for word, forms in zip(words, inflections)]}
+    ).assign(score=sentiws_df.score)
+    sentiws_df = sentiws_df.explode("word")
+    return sentiws_df[sentiws_df.word.str.len() > 0]
+
+
+def load_vocabulary(nlp_resources_path: str = NLP_RESOURCES_PATH) -> Vocabulary:
+    stopwords_path = get_input_file(nlp_resources_path, "german_stopwords_full.txt")
+    with open(stopwords_path, "r", encoding="utf-8") as file:
+        stopwords = [line.strip() for line in file if line.strip()]
+    sentiws_df = pd.concat(
+        [
+            read_sentiws(get_input_file(nlp_resources_path, filename))
+            for filename in SENTIWS_FILES
+        ]
+    )
+    with open(get_input_file("config", "additional_nouns.txt"), "r") as file:
+        additional_nouns = [line.strip().capitalize() for line in file]
+    neutral = sentiws_df.word[sentiws_df.score.abs() < NEUTRAL_SCORE].tolist()
+    return Vocabulary(
+        stopwords=np.array(stopwords, dtype=object),
+        neutral=np.array(neutral + additional_nouns, dtype=object),
+        positive=np.array(
+            sentiws_df.word[sentiws_df.score >= NEUTRAL_SCORE].tolist(), dtype=object
+        ),
+        negative=np.array(
+            sentiws_df.word[sentiws_df.score <= -NEUTRAL_SCORE].tolist(), dtype=object
+        ),
+    )
+
+
+def generate_reviews(
+    vocabulary: Vocabulary, reviews: int, product_ids: np.ndarray, rng
+) -> pd.DataFrame:
+    # NOTE: a few products collect most of the reviews, like on a shop
+    popularity = 1 / np.arange(1, len(product_ids) + 1)
+    products = rng.choice(product_ids, reviews, p=popularity / popularity.sum())
+    ratings = rng.choice(np.arange(1, 6), reviews, p=RATING_WEIGHTS)
+    lengths = np.minimum(
+        rng.geometric(1 / MEAN_WORDS_PER_REVIEW, reviews), MAX_WORDS_PER_REVIEW
+    )
+
+    # NOTE: every token is drawn at once, then split into reviews by length
+    tokens = lengths.sum()
+    review_ids = np.repeat(np.arange(reviews), lengths)
+    kind = rng.random(tokens)
+    is_positive = (
+        rng.random(tokens) < POSITIVE_SHARE_PER_RATING[ratings - 1][review_ids]
+    )
+    pools = [
+        (kind < STOPWORD_SHARE, vocabulary.stopwords),
+        (
+            (kind >= STOPWORD_SHARE) & (kind < STOPWORD_SHARE + NEUTRAL_SHARE),
+            vocabulary.neutral,
+        ),
+        ((kind >= STOPWORD_SHARE + NEUTRAL_SHARE) & is_positive, vocabulary.positive),
+        ((kind >= STOPWORD_SHARE + NEUTRAL_SHARE) & ~is_positive, vocabulary.negative),
+    ]
+    words = np.empty(tokens, dtype=object)
+    for mask, pool in pools:
+        words[mask] = pool[rng.integers(0, len(pool), mask.sum())]
+
+    words = words.tolist()
+    ends = np.cumsum(lengths).tolist()
+    starts = [0] + ends[:-1]
+    texts = [
+        " ".join(words[start:end]).capitalize() + "."
+        for start, end in zip(starts, ends)
+    ]
+    return pd.DataFrame({"StyleID": products, "text": texts, "rating": ratings})
+
+
+def write_reviews_csv(
+    filename: Path,
+    reviews: int,
+    products: int,
+    seed: int,
+    vocabulary: Vocabulary = None,
+) -> Path:
+    vocabulary = vocabulary or load_vocabulary()
+    rng = np.random.default_rng(seed)
+    product_ids = rng.choice(np.arange(1_000_000, 10_000_000), products, replace=False)
+    os.makedirs(filename.parent, exist_ok=True)
+    partial_filename = filename.with_suffix(".partial")
+    # NOTE: written in chunks, so 10M reviews never sit in memory at once
+    for start in range(0, reviews, GENERATOR_CHUNKSIZE):
+        size = min(GENERATOR_CHUNKSIZE, reviews - start)
+        chunk = generate_reviews(vocabulary, size, product_ids, rng)
+        mode = "w" if start == 0 else "a"
+        with open(
+            partial_filename, mode, encoding="latin-1", errors="replace", newline=""
+        ) as file:
+            chunk.to_csv(file, sep=";", index=False, header=start == 0)
+    partial_filename.replace(filename)
+    return filename
+
+
+def get_reviews_csv(data_folder: str, reviews: int, products: int, seed: int) -> Path:
+    # NOTE: the same size, product count and seed always give the same file,
+    # so different versions of the pipeline are timed on identical input
+    filename = Path(data_folder, f"reviews_{reviews}_{products}_{seed}.csv")
+    if not filename.exists():
+        write_reviews_csv(filename, reviews, products, seed)
+    return filename
+
+
+def get_peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # NOTE: ru_maxrss is in kilobytes on linux and in bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_stage(stages: List[dict], name: str, items: int, func: Callable, *args):
+    peak_before = get_peak_rss_mb()
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    peak_after = get_peak_rss_mb()
+    stages.append(
+        {
+            "name": name,
+            "seconds": seconds,
+            "items": items,
+            "throughput": items / seconds if seconds else None,
+            "peak_rss_mb": peak_after,
+            "peak_rss_increase_mb": peak_after - peak_before,
+        }
+    )
+    return result
+
+
+def get_plot_jobs(aggregates, output_folder: str) -> List[PlotJob]:
+    plot_jobs = []
+    histogram_config = {
+        "x_value": "rating",
+        "y_value": "count",
+        "x_label": "Ratings",
+        "y_label": "Count",
+        "title": "Total Ratings",
+    }
+    for product_id in aggregates.rating_counts.index[:PLOTTED_PRODUCTS]:
+        counts = get_sentiment_counts_from_aggregates(aggregates, product_id)
+        output_path = Path(output_folder, f"product_{product_id}_sentiment.png")
+        plot_jobs.append(PlotJob("pie", counts, output_path, str(product_id)))
+        ratings_df = get_ratings_in_total_from_aggregates(aggregates, product_id)
+        output_path = Path(output_folder, f"product_{product_id}_rating.png")
+        plot_jobs.append(
+            PlotJob("histogram", ratings_df, output_path, config=histogram_config)
+        )
+    top_ten_df = get_top_ten_words_df_from_aggregates(aggregates)
+    output_path = Path(output_folder, "most_frequent_words.png")
+    config = {**histogram_config, "x_value": "word", "x_label": "Word"}
+    plot_jobs.append(PlotJob("histogram", top_ten_df, output_path, config=config))
+    frequencies = dict(aggregates.word_counts.most_common(200))
+    output_path = Path(output_folder, "wordcloud.png")
+    plot_jobs.append(PlotJob("wordcloud", frequencies, output_path))
+    return plot_jobs
+
+
+def render_plot_jobs(plot_jobs: List[PlotJob]) -> None:
+    for job in plot_jobs:
+        render_plot(job)
+
+
+def benchmark_pipeline(filename: Path, rows: int) -> List[dict]:
+    stages = []
+    stopwords = load_stopwords(
+        get_input_file(NLP_RESOURCES_PATH, "german_stopwords_full.txt")
+    )
+    nouns = load_filter_nouns(
+        [get_input_file(NLP_RESOURCES_PATH, name) for name in SENTIWS_FILES],
+        get_input_file("config", "additional_nouns.txt"),
+    )
+    sentiment_words = load_sentiment_lexicon(
+        get_input_file(NLP_RESOURCES_PATH, "complete_sentiment_words.json")
+    )
+
+    df = run_stage(stages, "load_data", rows, load_data, filename)
+    reviews = len(df)
+    df = run_stage(stages, "clean_text_values", reviews, clean_text_values, df)
+    token_store = run_stage(
+        stages, "tokenize_text_values", reviews, tokenize_text_values, df
+    )
+    sentiment_df = run_stage(
+        stages,
+        "get_sentiment_from_text_df",
+        reviews,
+        get_sentiment_from_text_df,
+        df,
+        sentiment_words,
+        token_store,
+    )
+    filtered_df = run_stage(
+        stages,
+        "get_filtered_text_df",
+        reviews,
+        get_filtered_text_df,
+        df,
+        stopwords,
+        nouns,
+        token_store,
+    )
+    aggregates = run_stage(
+        stages,
+        "aggregate_reviews",
+        reviews,
+        lambda: aggregate_reviews(
+            df,
+            sentiment_df,
+            WordFrequencies.from_words(itertools.chain.from_iterable(filtered_df.text)),
+        ),
+    )
+    product_term_matrix = run_stage(
+        stages,
+        "build_product_term_matrix",
+        reviews,
+        lambda: build_product_term_matrix(
+            df.product_id, filter_token_store(token_store, stopwords, nouns)
+        ),
+    )
+    run_stage(
+        stages,
+        "get_distinctive_terms",
+        product_term_matrix.nnz,
+        get_distinctive_terms,
+        product_term_matrix,
+    )
+    with tempfile.TemporaryDirectory() as output_folder:
+        init_plot_worker()
+        plot_jobs = get_plot_jobs(aggregates, output_folder)
+        run_stage(stages, "plotting", len(plot_jobs), render_plot_jobs, plot_jobs)
+    return stages
+
+
+def benchmark_size(data_folder: str, reviews: int, products: int, seed: int) -> dict:
+    start = time.perf_counter()
+    filename = get_reviews_csv(data_folder, reviews, products, seed)
+    generate_seconds = time.perf_counter() - start
+    stages = benchmark_pipeline(filename, reviews)
+    pipeline_seconds = sum(stage["seconds"] for stage in stages)
+    return {
+        "reviews": reviews,
+        "products": products,
+        "seed": seed,
+        "input_mb": filename.stat().st_size / 2**20,
+        "generate_seconds": generate_seconds,
+        "total_seconds": pipeline_seconds,
+        "throughput": reviews / pipeline_seconds,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "stages": stages,
+    }
+
+
+def get_git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    sizes: List[int],
+    products: int = DEFAULT_PRODUCTS,
+    seed: int = 0,
+    data_folder: str = DATA_FOLDER,
+) -> dict:
+    runs = []
+    # NOTE: every size runs in a fresh process, otherwise the peak memory of
+    # a larger size would hide the one of every size after it
+    context = multiprocessing.get_context("spawn")
+    for reviews in sizes:
+        with context.Pool(1) as pool:
+            run = pool.apply(benchmark_size, (data_folder, reviews, products, seed))
+        runs.append(run)
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": get_git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": multiprocessing.cpu_count(),
+        "versions": {"numpy": np.__version__, "pandas": pd.__version__},
+        "runs": runs,
+    }
+
+
+def compare_results(results: dict, baseline: dict) -> List[tuple]:
+    baseline_stages = {
+        (run["reviews"], run["products"], stage["name"]): stage["seconds"]
+        for run in baseline["runs"]
+        for stage in run["stages"]
+    }
+    comparison = []
+    for run in results["runs"]:
+        for stage in run["stages"]:
+            key = (run["reviews"], run["products"], stage["name"])
+            if key in baseline_stages:
+                ratio = stage["seconds"] / baseline_stages[key]
+                comparison.append((*key, baseline_stages[key], stage["seconds"], ratio))
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="number of synthetic reviews per run, e.g. 10000 1000000 10000000",
+    )
+    parser.add_argument("--products", type=int, default=DEFAULT_PRODUCTS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--data-folder",
+        default=DATA_FOLDER,
+        help="generated review files are kept here and reused",
+    )
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument(
+        "--compare",
+        help="results of an earlier run to print the change per stage against",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.products, args.seed, args.data_folder)
+    os.makedirs(Path(args.output).parent, exist_ok=True)
+    with open(args.output, "w") as json_file:
+        json.dump(results, json_file, indent=2)
+
+    print(
+        f"{'reviews':>10} {'stage':<28} {'seconds':>9} {'items/s':>12} {'peak MB':>9}"
+    )
+    for run in results["runs"]:
+        for stage in run["stages"]:
+            print(
+                f"{run['reviews']:>10} {stage['name']:<28} {stage['seconds']:>9.3f} "
+                f"{stage['throughput']:>12.0f} {stage['peak_rss_mb']:>9.1f}"
+            )
+    if args.compare:
+        with open(args.compare, "r") as json_file:
+            baseline = json.load(json_file)
+        print(
+            f"\n{'reviews':>10} {'stage':<28} {'before':>9} {'after':>9} {'ratio':>7}"
+        )
+        for reviews, _, name, before, after, ratio in compare_results(
+            results, baseline
+        ):
+            print(
+                f"{reviews:>10} {name:<28} {before:>9.3f} {after:>9.3f} {ratio:>7.2f}"
+            )
@@ -0,0 +1,200 @@
+# standard library imports
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import List
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+# local services imports
+from benchmarks.pipeline import (
+    DATA_FOLDER,
+    DEFAULT_PRODUCTS,
+    NLP_RESOURCES_PATH,
+    get_reviews_csv,
+)
+from services.aggregation import (
+    aggregate_reviews,
+    get_average_rating_per_id_from_aggregates,
+    get_overall_sentiment_from_aggregates,
+    get_ratings_in_total_from_aggregates,
+)
+from services.cleaning import clean_text_values
+from services.dataloaders import (
+    DEFAULT_CHUNKSIZE,
+    load_data,
+    load_data_chunks,
+    load_sentiment_lexicon,
+)
+from services.sampling import (
+    estimate_average_rating_per_id,
+    estimate_overall_sentiment,
+    estimate_ratings_in_total,
+    sample_reviews_per_product,
+)
+from services.transformation import (
+    WordFrequencies,
+    get_sentiment_from_text_df,
+    tokenize_text_values,
+)
+from services.utilities import get_input_file
+
+OUTPUT_FILE = "out/benchmarks/preview.json"
+DEFAULT_SIZES = [100_000]
+DEFAULT_SAMPLE_SIZES = [50, 200, 1000]
+
+
+def score_sentiment(df: pd.DataFrame, sentiment_words) -> pd.DataFrame:
+    df = clean_text_values(df)
+    return get_sentiment_from_text_df(df, sentiment_words, tokenize_text_values(df))
+
+
+def run_exact(filename: Path, sentiment_words) -> dict:
+    start = time.perf_counter()
+    df = load_data(filename)
+    aggregates = aggregate_reviews(
+        df, score_sentiment(df, sentiment_words), WordFrequencies()
+    )
+    return {
+        "seconds": time.perf_counter() - start,
+        "average_rating": get_average_rating_per_id_from_aggregates(aggregates),
+        "rating_distribution": get_ratings_in_total_from_aggregates(aggregates),
+        "overall_sentiment": get_overall_sentiment_from_aggregates(aggregates),
+    }
+
+
+def run_preview(
+    filename: Path, sentiment_words, sample_size: int, chunksize: int
+) -> dict:
+    start = time.perf_counter()
+    sample = sample_reviews_per_product(
+        load_data_chunks(filename, chunksize), sample_size
+    )
+    sentiment_df = score_sentiment(sample.df, sentiment_words)
+    return {
+        "seconds": time.perf_counter() - start,
+        "sampled": len(sample.df),
+        "average_rating": estimate_average_rating_per_id(sample),
+        "rating_distribution": estimate_ratings_in_total(sample),
+        "overall_sentiment": estimate_overall_sentiment(sample, sentiment_df),
+    }
+
+
+def get_errors(exact_df: pd.DataFrame, estimate_df: pd.DataFrame, key: str) -> dict:
+    # NOTE: the value column is rating for the averages and count otherwise,
+    # a value the sample missed is estimated as zero
+    value = "rating" if key == "article" else "count"
+    merged = exact_df.merge(estimate_df, on=key, how="left", suffixes=("", "_preview"))
+    estimates = merged[f"{value}_preview"].fillna(0).to_numpy(dtype="float64")
+    exact = merged[value].to_numpy(dtype="float64")
+    errors = np.abs(estimates - exact)
+    # NOTE: the averages are rounded to two decimals like the exact ones
+    tolerance = 0.005 if key == "article" else 0.5
+    covered = (merged.ci_low.to_numpy() - tolerance <= exact) & (
+        exact <= merged.ci_high.to_numpy() + tolerance
+    )
+    if key != "article":
+        errors = errors / np.maximum(exact, 1)
+    return {
+        "max_error": float(errors.max()) if len(errors) else 0.0,
+        "mean_error": float(errors.mean()) if len(errors) else 0.0,
+        "coverage": float(covered.mean()) if len(covered) else 1.0,
+    }
+
+
+def benchmark_file(
+    filename: Path, sample_sizes: List[int], chunksize: int = DEFAULT_CHUNKSIZE
+) -> dict:
+    sentiment_words = load_sentiment_lexicon(
+        get_input_file(NLP_RESOURCES_PATH, "complete_sentiment_words.json")
+    )
+    exact = run_exact(filename, sentiment_words)
+    previews = []
+    for sample_size in sample_sizes:
+        preview = run_preview(filename, sentiment_words, sample_size, chunksize)
+        previews.append(
+            {
+                "sample_size": sample_size,
+                "sampled": preview["sampled"],
+                "seconds": preview["seconds"],
+                "speedup": exact["seconds"] / preview["seconds"],
+                # NOTE: absolute error of the averages, relative error of the
+                # counts, coverage is the share of exact values inside the
+                # confidence intervals
+                "average_rating": get_errors(
+                    exact["average_rating"], preview["average_rating"], "article"
+                ),
+                "rating_distribution": get_errors(
+                    exact["rating_distribution"],
+                    preview["rating_distribution"],
+                    "rating",
+                ),
+                "overall_sentiment": get_errors(
+                    exact["overall_sentiment"],
+                    preview["overall_sentiment"],
+                    "sentiment",
+                ),
+            }
+        )
+    return {
+        "input": str(filename),
+        "reviews": int(exact["rating_distribution"]["count"].sum()),
+        "products": len(exact["average_rating"]),
+        "exact_seconds": exact["seconds"],
+        "previews": previews,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--input",
+        nargs="+",
+        help="review csv files to measure instead of synthetic reviews",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--products", type=int, default=DEFAULT_PRODUCTS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-folder", default=DATA_FOLDER)
+    parser.add_argument(
+        "--sample-sizes", type=int, nargs="+", default=DEFAULT_SAMPLE_SIZES
+    )
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    filenames = [Path(filename) for filename in args.input or []] or [
+        get_reviews_csv(args.data_folder, reviews, args.products, args.seed)
+        for reviews in args.sizes
+    ]
+    results = [
+        benchmark_file(filename, args.sample_sizes, args.chunksize)
+        for filename in filenames
+    ]
+    os.makedirs(Path(args.output).parent, exist_ok=True)
+    with open(args.output, "w") as json_file:
+        json.dump(results, json_file, indent=2)
+
+    print(
+        f"{'reviews':>10} {'sample':>7} {'exact s':>8} {'preview s':>9} "
+        f"{'rating err':>10} {'rating cov':>10} {'dist err':>9} {'dist cov':>9} "
+        f"{'sent err':>9} {'sent cov':>9}"
+    )
+    for result in results:
+        for preview in result["previews"]:
+            average, distribution, sentiment = (
+                preview["average_rating"],
+                preview["rating_distribution"],
+                preview["overall_sentiment"],
+            )
+            print(
+                f"{result['reviews']:>10} {preview['sample_size']:>7} "
+                f"{result['exact_seconds']:>8.2f} {preview['seconds']:>9.2f} "
+                f"{average['max_error']:>10.3f} {average['coverage']:>10.2f} "
+                f"{distribution['max_error']:>9.3%} {distribution['coverage']:>9.2f} "
+                f"{sentiment['max_error']:>9.3%} {sentiment['coverage']:>9.2f}"
+            )
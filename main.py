@@ -1,78 +1,122 @@
 # standard library imports
+import argparse
+import functools
+import itertools
 import logging
 import multiprocessing
 import os
-from concurrent.futures import ProcessPoolExecutor as Executor
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Sequence
 
 # third party imports
 import pandas as pd
 
 # local services imports
+from services.aggregation import (
+    ReviewAggregates,
+    aggregate_chunks,
+    aggregate_ratings,
+    aggregate_reviews,
+    get_average_rating_per_id_from_aggregates,
+    get_overall_sentiment_from_aggregates,
+    get_product_stats_from_aggregates,
+    get_ratings_in_total_from_aggregates,
+    get_sentiment_counts_from_aggregates,
+    get_sentiment_per_product_from_aggregates,
+    get_top_ten_words_df_from_aggregates,
+    merge_all_aggregates,
+)
 from services.cleaning import clean_text_values
 from services.dataloaders import (
-    load_data,
+    DEFAULT_CHUNKSIZE,
+    get_input_files,
+    load_compound_nouns,
+    load_compound_sentiment_lexicon,
+    load_data_files,
+    load_files_chunks,
     load_filter_nouns,
-    load_sentiment_words,
+    load_sentiment_lexicon,
     load_stopwords,
 )
-from services.encoding import encode_rating
-from services.plotting import plot_histogram, plot_pie_chart, plot_wordcloud
+from services.deduplication import (
+    DEFAULT_SIMILARITY_THRESHOLD,
+    NearDuplicates,
+    UniqueTexts,
+    drop_near_duplicates,
+    expand_token_store,
+    factorize_texts,
+    fan_out_frame,
+    fan_out_values,
+    find_near_duplicate_reviews,
+    get_near_duplicate_clusters,
+    log_deduplication_stats,
+)
+from services.encoding import RATING_LABELS
+from services.export import Report, write_reports, write_table
+from services.instrumentation import enable_instrumentation, write_events_to
+from services.lexicon import Lexicon, SentimentLexicon
+from services.persistence import (
+    load_review_store,
+    save_review_store,
+    update_review_store,
+)
+from services.plotting import PlotJob, init_plot_worker, render_plots
+from services.sampling import (
+    DEFAULT_SAMPLE_SIZE,
+    ReviewSample,
+    estimate_average_rating_per_id,
+    estimate_overall_sentiment,
+    estimate_ratings_in_total,
+    sample_reviews_per_product,
+)
+from services.scheduling import Pipeline, Stage
+from services.serving import (
+    DEFAULT_CHART_CACHE_SIZE,
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    Address,
+    ReviewIndex,
+    create_server,
+)
+from services.sharding import run_file_shards, run_sharded
+from services.terms import (
+    CountMatrix,
+    build_product_term_matrix,
+    get_distinctive_terms,
+    get_top_terms,
+)
 from services.transformation import (
-    get_average_rating_per_id,
-    get_filtered_text_df,
-    get_overall_sentiment_from_text_df,
-    get_ratings_in_total,
-    get_sentiment_from_text_df,
-    get_top_ten_words_df_from_list,
+    TokenStore,
+    WordFrequencies,
+    count_words,
+    filter_token_store,
+    get_review_sentiment_scores,
+    tokenize_text_values,
 )
-from services.utilities import clean_text_column, get_input_file, get_output_path
+from services.utilities import get_input_file, get_output_path
+
+# NOTE: WordCloud draws at most 200 words by default
+WORDCLOUD_WORDS = 200
+
+
+LOG_FOLDER = "./log"
+DEFAULT_INPUT_FILE = get_input_file("resources/dataset", "bonprix.csv")
 
 
 def instantiate_logger():
+    # NOTE: only the command line logs to the file, importing main has no
+    # side effects
+    os.makedirs(LOG_FOLDER, exist_ok=True)
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        handlers=[logging.FileHandler("./log/logfile.log")],
+        handlers=[logging.FileHandler(os.path.join(LOG_FOLDER, "logfile.log"))],
     )
 
 
-try:
-    instantiate_logger()
-except FileNotFoundError:
-    os.mkdir("./log")
-    instantiate_logger()
-
-
-def save_plot_sentiment_from_text_per_product(sentiment_df: pd.DataFrame) -> None:
-    product_ids = sentiment_df.product_id.unique()
-    for product_id in product_ids:
-        title = f"Sentiment from text for product: {product_id}"
-        output_path = get_output_path(
-            "plots", f"product_{product_id}_sentiment_from_text.png"
-        )
-        subset_df = sentiment_df.loc[sentiment_df.product_id == product_id, :]
-        plot_pie_chart(subset_df.encoded_score, output_path, title)
-
-
-def save_plot_rating_distribution_per_product(df: pd.DataFrame) -> None:
-    product_ids = df.product_id.unique()
-    for product_id in product_ids:
-        subset_df = df.loc[df.product_id == product_id, :]
-        subset_rating_distribution_df = get_ratings_in_total(subset_df)
-        output_path = get_output_path(
-            "plots", f"product_{product_id}_rating_distribution.png"
-        )
-        config = {
-            "x_value": "rating",
-            "y_value": "count",
-            "x_label": "Ratings",
-            "y_label": "Count",
-            "title": f"Total ratings for product: {product_id}",
-        }
-        plot_histogram(subset_rating_distribution_df, config, output_path)
-
-
-def save_plot_overall_rating_distribution(total_rating_df: pd.DataFrame) -> None:
+def get_overall_rating_distribution_plot_job(total_rating_df: pd.DataFrame) -> PlotJob:
     output_path = get_output_path("plots", "total_rating_distribution.png")
     config = {
         "x_value": "rating",
@@ -81,90 +125,400 @@ def save_plot_overall_rating_distribution(total_rating_df: pd.DataFrame) -> None
         "y_label": "Count",
         "title": "Total Ratings",
     }
-    plot_histogram(total_rating_df, config, output_path)
+    return PlotJob("histogram", total_rating_df, output_path, config=config)
 
 
-def get_stopwords_and_nouns(nlp_resources_path: str) -> (list, list):
-    stopwords_path = get_input_file(nlp_resources_path, "german_stopwords_full.txt")
-    stopwords = load_stopwords(stopwords_path)
+def get_sentiws_paths(nlp_resources_path: str) -> list:
     words_resources = [
         "SentiWS_v2.0_Negative.txt",
         "SentiWS_v2.0_Positive.txt",
     ]
-    noun_paths = []
+    sentiws_paths = []
     for words_resource in words_resources:
         resource_path = get_input_file(nlp_resources_path, words_resource)
-        noun_paths.append(resource_path)
+        sentiws_paths.append(resource_path)
+    return sentiws_paths
+
+
+def get_stopwords_and_nouns(
+    nlp_resources_path: str,
+    rebuild_cache: bool = False,
+    compound_matching: bool = False,
+) -> (Lexicon, Lexicon):
+    stopwords_path = get_input_file(nlp_resources_path, "german_stopwords_full.txt")
+    stopwords = load_stopwords(stopwords_path)
+    noun_paths = get_sentiws_paths(nlp_resources_path)
     additional_nouns_path = get_input_file("config", "additional_nouns.txt")
-    nouns = load_filter_nouns(noun_paths, additional_nouns_path)
+    nouns = load_filter_nouns(noun_paths, additional_nouns_path, rebuild_cache)
+    if compound_matching:
+        nouns = load_compound_nouns(
+            noun_paths, nouns, additional_nouns_path, rebuild_cache
+        )
     return stopwords, nouns
 
 
-def main():
-    nlp_resources_path = "resources/nlp_resources"
-    input_filename = get_input_file("resources/dataset", "bonprix.csv")
-    df = load_data(input_filename)
+def get_sentiment_words(
+    nlp_resources_path: str,
+    rebuild_cache: bool = False,
+    compound_matching: bool = False,
+) -> SentimentLexicon:
+    path_sentiment_words = get_input_file(
+        nlp_resources_path, "complete_sentiment_words.json"
+    )
+    sentiment_words = load_sentiment_lexicon(path_sentiment_words, rebuild_cache)
+    if compound_matching:
+        # NOTE: stopwords like "vielleicht" are no compounds of "leicht"
+        stopwords_path = get_input_file(nlp_resources_path, "german_stopwords_full.txt")
+        sentiment_words = load_compound_sentiment_lexicon(
+            get_sentiws_paths(nlp_resources_path),
+            sentiment_words,
+            load_stopwords(stopwords_path),
+            get_input_file("config", "additional_nouns.txt"),
+            rebuild_cache,
+        )
+    return sentiment_words
+
+
+def clean_reviews(df: pd.DataFrame) -> pd.DataFrame:
     df = clean_text_values(df)
     logging.info(f"Initial customer data:\n {df.head()} \n")
+    return df
 
-    # TODO: USES INITIAL DF
-    path_sentiment_words = get_input_file(
-        nlp_resources_path, "complete_sentiment_words.json"
+
+def clean_unique_texts(unique_texts: UniqueTexts) -> pd.DataFrame:
+    return clean_text_values(unique_texts.to_frame())
+
+
+def fan_out_clean_reviews(
+    df: pd.DataFrame, unique_clean_df: pd.DataFrame, unique_texts: UniqueTexts
+) -> pd.DataFrame:
+    # NOTE: the same frame clean_reviews returns, every distinct text was
+    # only cleaned once
+    clean_df = df.drop(columns="text")
+    clean_df.insert(
+        df.columns.get_loc("text"),
+        "text",
+        fan_out_values(unique_clean_df.text.to_numpy(), unique_texts),
+    )
+    logging.info(f"Initial customer data:\n {clean_df.head()} \n")
+    return clean_df
+
+
+def tokenize_unique_texts(
+    unique_clean_df: pd.DataFrame, unique_texts: UniqueTexts
+) -> TokenStore:
+    unique_token_store = tokenize_text_values(unique_clean_df)
+    log_deduplication_stats(unique_texts, unique_token_store)
+    return unique_token_store
+
+
+def score_clean_reviews(
+    df: pd.DataFrame, sentiment_words: SentimentLexicon, token_store: TokenStore
+) -> pd.DataFrame:
+    sentiment_df = get_review_sentiment_scores(df, sentiment_words, token_store)
+    logging.info(
+        f"Sentiment scores of each customers review:\n {sentiment_df.head()} \n"
     )
-    sentiment_words = load_sentiment_words(path_sentiment_words)
-    sentiment_df = get_sentiment_from_text_df(df, sentiment_words)
+    return sentiment_df
+
+
+def filter_reviews(token_store: TokenStore, lexicons: tuple) -> TokenStore:
+    stopwords, nouns = lexicons
+    return filter_token_store(token_store, stopwords, nouns)
+
+
+def score_unique_reviews(
+    unique_clean_df: pd.DataFrame,
+    sentiment_words: SentimentLexicon,
+    unique_token_store: TokenStore,
+    unique_texts: UniqueTexts,
+) -> pd.DataFrame:
+    sentiment_df = get_review_sentiment_scores(
+        unique_clean_df, sentiment_words, unique_token_store
+    )
+    sentiment_df = fan_out_frame(sentiment_df, unique_texts)
     logging.info(
         f"Sentiment scores of each customers review:\n {sentiment_df.head()} \n"
     )
+    return sentiment_df
+
+
+def filter_unique_reviews(
+    unique_token_store: TokenStore, lexicons: tuple, unique_texts: UniqueTexts
+) -> TokenStore:
+    filtered_store = filter_reviews(unique_token_store, lexicons)
+    return expand_token_store(filtered_store, unique_texts)
+
+
+def get_review_results(
+    df: pd.DataFrame, sentiment_df: pd.DataFrame, filtered_store: TokenStore
+) -> pd.DataFrame:
+    return df[["product_id", "text", "rating"]].assign(
+        score=sentiment_df.score,
+        encoded_score=sentiment_df.encoded_score,
+        filtered=filtered_store.token_lists(),
+    )
+
+
+def aggregate_shards(
+    df: pd.DataFrame,
+    sentiment_words: SentimentLexicon,
+    lexicons: tuple,
+    workers: int,
+    word_capacity: int = None,
+) -> ReviewAggregates:
+    # NOTE: every worker cleans, tokenizes, scores and filters row ranges of
+    # the shared texts and returns partial aggregates
+    stopwords, nouns = lexicons
+    return run_sharded(df, sentiment_words, stopwords, nouns, workers, word_capacity)
+
+
+def aggregate_file_shards(
+    input_files: List[Path],
+    sentiment_words: SentimentLexicon,
+    lexicons: tuple,
+    workers: int,
+    word_capacity: int = None,
+) -> ReviewAggregates:
+    # NOTE: every worker parses, cleans, scores and filters whole files and
+    # returns their partial aggregates
+    stopwords, nouns = lexicons
+    return run_file_shards(
+        input_files, sentiment_words, stopwords, nouns, workers, word_capacity
+    )
+
+
+def aggregate_review_stream(
+    input_files: List[Path],
+    chunksize: int,
+    sentiment_words: SentimentLexicon,
+    lexicons: tuple,
+    word_capacity: int = None,
+) -> ReviewAggregates:
+    # NOTE: only one chunk and the merged aggregates are held in memory
+    stopwords, nouns = lexicons
+    chunks = load_files_chunks(input_files, chunksize)
+    return merge_all_aggregates(
+        aggregate_chunks(chunks, sentiment_words, stopwords, nouns, word_capacity)
+    )
+
+
+def sample_reviews(
+    input_files: List[Path], chunksize: int, sample_size: int
+) -> ReviewSample:
+    # NOTE: one pass over the chunks, only the reservoirs of every product and
+    # the current chunk are held in memory
+    chunks = load_files_chunks(input_files, chunksize)
+    return sample_reviews_per_product(chunks, sample_size)
+
+
+def get_sampled_reviews(review_sample: ReviewSample) -> pd.DataFrame:
+    return review_sample.df
+
+
+def log_sentiment_estimate(
+    review_sample: ReviewSample, sentiment_df: pd.DataFrame
+) -> pd.DataFrame:
+    overall_sentiment_df = estimate_overall_sentiment(review_sample, sentiment_df)
+    logging.info(f"Overall sentiment from text (preview):\n {overall_sentiment_df} \n")
+    return overall_sentiment_df
+
+
+def update_review_results(
+    df: pd.DataFrame, sentiment_words: SentimentLexicon, lexicons: tuple
+) -> pd.DataFrame:
+    # NOTE: only reviews missing from the store are cleaned and scored
+    stopwords, nouns = lexicons
+    store = load_review_store()
+    store, review_results_df, _ = update_review_store(
+        store, df, sentiment_words, stopwords, nouns
+    )
+    save_review_store(store)
+    logging.info(
+        f"Sentiment scores of each customers review:\n {review_results_df.head()} \n"
+    )
+    return review_results_df
+
+
+def aggregate_review_results(
+    review_results_df: pd.DataFrame, word_capacity: int = None
+) -> ReviewAggregates:
+    words = itertools.chain.from_iterable(filter(None, review_results_df.filtered))
+    word_counts = WordFrequencies.from_words(words, word_capacity)
+    return aggregate_reviews(review_results_df, review_results_df, word_counts)
+
+
+def get_product_term_matrix(
+    df: pd.DataFrame, filtered_store: TokenStore
+) -> CountMatrix:
+    return build_product_term_matrix(df.product_id, filtered_store)
+
+
+def get_product_term_matrix_from_results(
+    review_results_df: pd.DataFrame,
+) -> CountMatrix:
+    # NOTE: the stored reviews only keep their filtered words as lists
+    texts = [" ".join(words) if words else "" for words in review_results_df.filtered]
+    filtered_store = tokenize_text_values(
+        pd.DataFrame({"text": texts}, index=review_results_df.index)
+    )
+    return build_product_term_matrix(review_results_df.product_id, filtered_store)
 
+
+def reuse_aggregates(aggregates: ReviewAggregates) -> ReviewAggregates:
+    return aggregates
+
+
+def log_stats(title: str, get_stats, aggregates: ReviewAggregates) -> pd.DataFrame:
+    stats_df = get_stats(aggregates)
+    logging.info(f"{title}:\n {stats_df} \n")
+    return stats_df
+
+
+def log_near_duplicate_clusters(
+    clean_df: pd.DataFrame, near_duplicates: NearDuplicates
+) -> pd.DataFrame:
+    clusters_df = get_near_duplicate_clusters(clean_df, near_duplicates)
+    logging.info(f"Near duplicate reviews per cluster:\n {clusters_df} \n")
+    return clusters_df
+
+
+def export_review_results(review_results_df: pd.DataFrame) -> str:
+    # NOTE: rows are grouped by product, so reading one product only
+    # reads the row groups that contain it
+    df = review_results_df.astype({"product_id": "category"})
+    output_path = write_table(
+        df, get_output_path("export", "reviews"), sort_by="product_id"
+    )
+    logging.info(f"Exported {len(df)} review results to {output_path}")
+    return str(output_path)
+
+
+def export_aggregates(
+    product_stats_df: pd.DataFrame,
+    sentiment_per_product_df: pd.DataFrame,
+    average_rating_df: pd.DataFrame,
+    total_rating_df: pd.DataFrame,
+    overall_sentiment_df: pd.DataFrame,
+    top_ten_df: pd.DataFrame,
+) -> List[str]:
+    tables = {
+        "product_stats": product_stats_df.reset_index(),
+        "sentiment_per_product": sentiment_per_product_df,
+        "average_rating_per_product": average_rating_df,
+        "rating_distribution": total_rating_df,
+        "overall_sentiment": overall_sentiment_df,
+        "top_ten_words": top_ten_df,
+    }
+    output_paths = [
+        str(write_table(df, get_output_path("export", name)))
+        for name, df in tables.items()
+    ]
+    logging.info(f"Exported aggregates to {output_paths}")
+    return output_paths
+
+
+def write_stats_reports(
+    aggregates: ReviewAggregates,
+    product_stats_df: pd.DataFrame,
+    sentiment_per_product_df: pd.DataFrame,
+    average_rating_df: pd.DataFrame,
+    total_rating_df: pd.DataFrame,
+    overall_sentiment_df: pd.DataFrame,
+    top_ten_df: pd.DataFrame,
+) -> List[str]:
+    counts = aggregates.rating_counts.rename_axis(columns="rating").stack()
+    rating_per_product_df = counts[counts > 0].rename("count").reset_index()
+    reports = [
+        Report("product_stats", product_stats_df.reset_index()),
+        Report("average_rating_per_product", average_rating_df),
+        Report("overall_sentiment_from_text", overall_sentiment_df),
+        Report("rating_distribution", total_rating_df),
+        Report(
+            "rating_distribution_per_product",
+            rating_per_product_df,
+            group_by="product_id",
+        ),
+        Report("sentiment_from_text_per_product", sentiment_per_product_df),
+        Report("most_frequent_words", top_ten_df),
+    ]
+    output_paths = [str(output_path) for output_path in write_reports(reports)]
+    logging.info(f"Wrote {len(output_paths)} reports")
+    return output_paths
+
+
+def get_product_sentiment_plot_job(
+    aggregates: ReviewAggregates, product_id: str
+) -> PlotJob:
     # NOTE: PLOT: sentiment from text per product as pie chart
-    save_plot_sentiment_from_text_per_product(sentiment_df)
+    title = f"Sentiment from text for product: {product_id}"
+    output_path = get_output_path(
+        "plots", f"product_{product_id}_sentiment_from_text.png"
+    )
+    counts = get_sentiment_counts_from_aggregates(aggregates, product_id)
+    return PlotJob("pie", counts, output_path, title)
 
-    # NOTE: STATS: overall sentiment
-    overall_sentiment_df = get_overall_sentiment_from_text_df(sentiment_df)
-    logging.info(f"Overall sentiment from text:\n {overall_sentiment_df} \n")
 
+def get_overall_sentiment_plot_job(aggregates: ReviewAggregates) -> PlotJob:
     # NOTE: PLOT: overall sentiment from text as pie chart
     title = f"Overall sentiment from text"
     output_path = get_output_path("plots", "overall_sentiment_from_text.png")
-    plot_pie_chart(sentiment_df.encoded_score, output_path, title)
+    counts = get_sentiment_counts_from_aggregates(aggregates)
+    return PlotJob("pie", counts, output_path, title)
 
-    # NOTE: STATS: sentiment per product
-    grouped_sentiment = (
-        sentiment_df.groupby(["product_id", "encoded_score"])
-        .size()
-        .reset_index(name="counts")
-    )
-    logging.info(f"Sentiment from text per product:\n {grouped_sentiment} \n")
 
-    # TODO: USES INITIAL DF
-    # NOTE: STATS: avg rating per product
-    avg_rating_df = get_average_rating_per_id(df)
-    logging.info(f"Average rating per product:\n {avg_rating_df} \n")
+def get_sentiment_plot_jobs(aggregates: ReviewAggregates) -> List[PlotJob]:
+    plot_jobs = [
+        get_product_sentiment_plot_job(aggregates, product_id)
+        for product_id in aggregates.sentiment_counts.index
+    ]
+    plot_jobs.append(get_overall_sentiment_plot_job(aggregates))
+    return plot_jobs
 
-    # TODO: USES INITIAL DF
-    # NOTE: STATS: overall rating
-    total_rating_df = get_ratings_in_total(df)
-    logging.info(f"Overall rating distribution:\n {total_rating_df} \n")
 
-    # NOTE: PLOT: overall rating distribution and rating distribution per product
-    save_plot_overall_rating_distribution(total_rating_df)
-    save_plot_rating_distribution_per_product(df)
+def get_product_rating_plot_job(
+    aggregates: ReviewAggregates, product_id: str
+) -> PlotJob:
+    # NOTE: PLOT: rating distribution per product
+    subset_rating_distribution_df = get_ratings_in_total_from_aggregates(
+        aggregates, product_id
+    )
+    output_path = get_output_path(
+        "plots", f"product_{product_id}_rating_distribution.png"
+    )
+    config = {
+        "x_value": "rating",
+        "y_value": "count",
+        "x_label": "Ratings",
+        "y_label": "Count",
+        "title": f"Total ratings for product: {product_id}",
+    }
+    return PlotJob(
+        "histogram", subset_rating_distribution_df, output_path, config=config
+    )
+
 
-    # TODO: USES INITIAL DF
+def get_encoded_ratings_plot_job(total_rating_df: pd.DataFrame) -> PlotJob:
     # NOTE: PLOT: rating from positive to negative as pie chart
-    rating_encoded_df = encode_rating(df)
+    counts = total_rating_df.set_index("rating")["count"].rename(RATING_LABELS)
+    counts = counts.sort_values(ascending=False, kind="stable")
     title = f"Ratings from very positive to very negative"
     output_path = get_output_path("plots", f"total_ratings_encoded.png")
-    plot_pie_chart(rating_encoded_df.rating, output_path, title)
-
-    # TODO: USES INITIAL DF
-    # NOTE: PLOT: most common words histogram and wordcloud
-    stopwords, nouns = get_stopwords_and_nouns(nlp_resources_path)
-    filtered_text_df = get_filtered_text_df(df, stopwords, nouns)
-    words_list = clean_text_column(filtered_text_df, "text")
-    top_ten_df = get_top_ten_words_df_from_list(words_list)
-    logging.info(f"10 Most frequent words:\n {top_ten_df} \n")
+    return PlotJob("pie", counts, output_path, title)
+
+
+def get_rating_plot_jobs(
+    aggregates: ReviewAggregates, total_rating_df: pd.DataFrame
+) -> List[PlotJob]:
+    plot_jobs = [get_overall_rating_distribution_plot_job(total_rating_df)]
+    for product_id in aggregates.rating_counts.index:
+        plot_jobs.append(get_product_rating_plot_job(aggregates, product_id))
+    plot_jobs.append(get_encoded_ratings_plot_job(total_rating_df))
+    return plot_jobs
+
+
+def get_word_histogram_plot_job(top_ten_df: pd.DataFrame) -> PlotJob:
+    # NOTE: PLOT: most common words histogram
     config = {
         "x_value": "word",
         "y_value": "count",
@@ -173,103 +527,761 @@ def main():
         "title": "Most frequent words",
     }
     output_path = get_output_path("plots", "most_frequent_words.png")
-    plot_histogram(top_ten_df, config, output_path)
+    return PlotJob("histogram", top_ten_df, output_path, config=config)
+
+
+def get_wordcloud_plot_job(aggregates: ReviewAggregates) -> PlotJob:
+    # NOTE: PLOT: most common words wordcloud
+    frequencies = dict(aggregates.word_counts.most_common(WORDCLOUD_WORDS))
     output_path = get_output_path("plots", "wordcloud_frequent_words.png")
-    plot_wordcloud(words_list, output_path)
+    return PlotJob("wordcloud", frequencies, output_path)
 
 
-def multiprocessed_main():
-    input_filename = get_input_file("resources/dataset", "bonprix.csv")
-    df = load_data(input_filename)
-    df = clean_text_values(df)
-    logging.info(f"Initial customer data:\n {df.head()} \n")
-    nlp_resources_path = "resources/nlp_resources"
-    path_sentiment_words = get_input_file(
-        nlp_resources_path, "complete_sentiment_words.json"
+def get_product_terms_plot_job(
+    distinctive_terms_df: pd.DataFrame, product_id: str
+) -> PlotJob:
+    # NOTE: PLOT: distinctive words per product histogram
+    config = {
+        "x_value": "word",
+        "y_value": "log_odds",
+        "x_label": "Word",
+        "y_label": "Log odds z-score",
+        "title": f"Distinctive words for product: {product_id}",
+    }
+    product_terms_df = distinctive_terms_df[
+        distinctive_terms_df.product_id == product_id
+    ]
+    output_path = get_output_path(
+        "plots", f"product_{product_id}_distinctive_words.png"
     )
-    sentiment_words = load_sentiment_words(path_sentiment_words)
-    stopwords, nouns = get_stopwords_and_nouns(nlp_resources_path)
+    return PlotJob("histogram", product_terms_df, output_path, config=config)
 
-    workers = multiprocessing.cpu_count()
-    with Executor(max_workers=workers) as exe:
-        jobs = [
-            # 0 returns sentiment df
-            exe.submit(get_sentiment_from_text_df, df, sentiment_words),
-            # 1 returns avg_rating_df
-            exe.submit(get_average_rating_per_id, df),
-            # 2 returns total rating df
-            exe.submit(get_ratings_in_total, df),
-            # 3 returns rating encoded df
-            exe.submit(encode_rating, df),
-            # 4 returns filtered text df
-            exe.submit(get_filtered_text_df, df, stopwords, nouns),
+
+def get_product_wordcloud_plot_job(
+    product_term_matrix: CountMatrix, product_id: str
+) -> PlotJob:
+    # NOTE: PLOT: most common words per product wordcloud
+    counts = product_term_matrix.row(product_id)
+    counts = counts.sort_values(ascending=False, kind="stable")
+    frequencies = {
+        word: int(count) for word, count in counts.head(WORDCLOUD_WORDS).items()
+    }
+    output_path = get_output_path("plots", f"product_{product_id}_wordcloud.png")
+    return PlotJob("wordcloud", frequencies, output_path)
+
+
+def get_term_plot_jobs(
+    product_term_matrix: CountMatrix, distinctive_terms_df: pd.DataFrame
+) -> List[PlotJob]:
+    plot_jobs = []
+    for product_id in product_term_matrix.rows:
+        plot_jobs.append(get_product_terms_plot_job(distinctive_terms_df, product_id))
+        plot_jobs.append(
+            get_product_wordcloud_plot_job(product_term_matrix, product_id)
+        )
+    return plot_jobs
+
+
+def get_word_plot_jobs(
+    aggregates: ReviewAggregates, top_ten_df: pd.DataFrame
+) -> List[PlotJob]:
+    return [
+        get_word_histogram_plot_job(top_ten_df),
+        get_wordcloud_plot_job(aggregates),
+    ]
+
+
+# NOTE: the charts the query service renders on request
+PRODUCT_CHARTS = {
+    "sentiment": get_product_sentiment_plot_job,
+    "ratings": get_product_rating_plot_job,
+}
+GLOBAL_CHARTS = {
+    "sentiment": get_overall_sentiment_plot_job,
+    "ratings": lambda aggregates: get_overall_rating_distribution_plot_job(
+        get_ratings_in_total_from_aggregates(aggregates)
+    ),
+    "ratings_encoded": lambda aggregates: get_encoded_ratings_plot_job(
+        get_ratings_in_total_from_aggregates(aggregates)
+    ),
+    "words": lambda aggregates: get_word_histogram_plot_job(
+        get_top_ten_words_df_from_aggregates(aggregates)
+    ),
+    "wordcloud": get_wordcloud_plot_job,
+}
+
+
+# NOTE: every stage names the outputs it reads, a run only executes the
+# stages the requested outputs depend on
+STAGES = {
+    "df": Stage(load_data_files, ("input_files",)),
+    "sentiment_words": Stage(
+        get_sentiment_words,
+        ("nlp_resources_path", "rebuild_lexicon_cache", "compound_matching"),
+    ),
+    "lexicons": Stage(
+        get_stopwords_and_nouns,
+        ("nlp_resources_path", "rebuild_lexicon_cache", "compound_matching"),
+    ),
+    "clean_df": Stage(clean_reviews, ("df",)),
+    "token_store": Stage(tokenize_text_values, ("clean_df",)),
+    "sentiment_df": Stage(
+        score_clean_reviews, ("clean_df", "sentiment_words", "token_store")
+    ),
+    "filtered_store": Stage(filter_reviews, ("token_store", "lexicons")),
+    "near_duplicates": Stage(
+        find_near_duplicate_reviews, ("clean_df", "near_duplicate_threshold")
+    ),
+    "word_counts": Stage(count_words, ("filtered_store", "word_capacity")),
+    "aggregates": Stage(aggregate_reviews, ("clean_df", "sentiment_df", "word_counts")),
+    "rating_aggregates": Stage(aggregate_ratings, ("df",)),
+    # NOTE: STATS: review count, mean rating, rating and sentiment counts
+    "product_stats": Stage(
+        functools.partial(
+            log_stats, "Statistics per product", get_product_stats_from_aggregates
+        ),
+        ("aggregates",),
+    ),
+    "overall_sentiment": Stage(
+        functools.partial(
+            log_stats,
+            "Overall sentiment from text",
+            get_overall_sentiment_from_aggregates,
+        ),
+        ("aggregates",),
+    ),
+    "sentiment_per_product": Stage(
+        functools.partial(
+            log_stats,
+            "Sentiment from text per product",
+            get_sentiment_per_product_from_aggregates,
+        ),
+        ("aggregates",),
+    ),
+    "average_rating": Stage(
+        functools.partial(
+            log_stats,
+            "Average rating per product",
+            get_average_rating_per_id_from_aggregates,
+        ),
+        ("rating_aggregates",),
+    ),
+    "rating_distribution": Stage(
+        functools.partial(
+            log_stats,
+            "Overall rating distribution",
+            get_ratings_in_total_from_aggregates,
+        ),
+        ("rating_aggregates",),
+    ),
+    "top_ten_words": Stage(
+        functools.partial(
+            log_stats, "10 Most frequent words", get_top_ten_words_df_from_aggregates
+        ),
+        ("aggregates",),
+    ),
+    "sentiment_plots": Stage(get_sentiment_plot_jobs, ("aggregates",)),
+    "rating_plots": Stage(
+        get_rating_plot_jobs, ("rating_aggregates", "rating_distribution")
+    ),
+    "word_plots": Stage(get_word_plot_jobs, ("aggregates", "top_ten_words")),
+    # NOTE: STATS: clusters of reviews copied with small edits per product
+    "near_duplicate_clusters": Stage(
+        log_near_duplicate_clusters, ("clean_df", "near_duplicates")
+    ),
+    "review_results": Stage(
+        get_review_results, ("clean_df", "sentiment_df", "filtered_store")
+    ),
+    "product_term_matrix": Stage(
+        get_product_term_matrix, ("clean_df", "filtered_store")
+    ),
+    # NOTE: STATS: most frequent and most distinctive nouns per product
+    "top_terms_per_product": Stage(
+        functools.partial(log_stats, "Top words per product", get_top_terms),
+        ("product_term_matrix",),
+    ),
+    "distinctive_terms_per_product": Stage(
+        functools.partial(
+            log_stats, "Distinctive words per product", get_distinctive_terms
+        ),
+        ("product_term_matrix",),
+    ),
+    "term_plots": Stage(
+        get_term_plot_jobs, ("product_term_matrix", "distinctive_terms_per_product")
+    ),
+    "review_export": Stage(export_review_results, ("review_results",)),
+    "aggregate_export": Stage(
+        export_aggregates,
+        (
+            "product_stats",
+            "sentiment_per_product",
+            "average_rating",
+            "rating_distribution",
+            "overall_sentiment",
+            "top_ten_words",
+        ),
+    ),
+    "reports": Stage(
+        write_stats_reports,
+        (
+            "rating_aggregates",
+            "product_stats",
+            "sentiment_per_product",
+            "average_rating",
+            "rating_distribution",
+            "overall_sentiment",
+            "top_ten_words",
+        ),
+    ),
+}
+
+# NOTE: the modes only differ in how the aggregates are computed
+MODE_STAGES = {
+    "sequential": {},
+    "multiprocessed": {
+        "aggregates": Stage(
+            aggregate_shards,
+            ("df", "sentiment_words", "lexicons", "workers", "word_capacity"),
+        ),
+    },
+    "streaming": {
+        "aggregates": Stage(
+            aggregate_review_stream,
+            (
+                "input_files",
+                "chunksize",
+                "sentiment_words",
+                "lexicons",
+                "word_capacity",
+            ),
+        ),
+        "rating_aggregates": Stage(reuse_aggregates, ("aggregates",)),
+    },
+    "shards": {
+        "aggregates": Stage(
+            aggregate_file_shards,
+            ("input_files", "sentiment_words", "lexicons", "workers", "word_capacity"),
+        ),
+        "rating_aggregates": Stage(reuse_aggregates, ("aggregates",)),
+    },
+    # NOTE: every distinct text is cleaned, tokenized, scored and filtered
+    # once, the results are fanned out to its rows by the text codes
+    "deduplicated": {
+        "unique_texts": Stage(factorize_texts, ("df",)),
+        "unique_clean_df": Stage(clean_unique_texts, ("unique_texts",)),
+        "unique_token_store": Stage(
+            tokenize_unique_texts, ("unique_clean_df", "unique_texts")
+        ),
+        "clean_df": Stage(
+            fan_out_clean_reviews, ("df", "unique_clean_df", "unique_texts")
+        ),
+        "token_store": Stage(
+            expand_token_store, ("unique_token_store", "unique_texts")
+        ),
+        "sentiment_df": Stage(
+            score_unique_reviews,
+            (
+                "unique_clean_df",
+                "sentiment_words",
+                "unique_token_store",
+                "unique_texts",
+            ),
+        ),
+        "filtered_store": Stage(
+            filter_unique_reviews, ("unique_token_store", "lexicons", "unique_texts")
+        ),
+    },
+    # NOTE: the loaded reviews are a sample of every product, cleaning and
+    # scoring only run on the sample, the estimates carry confidence intervals
+    "preview": {
+        "review_sample": Stage(
+            sample_reviews, ("input_files", "chunksize", "sample_size")
+        ),
+        "df": Stage(get_sampled_reviews, ("review_sample",)),
+        "overall_sentiment": Stage(
+            log_sentiment_estimate, ("review_sample", "sentiment_df")
+        ),
+        "average_rating": Stage(
+            functools.partial(
+                log_stats,
+                "Average rating per product (preview)",
+                estimate_average_rating_per_id,
+            ),
+            ("review_sample",),
+        ),
+        "rating_distribution": Stage(
+            functools.partial(
+                log_stats,
+                "Overall rating distribution (preview)",
+                estimate_ratings_in_total,
+            ),
+            ("review_sample",),
+        ),
+    },
+    "incremental": {
+        "review_results": Stage(
+            update_review_results, ("df", "sentiment_words", "lexicons")
+        ),
+        "aggregates": Stage(
+            aggregate_review_results, ("review_results", "word_capacity")
+        ),
+        "product_term_matrix": Stage(
+            get_product_term_matrix_from_results, ("review_results",)
+        ),
+    },
+}
+
+# NOTE: near duplicates are found on the cleaned texts of all loaded reviews,
+# every later stage, including the stages of the mode, only sees the first
+# review of each cluster
+COLLAPSE_STAGES = {
+    "loaded_df": Stage(load_data_files, ("input_files",)),
+    "loaded_clean_df": Stage(clean_reviews, ("loaded_df",)),
+    "near_duplicates": Stage(
+        find_near_duplicate_reviews, ("loaded_clean_df", "near_duplicate_threshold")
+    ),
+    "near_duplicate_clusters": Stage(
+        log_near_duplicate_clusters, ("loaded_clean_df", "near_duplicates")
+    ),
+    "df": Stage(drop_near_duplicates, ("loaded_df", "near_duplicates")),
+    "clean_df": Stage(drop_near_duplicates, ("loaded_clean_df", "near_duplicates")),
+}
+
+STATS_OUTPUTS = [
+    "product_stats",
+    "overall_sentiment",
+    "sentiment_per_product",
+    "average_rating",
+    "rating_distribution",
+    "top_ten_words",
+]
+TERM_OUTPUTS = ["top_terms_per_product", "distinctive_terms_per_product"]
+DUPLICATE_OUTPUTS = ["near_duplicate_clusters"]
+PLOT_OUTPUTS = ["sentiment_plots", "rating_plots", "word_plots", "term_plots"]
+EXPORT_OUTPUTS = ["review_export", "aggregate_export", "reports"]
+OUTPUTS = (
+    STATS_OUTPUTS + TERM_OUTPUTS + DUPLICATE_OUTPUTS + PLOT_OUTPUTS + EXPORT_OUTPUTS
+)
+# NOTE: the multiprocessed, streaming and shards modes never hold the
+# per-review results, they only export them, count terms per product or find
+# near duplicates if requested explicitly
+PER_REVIEW_OUTPUTS = ["review_export", "term_plots", *TERM_OUTPUTS, *DUPLICATE_OUTPUTS]
+AGGREGATE_OUTPUTS = [output for output in OUTPUTS if output not in PER_REVIEW_OUTPUTS]
+# NOTE: every other output would be computed on the sample as if it were all
+# reviews
+PREVIEW_OUTPUTS = ["overall_sentiment", "average_rating", "rating_distribution"]
+DEFAULT_OUTPUTS = {
+    "sequential": OUTPUTS,
+    "multiprocessed": AGGREGATE_OUTPUTS,
+    "streaming": AGGREGATE_OUTPUTS,
+    "shards": AGGREGATE_OUTPUTS,
+    "deduplicated": OUTPUTS,
+    "preview": PREVIEW_OUTPUTS,
+    "incremental": OUTPUTS,
+}
+# NOTE: the outputs of each command line command, "all" runs every default
+# output of the mode
+COMMAND_OUTPUTS = {
+    "stats": STATS_OUTPUTS + TERM_OUTPUTS + DUPLICATE_OUTPUTS,
+    "plots": PLOT_OUTPUTS,
+    "export": EXPORT_OUTPUTS,
+    "all": OUTPUTS,
+}
+
+
+def run_pipeline(
+    mode: str,
+    targets: Sequence[str] = None,
+    rebuild_lexicon_cache: bool = False,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    workers: int = 1,
+    word_capacity: int = None,
+    compound_matching: bool = False,
+    near_duplicate_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    collapse_near_duplicates: bool = False,
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    input_files: Sequence[Path] = None,
+    threads: int = 1,
+) -> Dict[str, object]:
+    targets = targets or DEFAULT_OUTPUTS[mode]
+    stages = {**STAGES, **MODE_STAGES[mode]}
+    if mode == "preview":
+        unsupported = [
+            target
+            for target in targets
+            if target in OUTPUTS and target not in PREVIEW_OUTPUTS
         ]
-        results = [job.result() for job in jobs]
+        if unsupported:
+            raise ValueError(f"Outputs not estimated in preview mode: {unsupported}")
+    if collapse_near_duplicates:
+        if mode in ("streaming", "shards", "preview"):
+            # NOTE: neither a chunk, a file nor a sample holds the copies of a
+            # review
+            raise ValueError(f"Near duplicates can not be collapsed in {mode} mode")
+        stages.update(COLLAPSE_STAGES)
+    # NOTE: independent stages, e.g. loading the lexicons and the dataset,
+    # run in threads of the executor, the stages themselves stay unchanged,
+    # workers only sizes the process pools
+    executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+    pipeline = Pipeline(
+        stages,
+        executor,
+        input_files=list(input_files or [DEFAULT_INPUT_FILE]),
+        nlp_resources_path="resources/nlp_resources",
+        rebuild_lexicon_cache=rebuild_lexicon_cache,
+        chunksize=chunksize,
+        workers=workers,
+        word_capacity=word_capacity,
+        compound_matching=compound_matching,
+        near_duplicate_threshold=near_duplicate_threshold,
+        sample_size=sample_size,
+    )
+    try:
+        results = pipeline.run(targets)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-    sentiment_df = results[0]
-    logging.info(
-        f"Sentiment scores of each customers review:\n {sentiment_df.head()} \n"
+    # NOTE: the charts of all requested plot outputs are rendered in one batch
+    # in the main thread, pyplot is not thread safe
+    plot_jobs = [
+        job for target in targets if target in PLOT_OUTPUTS for job in results[target]
+    ]
+    if plot_jobs:
+        render_plots(plot_jobs, workers)
+    return results
+
+
+def main(
+    rebuild_lexicon_cache: bool = False,
+    targets: Sequence[str] = None,
+    word_capacity: int = None,
+    compound_matching: bool = False,
+):
+    return run_pipeline(
+        "sequential",
+        targets,
+        rebuild_lexicon_cache,
+        word_capacity=word_capacity,
+        compound_matching=compound_matching,
     )
 
-    # NOTE: PLOT: sentiment from text per product as pie chart
-    save_plot_sentiment_from_text_per_product(sentiment_df)
 
-    # NOTE: STATS: overall sentiment
-    overall_sentiment_df = get_overall_sentiment_from_text_df(sentiment_df)
-    logging.info(f"Overall sentiment from text:\n {overall_sentiment_df} \n")
+def multiprocessed_main(
+    rebuild_lexicon_cache: bool = False,
+    targets: Sequence[str] = None,
+    word_capacity: int = None,
+    compound_matching: bool = False,
+):
+    workers = multiprocessing.cpu_count()
+    return run_pipeline(
+        "multiprocessed",
+        targets,
+        rebuild_lexicon_cache,
+        workers=workers,
+        word_capacity=word_capacity,
+        compound_matching=compound_matching,
+    )
 
-    # NOTE: PLOT: overall sentiment from text as pie chart
-    title = f"Overall sentiment from text"
-    output_path = get_output_path("plots", "overall_sentiment_from_text.png")
-    plot_pie_chart(sentiment_df.encoded_score, output_path, title)
 
-    # NOTE: STATS: sentiment per product
-    grouped_sentiment = (
-        sentiment_df.groupby(["product_id", "encoded_score"])
-        .size()
-        .reset_index(name="counts")
+def streaming_main(
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    rebuild_lexicon_cache: bool = False,
+    targets: Sequence[str] = None,
+    word_capacity: int = None,
+    compound_matching: bool = False,
+):
+    return run_pipeline(
+        "streaming",
+        targets,
+        rebuild_lexicon_cache,
+        chunksize,
+        word_capacity=word_capacity,
+        compound_matching=compound_matching,
     )
-    logging.info(f"Sentiment from text per product:\n {grouped_sentiment} \n")
 
-    avg_rating_df = results[1]
-    logging.info(f"Average rating per product:\n {avg_rating_df} \n")
 
-    total_rating_df = results[2]
-    logging.info(f"Overall rating distribution:\n {total_rating_df} \n")
-    save_plot_overall_rating_distribution(total_rating_df)
-    save_plot_rating_distribution_per_product(df)
+def incremental_main(
+    rebuild_lexicon_cache: bool = False,
+    targets: Sequence[str] = None,
+    word_capacity: int = None,
+    compound_matching: bool = False,
+):
+    return run_pipeline(
+        "incremental",
+        targets,
+        rebuild_lexicon_cache,
+        word_capacity=word_capacity,
+        compound_matching=compound_matching,
+    )
 
-    rating_encoded_df = results[3]
-    title = f"Ratings from very positive to very negative"
-    output_path = get_output_path("plots", f"total_ratings_encoded.png")
-    plot_pie_chart(rating_encoded_df.rating, output_path, title)
 
-    filtered_text_df = results[4]
-    words_list = clean_text_column(filtered_text_df, "text")
-    top_ten_df = get_top_ten_words_df_from_list(words_list)
-    logging.info(f"10 Most frequent words:\n {top_ten_df} \n")
-    config = {
-        "x_value": "word",
-        "y_value": "count",
-        "x_label": "Word",
-        "y_label": "Count",
-        "title": "Most frequent words",
+def serve(
+    address: Address = (DEFAULT_HOST, DEFAULT_PORT),
+    chart_cache_size: int = DEFAULT_CHART_CACHE_SIZE,
+    rebuild_lexicon_cache: bool = False,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    word_capacity: int = None,
+    compound_matching: bool = False,
+    input_file: Path = DEFAULT_INPUT_FILE,
+):
+    # NOTE: the lexicons and the dataset are loaded once, queries are answered
+    # from the aggregates in memory until POST /reload reads new csv rows
+    results = run_pipeline(
+        "sequential",
+        ["input_files", "sentiment_words", "lexicons"],
+        rebuild_lexicon_cache,
+        compound_matching=compound_matching,
+        input_files=[input_file],
+    )
+    stopwords, nouns = results["lexicons"]
+    index = ReviewIndex(
+        results["input_files"][0],
+        results["sentiment_words"],
+        stopwords,
+        nouns,
+        PRODUCT_CHARTS,
+        GLOBAL_CHARTS,
+        chart_cache_size,
+        word_capacity,
+        chunksize,
+    )
+    server = create_server(index, address)
+    logging.info(f"Serving review queries on {address}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def get_targets(command: str, mode: str, outputs: Sequence[str] = None) -> List[str]:
+    if outputs:
+        return list(outputs)
+    return [
+        output for output in COMMAND_OUTPUTS[command] if output in DEFAULT_OUTPUTS[mode]
+    ]
+
+
+def get_default_workers(mode: str) -> int:
+    # NOTE: worker processes of the aggregates, the charts are rendered in
+    # process unless --workers is given
+    if mode in ("multiprocessed", "shards"):
+        return multiprocessing.cpu_count()
+    return 1
+
+
+def get_argument_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--rebuild-lexicon-cache",
+        action="store_true",
+        help="recompile the binary lexicon cache from the nlp resources",
+    )
+    common.add_argument(
+        "--chunksize",
+        type=int,
+        default=DEFAULT_CHUNKSIZE,
+        help="reviews per chunk in streaming mode and when serving",
+    )
+    common.add_argument(
+        "--word-capacity",
+        type=int,
+        help="only count the most frequent words, bounds the memory of the "
+        "word counts at the cost of overestimated counts",
+    )
+    common.add_argument(
+        "--compounds",
+        action="store_true",
+        help="also score and filter compounds by the lexicon word they end "
+        "in, e.g. qualitaetsmangel by mangel",
+    )
+    common.add_argument(
+        "--events",
+        help="write a json event with timings, rows and memory per service call "
+        "and stage to this file",
+    )
+    common.add_argument(
+        "--profile-stage",
+        help="run this service function under cProfile, e.g. clean_text_values",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="statistics, plots and exports of the bonprix reviews"
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+    command_help = {
+        "stats": "log the statistics, never imports the plotting libraries",
+        "plots": "render the charts to out/plots",
+        "export": "write the columnar tables and the markdown and csv reports",
+        "all": "compute every output of the mode",
     }
-    output_path = get_output_path("plots", "most_frequent_words.png")
-    plot_histogram(top_ten_df, config, output_path)
-    output_path = get_output_path("plots", "wordcloud_frequent_words.png")
-    plot_wordcloud(words_list, output_path)
+    for command, help_text in command_help.items():
+        command_parser = commands.add_parser(command, parents=[common], help=help_text)
+        command_parser.add_argument(
+            "--mode",
+            choices=list(MODE_STAGES),
+            default="sequential",
+            help="how the aggregates are computed, streaming bounds the memory "
+            "by the chunksize, shards processes every input file on a worker, "
+            "deduplicated processes every distinct text once, preview "
+            "estimates the average ratings, the rating distribution and the "
+            "overall sentiment from a sample per product, incremental only "
+            "scores new reviews",
+        )
+        command_parser.add_argument(
+            "--workers",
+            type=int,
+            help="worker processes in multiprocessed and shards mode and for "
+            "rendering the charts, defaults to the cpu count in multiprocessed "
+            "and shards mode and 1 otherwise",
+        )
+        command_parser.add_argument(
+            "--threads",
+            type=int,
+            default=1,
+            help="threads that run independent stages, e.g. loading the "
+            "lexicons and the dataset",
+        )
+        command_parser.add_argument(
+            "--input",
+            help="csv file, folder of csv files or glob of csv shards like "
+            "'exports/*.csv', a review in several shards is counted once, "
+            "defaults to resources/dataset/bonprix.csv",
+        )
+        command_parser.add_argument(
+            "--near-duplicate-threshold",
+            type=float,
+            default=DEFAULT_SIMILARITY_THRESHOLD,
+            help="estimated jaccard similarity of the character shingles at "
+            "which two reviews of a product are near duplicates",
+        )
+        command_parser.add_argument(
+            "--collapse-near-duplicates",
+            action="store_true",
+            help="only keep the first review of each near duplicate cluster "
+            "for all aggregates, plots and exports, not in streaming mode",
+        )
+        command_parser.add_argument(
+            "--sample-size",
+            type=int,
+            default=DEFAULT_SAMPLE_SIZE,
+            help="reviews sampled per product in preview mode, products with "
+            "fewer reviews are covered completely",
+        )
+        command_parser.add_argument(
+            "--outputs",
+            nargs="+",
+            choices=COMMAND_OUTPUTS[command],
+            help="only compute these outputs and the stages they depend on",
+        )
+        command_parser.add_argument(
+            "--compare-sequential",
+            action="store_true",
+            help="also run the sequential mode first and log the speedup of "
+            "the mode against it, e.g. of the sharded multiprocessed mode",
+        )
 
+    serve_parser = commands.add_parser(
+        "serve",
+        parents=[common],
+        help="keep the aggregates in memory and answer queries over http, "
+        "see services.serving for the endpoints",
+    )
+    serve_parser.add_argument("--host", default=DEFAULT_HOST, help="host to serve on")
+    serve_parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT, help="port to serve on"
+    )
+    serve_parser.add_argument(
+        "--socket", help="serve on this unix socket instead of host and port"
+    )
+    serve_parser.add_argument(
+        "--chart-cache-size",
+        type=int,
+        default=DEFAULT_CHART_CACHE_SIZE,
+        help="rendered charts the service keeps in memory",
+    )
+    serve_parser.add_argument(
+        "--input",
+        type=Path,
+        default=DEFAULT_INPUT_FILE,
+        help="csv file the service reads and reloads new rows from, defaults "
+        "to resources/dataset/bonprix.csv",
+    )
+    return parser
 
-if __name__ == "__main__":
-    import time
 
-    start = time.time()
-    main()
-    duration = time.time() - start
-    logging.info(f"execution time of sequential main {duration} in seconds")
+def cli(argv: Sequence[str] = None) -> Dict[str, object]:
+    args = get_argument_parser().parse_args(argv)
+    instantiate_logger()
+    if args.events or args.profile_stage:
+        sink = write_events_to(args.events) if args.events else None
+        enable_instrumentation(sink, args.profile_stage)
+
+    # NOTE: the charts are rendered without a display, the backend is picked
+    # here and not by the plotting services, which may run in an interactive
+    # session; the stats path never imports matplotlib
+    if args.command == "serve":
+        init_plot_worker()
+        return serve(
+            args.socket or (args.host, args.port),
+            args.chart_cache_size,
+            args.rebuild_lexicon_cache,
+            args.chunksize,
+            args.word_capacity,
+            args.compounds,
+            args.input,
+        )
+
+    targets = get_targets(args.command, args.mode, args.outputs)
+    input_files = get_input_files(args.input) if args.input else None
+    if any(target in PLOT_OUTPUTS for target in targets):
+        init_plot_worker()
+    if args.compare_sequential:
+        start = time.time()
+        run_pipeline(
+            "sequential",
+            targets,
+            args.rebuild_lexicon_cache,
+            args.chunksize,
+            1,
+            args.word_capacity,
+            args.compounds,
+            args.near_duplicate_threshold,
+            args.collapse_near_duplicates,
+            args.sample_size,
+            input_files,
+        )
+        sequential_duration = time.time() - start
+        logging.info(
+            f"execution time of sequential {args.command} {sequential_duration} "
+            "in seconds"
+        )
 
     start = time.time()
-    multiprocessed_main()
+    results = run_pipeline(
+        args.mode,
+        targets,
+        args.rebuild_lexicon_cache and not args.compare_sequential,
+        args.chunksize,
+        args.workers or get_default_workers(args.mode),
+        args.word_capacity,
+        args.compounds,
+        args.near_duplicate_threshold,
+        args.collapse_near_duplicates,
+        args.sample_size,
+        input_files,
+        args.threads,
+    )
     duration = time.time() - start
-    logging.info(f"execution time of multiprocessed main {duration} in seconds")
+    logging.info(f"execution time of {args.mode} {args.command} {duration} in seconds")
+    if args.compare_sequential:
+        logging.info(
+            f"parallel speedup of {args.mode} {args.command} "
+            f"{sequential_duration / duration}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,219 @@
+# standard library imports
+import functools
+from typing import Iterable, Iterator, NamedTuple
+
+# third party imports
+import pandas as pd
+
+# local services imports
+from services.cleaning import clean_text_values
+from services.instrumentation import instrumented
+from services.lexicon import Lexicon
+from services.transformation import (
+    SentimentWords,
+    WordFrequencies,
+    count_words,
+    filter_token_store,
+    get_sentiment_from_text_df,
+    tokenize_text_values,
+)
+
+# NOTE: groupby drops missing keys, a review without a rating is counted under
+# this rating so that it still counts toward its sentiment
+MISSING_RATING = -1
+
+
+class ReviewAggregates(NamedTuple):
+    """Mergeable partial aggregates of a set of reviews
+    :param rating_counts: rated reviews per product_id (rows) and rating
+        (columns)
+    :param sentiment_counts: all reviews per product_id (rows) and encoded
+        sentiment (columns)
+    :param word_counts: counts of the filtered words
+    """
+
+    rating_counts: pd.DataFrame
+    sentiment_counts: pd.DataFrame
+    word_counts: WordFrequencies
+
+
+def sum_counts_per_product(counts: pd.Series, level: str) -> pd.DataFrame:
+    counts = counts.groupby(level=["product_id", level]).sum()
+    counts = counts.unstack(fill_value=0)
+    counts.columns.name = None
+    return counts
+
+
+@instrumented
+def aggregate_reviews(
+    df: pd.DataFrame, sentiment_df: pd.DataFrame, word_counts: WordFrequencies
+) -> ReviewAggregates:
+    reviews_df = pd.DataFrame(
+        {
+            "product_id": df.product_id.to_numpy(),
+            "rating": df.rating.fillna(MISSING_RATING).to_numpy(),
+            "encoded_score": sentiment_df.encoded_score.to_numpy(),
+        }
+    )
+    # NOTE: a single groupby pass over the reviews, both count tables are
+    # sums over the levels of its result, which has at most one row per
+    # product, rating and sentiment
+    counts = reviews_df.groupby(["product_id", "rating", "encoded_score"]).size()
+    rating_counts = sum_counts_per_product(counts, "rating")
+    return ReviewAggregates(
+        rating_counts=rating_counts.drop(columns=MISSING_RATING, errors="ignore"),
+        sentiment_counts=sum_counts_per_product(counts, "encoded_score"),
+        word_counts=word_counts,
+    )
+
+
+@instrumented
+def aggregate_ratings(df: pd.DataFrame) -> ReviewAggregates:
+    # NOTE: rating stats read neither the texts nor the sentiment scores, so
+    # they do not have to wait for cleaning and scoring
+    reviews_df = pd.DataFrame(
+        {"product_id": df.product_id.to_numpy(), "rating": df.rating.to_numpy()}
+    )
+    counts = reviews_df.groupby(["product_id", "rating"]).size()
+    return empty_aggregates()._replace(
+        rating_counts=sum_counts_per_product(counts, "rating")
+    )
+
+
+def add_counts(left: pd.DataFrame, right: pd.DataFrame) -> pd.DataFrame:
+    # NOTE: the columns of an empty table would turn int8 ratings into int64
+    if len(left.columns) == 0:
+        return right
+    counts = left.add(right, fill_value=0).fillna(0).astype("int64")
+    counts = counts.reindex(counts.columns.sort_values(), axis=1)
+    counts.index.name = "product_id"
+    return counts
+
+
+def merge_aggregates(
+    left: ReviewAggregates, right: ReviewAggregates
+) -> ReviewAggregates:
+    return ReviewAggregates(
+        rating_counts=add_counts(left.rating_counts, right.rating_counts),
+        sentiment_counts=add_counts(left.sentiment_counts, right.sentiment_counts),
+        # NOTE: the merge keeps the words of left first, so ties in
+        # most_common still come out in order of first occurrence
+        word_counts=left.word_counts.merge(right.word_counts),
+    )
+
+
+def empty_aggregates() -> ReviewAggregates:
+    empty_counts = pd.DataFrame(index=pd.Index([], name="product_id", dtype=object))
+    return ReviewAggregates(empty_counts, empty_counts, WordFrequencies())
+
+
+@instrumented
+def merge_all_aggregates(aggregates: Iterable[ReviewAggregates]) -> ReviewAggregates:
+    return functools.reduce(merge_aggregates, aggregates, empty_aggregates())
+
+
+def aggregate_chunks(
+    chunks: Iterable[pd.DataFrame],
+    sentiment_words: SentimentWords,
+    stopwords: Lexicon,
+    nouns: Lexicon,
+    word_capacity: int = None,
+) -> Iterator[ReviewAggregates]:
+    for chunk in chunks:
+        chunk = clean_text_values(chunk)
+        token_store = tokenize_text_values(chunk)
+        sentiment_df = get_sentiment_from_text_df(chunk, sentiment_words, token_store)
+        filtered_store = filter_token_store(token_store, stopwords, nouns)
+        word_counts = count_words(filtered_store, word_capacity)
+        yield aggregate_reviews(chunk, sentiment_df, word_counts)
+
+
+@instrumented
+def get_product_stats_from_aggregates(aggregates: ReviewAggregates) -> pd.DataFrame:
+    rating_counts = aggregates.rating_counts
+    # NOTE: every review has a sentiment, the mean only covers rated reviews,
+    # a product may have no rated review at all
+    if len(aggregates.sentiment_counts.columns):
+        review_count = aggregates.sentiment_counts.sum(axis=1)
+        rating_counts = rating_counts.reindex(review_count.index, fill_value=0)
+    else:
+        review_count = rating_counts.sum(axis=1)
+    rated_count = rating_counts.sum(axis=1)
+    rating_sums = (rating_counts * rating_counts.columns.to_numpy()).sum(axis=1)
+    product_stats_df = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "review_count": review_count,
+                    "mean_rating": rating_sums / rated_count,
+                }
+            ),
+            rating_counts.rename(columns=lambda rating: f"rating_{rating}"),
+            aggregates.sentiment_counts,
+        ],
+        axis=1,
+    )
+    return product_stats_df
+
+
+def get_average_rating_per_id_from_aggregates(
+    aggregates: ReviewAggregates,
+) -> pd.DataFrame:
+    product_stats_df = get_product_stats_from_aggregates(aggregates)
+    avg_rating_per_id = round(product_stats_df.mean_rating, 2)
+    avg_rating_df = pd.DataFrame(
+        {"article": avg_rating_per_id.index, "rating": avg_rating_per_id.to_numpy()}
+    )
+    return avg_rating_df
+
+
+def get_ratings_in_total_from_aggregates(
+    aggregates: ReviewAggregates, product_id: str = None
+) -> pd.DataFrame:
+    rating_counts = aggregates.rating_counts
+    if product_id is None:
+        counts = rating_counts.sum(axis=0)
+    else:
+        counts = rating_counts.loc[product_id]
+    counts = counts[counts > 0]
+    total_ratings_df = pd.DataFrame(
+        {"rating": counts.index.to_numpy(), "count": counts.to_numpy()}
+    )
+    return total_ratings_df
+
+
+def get_sentiment_counts_from_aggregates(
+    aggregates: ReviewAggregates, product_id: str = None
+) -> pd.Series:
+    sentiment_counts = aggregates.sentiment_counts
+    if product_id is None:
+        counts = sentiment_counts.sum(axis=0)
+    else:
+        counts = sentiment_counts.loc[product_id]
+    counts = counts[counts > 0].sort_values(ascending=False, kind="stable")
+    return counts
+
+
+def get_overall_sentiment_from_aggregates(aggregates: ReviewAggregates) -> pd.DataFrame:
+    counts = get_sentiment_counts_from_aggregates(aggregates)
+    overall_sentiment_df = pd.DataFrame(
+        {"sentiment": counts.index.to_numpy(), "count": counts.to_numpy()}
+    )
+    return overall_sentiment_df
+
+
+def get_sentiment_per_product_from_aggregates(
+    aggregates: ReviewAggregates,
+) -> pd.DataFrame:
+    grouped_sentiment = aggregates.sentiment_counts.stack().reset_index()
+    grouped_sentiment.columns = ["product_id", "encoded_score", "counts"]
+    grouped_sentiment = grouped_sentiment[grouped_sentiment.counts > 0]
+    grouped_sentiment = grouped_sentiment.reset_index(drop=True)
+    return grouped_sentiment
+
+
+def get_top_ten_words_df_from_aggregates(
+    aggregates: ReviewAggregates, k: int = 10
+) -> pd.DataFrame:
+    top_ten_words_df = aggregates.word_counts.top_words_df(k)
+    return top_ten_words_df
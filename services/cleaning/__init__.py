@@ -1,24 +1,91 @@
+# standard library imports
+import re
+from string import printable
+from typing import Iterator, List, Sequence
+from unicodedata import normalize
+
 # third party imports
 import pandas as pd
 
 # local application imports
-from services.formatting import (
-    remove_quotes,
-    replace_umlaute,
-    remove_accents,
-    transform_text,
+from services.formatting import generate_replacement_map
+from services.instrumentation import instrumented
+
+# NOTE: the reviews of a chunk are cleaned as one string joined by SEPARATOR.
+# It is neither printable nor matched by \s, \w or \d, so none of the patterns
+# below can reach across two reviews and every review ends up exactly as the
+# per-review chain remove_quotes -> ... -> str.lower would leave it.
+SEPARATOR = "\x00"
+DEFAULT_CHUNKSIZE = 10_000
+
+# remove_quotes + replace_umlaute
+QUOTES_UMLAUTE_REPLACEMENTS = {'"': "", "'": "", **generate_replacement_map()}
+
+# remove_accents + remove_newline_chars + remove_special_chars
+KEPT_CHARS = "".join(char for char in printable if char not in "\n,|():")
+REMOVED_CHARS_PATTERN = re.compile(f"[^{re.escape(KEPT_CHARS + SEPARATOR)}]")
+
+# replace_dashes + str.lower, only ascii is left after REMOVED_CHARS_PATTERN
+# and none of the patterns of transform_text depends on letter case
+DASHES_LOWER_TABLE = str.maketrans(
+    {"-": " ", **{chr(i): chr(i + 32) for i in range(ord("A"), ord("Z") + 1)}}
 )
+FORWARD_SLASH_TABLE = str.maketrans({"/": " "})
+
+THOUSANDS_PATTERN = re.compile(r"(\d)(\.)(\d)")
+DOT_FROM_DATE_PATTERN = re.compile(r"(\s\d{1,2})(\.)")
+MULTIPLE_DOTS_PATTERN = re.compile(r"\.{3}")
+TRAILING_DOT_PATTERN = re.compile(r"\s\.\s")
+SENTENCE_ENDING_PATTERN = re.compile(r"[\!\?\;]")
+ABBREVIATED_NAMES_PATTERN = re.compile(r"(\s\w)(\.)")
+
+
+def join_texts(texts: Sequence[str]) -> str:
+    joined = SEPARATOR.join(texts)
+    if joined.count(SEPARATOR) != len(texts) - 1:
+        # NOTE: remove_accents drops the separator anyway, it is not printable
+        joined = SEPARATOR.join(text.replace(SEPARATOR, "") for text in texts)
+    return joined
+
+
+def clean_joined_text(text: str) -> str:
+    for key, value in QUOTES_UMLAUTE_REPLACEMENTS.items():
+        text = text.replace(key, value)
+    text = normalize("NFKD", text)
+    text = REMOVED_CHARS_PATTERN.sub("", text)
+    text = text.translate(DASHES_LOWER_TABLE)
+    text = THOUSANDS_PATTERN.sub(r"\1\3", text)
+    text = DOT_FROM_DATE_PATTERN.sub(r"\1 ", text)
+    text = text.translate(FORWARD_SLASH_TABLE)
+    text = MULTIPLE_DOTS_PATTERN.sub(". ", text)
+    text = TRAILING_DOT_PATTERN.sub(" ", text)
+    text = SENTENCE_ENDING_PATTERN.sub(".", text)
+    text = ABBREVIATED_NAMES_PATTERN.sub(r"\1", text)
+    # replace_multiple_spaces + str.strip, only ascii whitespace is left
+    text = " ".join(text.split())
+    text = text.replace(f" {SEPARATOR}", SEPARATOR)
+    text = text.replace(f"{SEPARATOR} ", SEPARATOR)
+    return text
+
+
+def iter_chunks(texts: Sequence[str], chunksize: int) -> Iterator[Sequence[str]]:
+    for start in range(0, len(texts), chunksize):
+        yield texts[start : start + chunksize]
+
+
+def clean_texts(texts: Sequence[str], chunksize: int = DEFAULT_CHUNKSIZE) -> List[str]:
+    cleaned = []
+    for chunk in iter_chunks(texts, chunksize):
+        cleaned.extend(clean_joined_text(join_texts(chunk)).split(SEPARATOR))
+    return cleaned
 
 
-def clean_text_values(df: pd.DataFrame) -> pd.DataFrame:
-    clean_funcs = [
-        remove_quotes,
-        replace_umlaute,
-        remove_accents,
-        transform_text,
-        str.strip,
-        str.lower,
-    ]
-    for func in clean_funcs:
-        df.text = df.text.apply(func)
-    return df
+@instrumented
+def clean_text_values(
+    df: pd.DataFrame, chunksize: int = DEFAULT_CHUNKSIZE
+) -> pd.DataFrame:
+    # NOTE: df keeps its raw texts, only the other columns are copied
+    cleaned_df = df.drop(columns="text")
+    cleaned_texts = clean_texts(df.text.tolist(), chunksize)
+    cleaned_df.insert(df.columns.get_loc("text"), "text", cleaned_texts)
+    return cleaned_df
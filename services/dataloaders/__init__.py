@@ -1,32 +1,132 @@
 # standard library imports
+import functools
+import glob
+import hashlib
 import json
 import itertools
+import os
+import threading
 from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Sequence, Set
 
 # third party imports
+import numpy as np
 import pandas as pd
 
 # local services imports
 from services.utilities import get_input_file
-from services.cleaning import replace_umlaute
+from services.formatting import replace_umlaute
+from services.instrumentation import instrumented
+from services.lexicon import (
+    CompoundLexicon,
+    CompoundMatcher,
+    CompoundSentimentLexicon,
+    Lexicon,
+    SentimentLexicon,
+)
 
+LEXICON_CACHE_FOLDER = "resources/cache/lexicon"
+LEXICON_CACHE_VERSION = 1
+DEFAULT_CHUNKSIZE = 50_000
+CSV_OPTIONS = {
+    "names": ["product_id", "text", "rating"],
+    "header": 0,
+    "encoding": "latin-1",
+    "sep": ";",
+    # NOTE: categories are parsed as strings, a product id is stored once and
+    # every review only holds its code
+    "dtype": {"product_id": "category"},
+}
 
+
+def downcast_ratings(df: pd.DataFrame) -> pd.DataFrame:
+    # NOTE: int8 ratings, they stay float if a rating is missing
+    df.rating = pd.to_numeric(df.rating, downcast="integer")
+    return df
+
+
+@instrumented
 def load_data(filename: Path) -> pd.DataFrame:
-    df = pd.read_csv(
-        filename,
-        names=["product_id", "text", "rating"],
-        header=0,
-        encoding="latin-1",
-        sep=";",
-    )
-    df.product_id = df.product_id.apply(str)
+    df = downcast_ratings(pd.read_csv(filename, **CSV_OPTIONS))
     df = df.drop_duplicates(subset=["product_id", "text"])
     return df
 
 
-def load_stopwords(filename: Path) -> list:
+def get_review_digest(product_id: str, text: str) -> bytes:
+    key = f"{product_id}\x00{text}".encode("utf-8", "surrogatepass")
+    return hashlib.blake2b(key, digest_size=16).digest()
+
+
+def get_review_digests(df: pd.DataFrame) -> List[bytes]:
+    return [
+        get_review_digest(product_id, text)
+        for product_id, text in zip(df.product_id, df.text)
+    ]
+
+
+def drop_seen_duplicates(chunk: pd.DataFrame, seen: Set[bytes]) -> pd.DataFrame:
+    keep = np.ones(len(chunk), dtype=bool)
+    for i, digest in enumerate(get_review_digests(chunk)):
+        if digest in seen:
+            keep[i] = False
+        else:
+            seen.add(digest)
+    return chunk[keep]
+
+
+def load_data_chunks(
+    filename: Path, chunksize: int = DEFAULT_CHUNKSIZE, seen: Set[bytes] = None
+) -> Iterator[pd.DataFrame]:
+    # NOTE: only the 16 byte digests of already yielded reviews are kept, so
+    # memory depends on chunksize and the number of unique reviews, not on
+    # the size of the file
+    seen = set() if seen is None else seen
+    for chunk in pd.read_csv(filename, chunksize=chunksize, **CSV_OPTIONS):
+        chunk = drop_seen_duplicates(downcast_ratings(chunk), seen)
+        if len(chunk):
+            yield chunk
+
+
+def get_input_files(path: str) -> List[Path]:
+    # NOTE: a csv file, a folder of csv files or a glob like "exports/*.csv",
+    # shards are read in sorted order, which decides the copy of a duplicate
+    # review that is kept
+    if os.path.isdir(path):
+        filenames = sorted(Path(path).glob("*.csv"))
+    elif glob.has_magic(path):
+        filenames = sorted(Path(filename) for filename in glob.glob(path))
+    else:
+        filenames = [Path(path)] if os.path.exists(path) else []
+    if not filenames:
+        raise FileNotFoundError(f"No csv files found for {path}")
+    return filenames
+
+
+@instrumented
+def load_data_files(filenames: Sequence[Path]) -> pd.DataFrame:
+    if len(filenames) == 1:
+        return load_data(filenames[0])
+    # NOTE: copies within a shard are dropped by load_data, copies across
+    # shards on the concatenated frame, the first copy in shard order is kept
+    df = pd.concat([load_data(filename) for filename in filenames], ignore_index=True)
+    df = df.drop_duplicates(subset=["product_id", "text"])
+    return df.astype({"product_id": "category"})
+
+
+def load_files_chunks(
+    filenames: Sequence[Path], chunksize: int = DEFAULT_CHUNKSIZE
+) -> Iterator[pd.DataFrame]:
+    # NOTE: one set of digests for all shards, so a review is only yielded
+    # for the first shard that contains it
+    seen = set()
+    for filename in filenames:
+        yield from load_data_chunks(filename, chunksize, seen)
+
+
+@instrumented
+def load_stopwords(filename: Path) -> Lexicon:
     with open(filename, "r", encoding="utf-8") as file:
-        stopwords = [replace_umlaute(line.strip()) for line in file]
+        stopwords = Lexicon(replace_umlaute(line.strip()) for line in file)
     return stopwords
 
 
@@ -52,14 +152,231 @@ def get_list_of_nouns(filename: Path) -> list:
     return list_of_nouns
 
 
-def load_filter_nouns(filenames: list, additional_words_path: Path = None) -> list:
-    if additional_words_path:
-        with open(additional_words_path, "r", encoding="utf-8") as file:
-            additional = [replace_umlaute(line.strip()) for line in file]
+def get_word_forms(filename: Path, tags: Sequence[str]) -> List[str]:
+    # NOTE: SentiWS lines are "Word|TAG <tab> score <tab> inflection,...",
+    # base forms and inflections of the given part of speech tags are kept
+    word_forms = []
+    with open(filename, "r") as file:
+        for line in file:
+            columns = line.rstrip("\n").split("\t")
+            word, tag = columns[0].split("|")
+            if tag not in tags:
+                continue
+            inflections = columns[2].split(",") if len(columns) > 2 else []
+            for form in [word, *inflections]:
+                if form:
+                    word_forms.append(replace_umlaute(form.lower()))
+    return word_forms
+
+
+def get_additional_words(additional_words_path: Path = None) -> List[str]:
+    if not additional_words_path:
+        return []
+    with open(additional_words_path, "r", encoding="utf-8") as file:
+        return [replace_umlaute(line.strip()) for line in file]
+
+
+@instrumented
+def load_filter_nouns(
+    filenames: list, additional_words_path: Path = None, rebuild_cache: bool = False
+) -> Lexicon:
+    additional = get_additional_words(additional_words_path)
     filter_nouns = []
     for filename in filenames:
-        list_of_nouns = get_list_of_nouns(filename)
+        list_of_nouns = load_cached_nouns(filename, rebuild_cache).tolist()
         filter_nouns.append(list_of_nouns)
     all_filter_nouns = list(itertools.chain.from_iterable(filter_nouns))
     all_filter_nouns += additional
-    return all_filter_nouns
+    return Lexicon(all_filter_nouns)
+
+
+def hash_file(filename: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def get_source_fingerprint(filename: Path) -> dict:
+    stat = os.stat(filename)
+    return {
+        "path": str(filename),
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "sha256": hash_file(filename),
+    }
+
+
+def is_cache_valid(manifest_path: Path, sources: list) -> bool:
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path, "r") as json_file:
+        manifest = json.load(json_file)
+    cached_sources = manifest.get("sources", [])
+    if manifest.get("version") != LEXICON_CACHE_VERSION or [
+        source["path"] for source in cached_sources
+    ] != [str(source) for source in sources]:
+        return False
+    touched = False
+    for cached_source, source in zip(cached_sources, sources):
+        stat = os.stat(source)
+        if (cached_source["mtime"], cached_source["size"]) == (
+            stat.st_mtime,
+            stat.st_size,
+        ):
+            continue
+        # NOTE: mtime or size changed, only the content hash decides
+        if cached_source["sha256"] != hash_file(source):
+            return False
+        cached_source.update(mtime=stat.st_mtime, size=stat.st_size)
+        touched = True
+    if touched:
+        write_manifest(manifest_path, manifest)
+    return True
+
+
+def write_manifest(manifest_path: Path, manifest: dict) -> None:
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as json_file:
+        json.dump(manifest, json_file, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def load_cached_arrays(
+    name: str,
+    sources: list,
+    build_arrays: Callable[[], Dict[str, np.ndarray]],
+    rebuild: bool = False,
+) -> Dict[str, np.ndarray]:
+    cache_dir = get_input_file(LEXICON_CACHE_FOLDER, name)
+    manifest_path = cache_dir.joinpath("manifest.json")
+    if rebuild or not is_cache_valid(manifest_path, sources):
+        os.makedirs(cache_dir, exist_ok=True)
+        arrays = build_arrays()
+        for key, array in arrays.items():
+            tmp_path = cache_dir.joinpath(f"{key}.{os.getpid()}.tmp.npy")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, cache_dir.joinpath(f"{key}.npy"))
+        manifest = {
+            "version": LEXICON_CACHE_VERSION,
+            "sources": [get_source_fingerprint(source) for source in sources],
+            "arrays": sorted(arrays),
+        }
+        write_manifest(manifest_path, manifest)
+    with open(manifest_path, "r") as json_file:
+        keys = json.load(json_file)["arrays"]
+    return {
+        key: np.load(cache_dir.joinpath(f"{key}.npy"), mmap_mode="r") for key in keys
+    }
+
+
+@instrumented
+def load_sentiment_lexicon(
+    filename: Path, rebuild_cache: bool = False
+) -> SentimentLexicon:
+    def build_arrays() -> Dict[str, np.ndarray]:
+        sentiment_words = load_sentiment_words(filename)
+        words = sorted(sentiment_words)
+        scores = [sentiment_words[word].get("score", 0.0) for word in words]
+        # NOTE: scores stay float64, float32 would change review sums that sit
+        # right on the encoding thresholds
+        return {
+            "words": np.array(words, dtype=str),
+            "scores": np.array(scores, dtype="float64"),
+        }
+
+    arrays = load_cached_arrays(
+        "sentiment_words", [filename], build_arrays, rebuild_cache
+    )
+    cache_dir = get_input_file(LEXICON_CACHE_FOLDER, "sentiment_words")
+    return SentimentLexicon(arrays["words"], arrays["scores"], cache_dir)
+
+
+def load_cached_nouns(filename: Path, rebuild_cache: bool = False) -> np.ndarray:
+    def build_arrays() -> Dict[str, np.ndarray]:
+        nouns = sorted(set(get_list_of_nouns(filename)))
+        return {"nouns": np.array(nouns, dtype=str)}
+
+    name = f"nouns_{Path(filename).stem}"
+    return load_cached_arrays(name, [filename], build_arrays, rebuild_cache)["nouns"]
+
+
+def load_cached_word_forms(
+    filename: Path, tags: Sequence[str], rebuild_cache: bool = False
+) -> np.ndarray:
+    def build_arrays() -> Dict[str, np.ndarray]:
+        word_forms = sorted(set(get_word_forms(filename, tags)))
+        return {"forms": np.array(word_forms, dtype=str)}
+
+    name = f"forms_{'_'.join(sorted(tags))}_{Path(filename).stem}"
+    return load_cached_arrays(name, [filename], build_arrays, rebuild_cache)["forms"]
+
+
+def load_word_forms(
+    filenames: list, tags: Sequence[str], rebuild_cache: bool = False
+) -> Set[str]:
+    word_forms = set()
+    for filename in filenames:
+        word_forms.update(
+            load_cached_word_forms(filename, tags, rebuild_cache).tolist()
+        )
+    return word_forms
+
+
+COMPOUND_HEAD_TAGS = ("ADJX", "ADV", "NN", "VVINF")
+COMPOUND_MATCHER_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=4)
+def build_compound_matcher(
+    filenames: tuple, additional_words_path: Path = None, rebuild_cache: bool = False
+) -> CompoundMatcher:
+    # NOTE: every known word is a possible head, the longest one wins, so
+    # "sommerkleid" ends in "kleid" and not in the negative "leid"; cached,
+    # the noun and the sentiment lexicon share one matcher and its memo
+    heads = load_word_forms(filenames, COMPOUND_HEAD_TAGS, rebuild_cache)
+    heads.update(get_additional_words(additional_words_path))
+    return CompoundMatcher(heads)
+
+
+def load_compound_matcher(
+    filenames: tuple, additional_words_path: Path = None, rebuild_cache: bool = False
+) -> CompoundMatcher:
+    # NOTE: the noun and the sentiment lexicon stages may run on two threads,
+    # lru_cache does not stop both from building the matcher on a cold cache,
+    # so the second one waits for the matcher of the first
+    with COMPOUND_MATCHER_LOCK:
+        return build_compound_matcher(filenames, additional_words_path, rebuild_cache)
+
+
+@instrumented
+def load_compound_nouns(
+    filenames: list,
+    nouns: Lexicon,
+    additional_words_path: Path = None,
+    rebuild_cache: bool = False,
+) -> CompoundLexicon:
+    # NOTE: the inflected nouns are matched as well, and a compound with a
+    # noun head is a noun, e.g. "passformproblem" ends in "problem"
+    words = nouns.words.union(load_word_forms(filenames, ["NN"], rebuild_cache))
+    matcher = load_compound_matcher(
+        tuple(filenames), additional_words_path, rebuild_cache
+    )
+    return CompoundLexicon(words, matcher)
+
+
+@instrumented
+def load_compound_sentiment_lexicon(
+    filenames: list,
+    sentiment_words: SentimentLexicon,
+    stopwords: Lexicon,
+    additional_words_path: Path = None,
+    rebuild_cache: bool = False,
+) -> CompoundSentimentLexicon:
+    matcher = load_compound_matcher(
+        tuple(filenames), additional_words_path, rebuild_cache
+    )
+    return CompoundSentimentLexicon.from_lexicon(
+        sentiment_words, matcher, stopwords.words
+    )
@@ -0,0 +1,399 @@
+# standard library imports
+import logging
+import time
+from typing import NamedTuple, Sequence, Tuple
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+# local services imports
+from services.instrumentation import SETTINGS, emit_event, instrumented
+from services.transformation import TokenStore
+
+# NOTE: cleaned texts are ascii, a shingle of up to 8 characters is packed
+# into one uint64 without any collisions
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 128
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+# NOTE: short reviews like "passt gut" are written by many customers, only
+# longer texts are near duplicates of each other by copying
+MIN_TEXT_LENGTH = 50
+MINHASH_SEED = 1
+BAND_KEY_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# NOTE: all pairs of a bucket up to this size are candidates, the members of
+# a larger bucket are only compared with its first member
+MAX_BUCKET_SIZE = 100
+
+
+class UniqueTexts(NamedTuple):
+    """The distinct texts of a frame and the text of every row
+    :param codes: row i holds texts[codes[i]]
+    :param texts: object array of the distinct texts in order of first
+        occurrence
+    :param index: index of the rows in the source frame
+    """
+
+    codes: np.ndarray
+    texts: np.ndarray
+    index: pd.Index
+
+    @property
+    def row_count(self) -> int:
+        return len(self.codes)
+
+    @property
+    def uniqueness_ratio(self) -> float:
+        return len(self.texts) / self.row_count if self.row_count else 1.0
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({"text": self.texts})
+
+
+@instrumented
+def factorize_texts(df: pd.DataFrame) -> UniqueTexts:
+    # NOTE: load_data only drops duplicates per product, the same short
+    # review like "passt gut" is still in the frame once per product
+    codes, texts = pd.factorize(df.text.to_numpy(dtype=object))
+    return UniqueTexts(codes, np.asarray(texts, dtype=object), df.index)
+
+
+def fan_out_values(values: np.ndarray, unique_texts: UniqueTexts) -> np.ndarray:
+    return np.asarray(values)[unique_texts.codes]
+
+
+def fan_out_frame(df: pd.DataFrame, unique_texts: UniqueTexts) -> pd.DataFrame:
+    # NOTE: one row per distinct text in, one row per row of the source out
+    fanned_out_df = df.iloc[unique_texts.codes]
+    fanned_out_df.index = unique_texts.index
+    return fanned_out_df
+
+
+@instrumented
+def expand_token_store(
+    token_store: TokenStore, unique_texts: UniqueTexts
+) -> TokenStore:
+    # NOTE: the tokens of row i are the tokens of its distinct text, gathered
+    # by position, the vocabulary keeps its order of first occurrence as the
+    # distinct texts are in order of their first row
+    lengths = np.diff(token_store.offsets)[unique_texts.codes]
+    offsets = np.zeros(len(lengths) + 1, dtype="int64")
+    np.cumsum(lengths, out=offsets[1:])
+    starts = token_store.offsets[:-1][unique_texts.codes]
+    positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+    return TokenStore(
+        token_store.token_ids[positions],
+        offsets,
+        token_store.vocabulary,
+        unique_texts.index,
+    )
+
+
+def get_deduplication_stats(unique_texts: UniqueTexts, token_store: TokenStore) -> dict:
+    # NOTE: cleaning costs about the same per character, scoring and
+    # filtering per token, the saved work is what the duplicates would cost
+    chars = np.fromiter(map(len, unique_texts.texts), "int64", len(unique_texts.texts))
+    tokens = np.diff(token_store.offsets)
+    processed_chars, processed_tokens = int(chars.sum()), int(tokens.sum())
+    total_chars = int(chars[unique_texts.codes].sum())
+    total_tokens = int(tokens[unique_texts.codes].sum())
+    return {
+        "rows": unique_texts.row_count,
+        "distinct_texts": len(unique_texts.texts),
+        "uniqueness_ratio": unique_texts.uniqueness_ratio,
+        "processed_chars": processed_chars,
+        "saved_chars": total_chars - processed_chars,
+        "processed_tokens": processed_tokens,
+        "saved_tokens": total_tokens - processed_tokens,
+    }
+
+
+def log_deduplication_stats(unique_texts: UniqueTexts, token_store: TokenStore) -> dict:
+    stats = get_deduplication_stats(unique_texts, token_store)
+    logging.info(
+        f"Deduplicated texts: {stats['distinct_texts']} distinct of {stats['rows']} "
+        f"rows, uniqueness ratio {stats['uniqueness_ratio']:.3f}, saved "
+        f"{stats['saved_chars']} chars of cleaning and {stats['saved_tokens']} "
+        f"tokens of scoring and filtering"
+    )
+    if SETTINGS["enabled"]:
+        emit_event({"event": "deduplication", "timestamp": time.time(), **stats})
+    return stats
+
+
+class NearDuplicates(NamedTuple):
+    """Clusters of near duplicate rows
+    :param clusters: per row the position of the first row of its cluster,
+        -1 for rows without near duplicates
+    :param index: index of the rows in the source frame
+    :param threshold: estimated jaccard similarity of the shingles a pair of
+        rows needed to be linked
+    """
+
+    clusters: np.ndarray
+    index: pd.Index
+    threshold: float
+
+    def duplicate_mask(self) -> np.ndarray:
+        # NOTE: the first row of a cluster is kept, the other rows are copies
+        positions = np.arange(len(self.clusters))
+        return (self.clusters >= 0) & (self.clusters != positions)
+
+
+def get_shingle_hashes(
+    texts: Sequence[str], shingle_size: int = SHINGLE_SIZE
+) -> Tuple[np.ndarray, np.ndarray]:
+    # NOTE: the character shingles of all texts packed into uint64 values in
+    # one pass over the concatenated bytes, offsets[i] is the first shingle of
+    # text i, texts shorter than a shingle have none
+    encoded = [text.encode("utf-8") for text in texts]
+    lengths = np.fromiter(map(len, encoded), "int64", len(encoded))
+    data = np.frombuffer(b"".join(encoded), dtype="uint8")
+    starts = np.cumsum(lengths) - lengths
+    shingle_counts = np.maximum(lengths - shingle_size + 1, 0)
+    offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    np.cumsum(shingle_counts, out=offsets[1:])
+    positions = np.repeat(starts - offsets[:-1], shingle_counts) + np.arange(
+        offsets[-1]
+    )
+    shingles = np.zeros(offsets[-1], dtype="uint64")
+    for shift in range(shingle_size):
+        shingles |= data[positions + shift].astype("uint64") << np.uint64(8 * shift)
+    return shingles, offsets
+
+
+def get_minhash_signatures(
+    shingles: np.ndarray,
+    offsets: np.ndarray,
+    num_permutations: int = NUM_PERMUTATIONS,
+    seed: int = MINHASH_SEED,
+) -> np.ndarray:
+    """MinHash signature of every text, one row per text
+    :param shingles: the shingles of all texts, at least one per text
+    :param offsets: the shingles of text i are shingles[offsets[i]:offsets[i + 1]]
+    """
+    # NOTE: multiply shift hashing, uint64 products wrap around and the high
+    # bits are the hash, every permutation is one pass over all shingles
+    random_state = np.random.RandomState(seed)
+    multipliers = random_state.randint(0, 2**63, num_permutations, "uint64")
+    multipliers = multipliers * np.uint64(2) + np.uint64(1)
+    increments = random_state.randint(0, 2**63, num_permutations, "uint64")
+    signatures = np.empty((len(offsets) - 1, num_permutations), dtype="uint32")
+    for i in range(num_permutations):
+        hashes = (shingles * multipliers[i] + increments[i]) >> np.uint64(32)
+        signatures[:, i] = np.minimum.reduceat(hashes, offsets[:-1])
+    return signatures
+
+
+def get_band_layout(threshold: float, num_permutations: int) -> Tuple[int, int]:
+    # NOTE: pairs with a similarity of about (1 / bands) ** (1 / rows) share a
+    # band with a chance of one half, the most rows per band that still keep
+    # it below the threshold, the candidates are verified afterwards
+    layouts = [
+        (num_permutations // rows, rows)
+        for rows in range(1, num_permutations + 1)
+        if num_permutations % rows == 0
+    ]
+    below = [
+        (bands, rows)
+        for bands, rows in layouts
+        if (1 / bands) ** (1 / rows) <= threshold
+    ]
+    return below[-1] if below else layouts[0]
+
+
+def get_bucket_pairs(
+    order: np.ndarray, starts: np.ndarray, ends: np.ndarray, max_bucket_size: int
+) -> np.ndarray:
+    """Pairs of the members of the buckets of sorted keys
+    :param order: the members sorted by bucket
+    :param starts: per sorted position the first position of its bucket
+    :param ends: per sorted position the position after its bucket
+    """
+    positions = np.arange(len(order))
+    small = ends - starts <= max_bucket_size
+    # NOTE: every member of a small bucket is paired with all members after it
+    counts = np.where(small, ends - positions - 1, 0)
+    firsts = np.repeat(positions, counts)
+    steps = np.arange(len(firsts)) - np.repeat(np.cumsum(counts) - counts, counts)
+    seconds = firsts + 1 + steps
+    large = ~small & (positions > starts)
+    firsts = np.concatenate([firsts, starts[large]])
+    seconds = np.concatenate([seconds, positions[large]])
+    return np.stack([order[firsts], order[seconds]], axis=1)
+
+
+def get_candidate_pairs(
+    signatures: np.ndarray,
+    codes: np.ndarray,
+    groups: np.ndarray,
+    bands: int,
+    rows: int,
+    max_bucket_size: int = MAX_BUCKET_SIZE,
+) -> np.ndarray:
+    # NOTE: texts with equal rows of a band and of the same group land in the
+    # same bucket, sorting the band keys puts a bucket next to each other,
+    # text i has the signature codes[i]
+    pairs = []
+    for band in range(bands):
+        band_keys = np.zeros(len(signatures), dtype="uint64")
+        for column in signatures[:, band * rows : (band + 1) * rows].T:
+            band_keys = band_keys * BAND_KEY_MULTIPLIER + column.astype("uint64")
+        keys = groups.astype("uint64") * BAND_KEY_MULTIPLIER + band_keys[codes]
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        new_bucket = np.ones(len(keys), dtype=bool)
+        new_bucket[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        bucket_starts = np.flatnonzero(new_bucket)
+        bucket_ends = np.append(bucket_starts[1:], len(keys))
+        bucket_ids = np.cumsum(new_bucket) - 1
+        pairs.append(
+            get_bucket_pairs(
+                order,
+                bucket_starts[bucket_ids],
+                bucket_ends[bucket_ids],
+                max_bucket_size,
+            )
+        )
+    pairs = np.concatenate(pairs or [np.zeros((0, 2), dtype="int64")])
+    return np.unique(np.sort(pairs, axis=1), axis=0)
+
+
+def get_connected_components(pairs: np.ndarray, count: int) -> np.ndarray:
+    # NOTE: every node ends up labelled with the smallest node it is linked
+    # to, min label propagation with pointer jumping
+    labels = np.arange(count)
+    while True:
+        linked = np.minimum(labels[pairs[:, 0]], labels[pairs[:, 1]])
+        updated = labels.copy()
+        np.minimum.at(updated, pairs[:, 0], linked)
+        np.minimum.at(updated, pairs[:, 1], linked)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def find_near_duplicates(
+    texts: Sequence[str],
+    groups: np.ndarray = None,
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    min_length: int = MIN_TEXT_LENGTH,
+    shingle_size: int = SHINGLE_SIZE,
+    num_permutations: int = NUM_PERMUTATIONS,
+) -> (np.ndarray, dict):
+    """Clusters texts whose shingle sets have a jaccard similarity of at
+    least the threshold, estimated from MinHash signatures banded through LSH
+    :param groups: only texts of the same group are compared, e.g. product codes
+    :param min_length: shorter texts are never near duplicates
+    :return: per text the position of the first text of its cluster or -1,
+        and the counts of candidate pairs, verified pairs and exact copies
+    """
+    # NOTE: the same text is often reviewed for several products, every
+    # distinct text is shingled and hashed once
+    codes, distinct_texts = pd.factorize(np.asarray(texts, dtype=object))
+    lengths = np.fromiter(map(len, distinct_texts), "int64", len(distinct_texts))
+    long_enough = lengths >= max(min_length, shingle_size)
+    signature_ids = np.cumsum(long_enough) - 1
+    eligible = np.flatnonzero(long_enough[codes])
+    codes = signature_ids[codes[eligible]]
+    groups = np.zeros(len(texts), "int64") if groups is None else np.asarray(groups)
+    shingles, offsets = get_shingle_hashes(
+        distinct_texts[long_enough].tolist(), shingle_size
+    )
+    signatures = get_minhash_signatures(shingles, offsets, num_permutations)
+    bands, rows = get_band_layout(threshold, num_permutations)
+    # NOTE: exact copies of a text within a group are linked to its first row
+    # directly, only the first rows of the distinct texts of a group are
+    # candidates, so copies do not fill the buckets
+    group_codes = groups[eligible].astype("int64") * len(signatures) + codes
+    _, first_rows, copy_of = np.unique(
+        group_codes, return_index=True, return_inverse=True
+    )
+    copy_of = copy_of.ravel()
+    candidates = first_rows[
+        get_candidate_pairs(
+            signatures, codes[first_rows], groups[eligible][first_rows], bands, rows
+        )
+    ]
+    # NOTE: a candidate is a pair if the share of equal minhashes, the
+    # estimated jaccard similarity, reaches the threshold
+    similarities = np.count_nonzero(
+        signatures[codes[candidates[:, 0]]] == signatures[codes[candidates[:, 1]]],
+        axis=1,
+    )
+    pairs = candidates[similarities / num_permutations >= threshold]
+    copies = np.flatnonzero(first_rows[copy_of] != np.arange(len(eligible)))
+    copy_pairs = np.stack([first_rows[copy_of[copies]], copies], axis=1)
+    all_pairs = np.concatenate([pairs, copy_pairs])
+    labels = get_connected_components(all_pairs, len(eligible))
+    linked = np.zeros(len(eligible), dtype=bool)
+    linked[all_pairs.ravel()] = True
+    clusters = np.full(len(texts), -1, dtype="int64")
+    clusters[eligible[linked]] = eligible[labels[linked]]
+    counts = {
+        "candidate_pairs": len(candidates),
+        "verified_pairs": len(pairs),
+        "exact_copies": len(copies),
+    }
+    return clusters, counts
+
+
+@instrumented
+def find_near_duplicate_reviews(
+    df: pd.DataFrame,
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    within_product: bool = True,
+) -> NearDuplicates:
+    """Near duplicate reviews among the cleaned texts of df
+    :param within_product: only reviews of the same product are compared,
+        copies across products are not counted twice in any product
+    """
+    groups = pd.factorize(df.product_id)[0] if within_product else None
+    clusters, counts = find_near_duplicates(df.text.tolist(), groups, threshold)
+    near_duplicates = NearDuplicates(clusters, df.index, threshold)
+    stats = {
+        "rows": len(df),
+        "clusters": int(np.count_nonzero(clusters == np.arange(len(clusters)))),
+        "duplicate_rows": int(near_duplicates.duplicate_mask().sum()),
+        "threshold": threshold,
+        **counts,
+    }
+    logging.info(
+        f"Near duplicates: {stats['clusters']} clusters with "
+        f"{stats['duplicate_rows']} copies in {stats['rows']} rows, "
+        f"{stats['verified_pairs']} of {stats['candidate_pairs']} candidate "
+        f"pairs reach a similarity of {threshold}, {stats['exact_copies']} "
+        f"exact copies"
+    )
+    if SETTINGS["enabled"]:
+        emit_event({"event": "near_duplicates", "timestamp": time.time(), **stats})
+    return near_duplicates
+
+
+def get_near_duplicate_clusters(
+    df: pd.DataFrame, near_duplicates: NearDuplicates
+) -> pd.DataFrame:
+    # NOTE: one row per cluster with the text of its first review, the
+    # largest clusters first
+    clusters = near_duplicates.clusters
+    in_cluster = clusters >= 0
+    sizes = np.bincount(clusters[in_cluster], minlength=len(clusters))
+    firsts = np.flatnonzero(sizes)
+    clusters_df = pd.DataFrame(
+        {
+            "product_id": np.asarray(df.product_id)[firsts],
+            "review": near_duplicates.index[firsts],
+            "size": sizes[firsts],
+            "text": np.asarray(df.text, dtype=object)[firsts],
+        }
+    )
+    return clusters_df.sort_values("size", ascending=False, kind="stable")
+
+
+def drop_near_duplicates(
+    df: pd.DataFrame, near_duplicates: NearDuplicates
+) -> pd.DataFrame:
+    # NOTE: by position, df is the frame the near duplicates were found in or
+    # a frame with the same rows like the raw reviews
+    return df[~near_duplicates.duplicate_mask()]
@@ -1,25 +1,39 @@
 # third party imports
+import numpy as np
 import pandas as pd
 
+POSITIVE_THRESHOLD = 0.33
+NEGATIVE_THRESHOLD = -0.33
+RATING_LABELS = {
+    5: "very positive",
+    4: "positive",
+    3: "neutral",
+    2: "negative",
+    1: "very negative",
+}
+SENTIMENT_LABELS = ["negative", "neutral", "positive"]
 
-def encode_rating(df: pd.DataFrame) -> pd.DataFrame:
-    replacement_map = {
-        "5": "very positive",
-        "4": "positive",
-        "3": "neutral",
-        "2": "negative",
-        "1": "very negative",
-    }
-    rating_encoded_df = df.copy()
-    rating_encoded_df.rating = rating_encoded_df.rating.apply(str)
-    rating_encoded_df.rating = rating_encoded_df.rating.map(replacement_map)
-    return rating_encoded_df
+
+def encode_rating(df: pd.DataFrame) -> pd.Series:
+    return df.rating.map(RATING_LABELS).astype("category")
 
 
 def encode_sentiment_scores(score: float) -> str:
-    if score >= 0.33:
+    if score >= POSITIVE_THRESHOLD:
         return "positive"
-    if score < 0.33 and score > -0.33:
+    if score < POSITIVE_THRESHOLD and score > NEGATIVE_THRESHOLD:
         return "neutral"
-    if score <= 0.33:
+    if score <= POSITIVE_THRESHOLD:
         return "negative"
+
+
+def encode_sentiment_scores_array(scores: np.ndarray) -> np.ndarray:
+    conditions = [scores >= POSITIVE_THRESHOLD, scores > NEGATIVE_THRESHOLD]
+    return np.select(conditions, ["positive", "neutral"], default="negative")
+
+
+def encode_sentiment_scores_categorical(scores: np.ndarray) -> pd.Categorical:
+    # NOTE: one byte per review instead of a string object
+    conditions = [scores >= POSITIVE_THRESHOLD, scores > NEGATIVE_THRESHOLD]
+    codes = np.select(conditions, [2, 1], default=0).astype("int8")
+    return pd.Categorical.from_codes(codes, SENTIMENT_LABELS)
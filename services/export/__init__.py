@@ -0,0 +1,227 @@
+# standard library imports
+import operator
+import os
+import shutil
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# third party imports
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# local services imports
+from services.instrumentation import instrumented
+from services.utilities import get_output_path
+
+ROW_GROUP_SIZE = 50_000
+PART_FILE = "part-00000.parquet"
+
+# NOTE: the filter format of pyarrow.parquet.read_table, a list of
+# (column, operator, value) tuples that all have to hold
+FILTER_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda values, value: np.isin(values, list(value)),
+}
+Filter = Tuple[str, str, object]
+
+
+def get_value_range(
+    row_group: pq.RowGroupMetaData, column_index: int
+) -> Optional[list]:
+    # NOTE: None if the writer kept no min and max, e.g. for list columns
+    statistics = row_group.column(column_index).statistics
+    if statistics is None or not statistics.has_min_max:
+        return None
+    return [statistics.min, statistics.max]
+
+
+def may_match(value_range: Optional[list], op: str, value) -> bool:
+    if value_range is None:
+        return True
+    low, high = value_range
+    if op == "==":
+        return low <= value <= high
+    if op == "!=":
+        return not low == high == value
+    if op == "<":
+        return low < value
+    if op == "<=":
+        return low <= value
+    if op == ">":
+        return high > value
+    if op == ">=":
+        return high >= value
+    return any(low <= item <= high for item in value)
+
+
+def replace_folder(tmp_folder: Path, folder: Path) -> None:
+    # NOTE: the old table is only moved away once the new one is complete, a
+    # failed export leaves it untouched
+    old_folder = folder.with_name(f"{folder.name}.{os.getpid()}.old")
+    if os.path.exists(folder):
+        os.replace(folder, old_folder)
+    os.replace(tmp_folder, folder)
+    shutil.rmtree(old_folder, ignore_errors=True)
+
+
+@instrumented
+def write_table(
+    df: pd.DataFrame,
+    folder: Path,
+    sort_by: str = None,
+    row_group_size: int = ROW_GROUP_SIZE,
+) -> Path:
+    """Writes df as a parquet dataset of one file, readable by read_table as
+    well as pyarrow.parquet.read_table(folder) and pandas.read_parquet(folder)
+    :param row_group_size: rows per row group, a reader skips every row group
+        whose min and max exclude its filters
+    """
+    # NOTE: sorted rows give row groups with narrow value ranges of sort_by,
+    # so filters on it skip most of them
+    if sort_by is not None:
+        df = df.sort_values(sort_by, kind="mergesort")
+    folder = Path(folder)
+    tmp_folder = folder.with_name(f"{folder.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(
+            table, str(tmp_folder.joinpath(PART_FILE)), row_group_size=row_group_size
+        )
+        replace_folder(tmp_folder, folder)
+    finally:
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+    return folder
+
+
+def get_filter_mask(values: pd.Series, op: str, value) -> np.ndarray:
+    # NOTE: categories are compared as their values
+    values = values.to_numpy(dtype=object)
+    return np.asarray(FILTER_OPERATORS[op](values, value), dtype=bool)
+
+
+def to_lists(df: pd.DataFrame, schema: pa.Schema) -> pd.DataFrame:
+    # NOTE: pyarrow returns list columns as numpy arrays per row
+    lists = {
+        field.name: pd.Series(
+            [
+                values.tolist() if values is not None else None
+                for values in df[field.name]
+            ],
+            index=df.index,
+            dtype=object,
+        )
+        for field in schema
+        if pa.types.is_list(field.type) and field.name in df.columns
+    }
+    return df.assign(**lists)
+
+
+@instrumented
+def read_table(
+    folder: Path, columns: Sequence[str] = None, filters: Sequence[Filter] = None
+) -> pd.DataFrame:
+    """Loads a table written by write_table
+    :param folder: the folder of the table
+    :param columns: only these columns are read, all by default
+    :param filters: (column, operator, value) tuples, e.g.
+        [("product_id", "==", "434886"), ("score", "<", 0)], row groups whose
+        min and max exclude a filter are skipped without being read
+    """
+    parquet_file = pq.ParquetFile(str(Path(folder).joinpath(PART_FILE)))
+    schema = parquet_file.schema.to_arrow_schema()
+    columns = list(schema.names) if columns is None else list(columns)
+    filters = list(filters or [])
+    for column, op, _ in filters:
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f"Unknown filter operator: {op}")
+    for column in columns + [column for column, _, _ in filters]:
+        if column not in schema.names:
+            raise ValueError(f"Unknown column: {column}")
+
+    metadata = parquet_file.metadata
+    column_indices = {
+        metadata.schema.column(i).path: i for i in range(metadata.num_columns)
+    }
+    read_columns = list(dict.fromkeys(columns + [column for column, _, _ in filters]))
+    tables = []
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        if all(
+            column not in column_indices
+            or may_match(get_value_range(row_group, column_indices[column]), op, value)
+            for column, op, value in filters
+        ):
+            tables.append(parquet_file.read_row_group(i, columns=read_columns))
+    if tables:
+        table = pa.concat_tables(tables)
+    else:
+        table = schema.empty_table()
+    df = table.to_pandas()
+
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        mask &= get_filter_mask(df[column], op, value)
+    if not mask.all():
+        df = df[mask].reset_index(drop=True)
+    return to_lists(df[columns], schema)
+
+
+class Report(NamedTuple):
+    """A table written as markdown and csv report
+    :param name: file name of the reports without extension
+    :param df: the table
+    :param group_by: the markdown report gets one table per value of this
+        column, headed by the value
+    """
+
+    name: str
+    df: pd.DataFrame
+    group_by: str = None
+
+
+def format_markdown(report: Report) -> str:
+    if report.group_by is None:
+        return report.df.to_markdown()
+    tables = []
+    for key, group_df in report.df.groupby(report.group_by, sort=False):
+        group_df = group_df.drop(columns=report.group_by)
+        group_df.index = pd.Index([""] * len(group_df), name=key)
+        tables.append(group_df.to_markdown())
+    return "\n\n".join(tables)
+
+
+@instrumented
+def write_reports(
+    reports: Sequence[Report],
+    markdown_folder: str = "markdown",
+    csv_folder: str = "csv",
+) -> List[Path]:
+    # NOTE: all reports are formatted before the first file is written, a
+    # failing report leaves the earlier reports untouched
+    contents = []
+    for report in reports:
+        contents.append(
+            (
+                get_output_path(markdown_folder, f"{report.name}.md"),
+                format_markdown(report),
+            )
+        )
+        contents.append(
+            (
+                get_output_path(csv_folder, f"{report.name}.csv"),
+                report.df.to_csv(index=False),
+            )
+        )
+    for output_path, content in contents:
+        with open(output_path, "w", encoding="utf-8") as report_file:
+            report_file.write(content)
+    return [output_path for output_path, _ in contents]
@@ -6,14 +6,11 @@ from unicodedata import normalize
 # local application imports
 from services.utilities import pipeline
 
+NON_PRINTABLE_PATTERN = re.compile(f"[^{re.escape(printable)}]")
+
 
 def remove_accents(text: str) -> str:
-    list_of_chars = list()
-    for char in normalize("NFKD", text):
-        if char in printable:
-            list_of_chars.append(char)
-    result = "".join(list_of_chars)
-    return result
+    return NON_PRINTABLE_PATTERN.sub("", normalize("NFKD", text))
 
 
 def remove_quotes(text: str) -> str:
@@ -24,21 +21,22 @@ def remove_quotes(text: str) -> str:
 
 def generate_replacement_map():
     replacement_map = {
-        u"ä": "ae",
-        u"Ä": "Ae",
-        u"ö": "oe",
-        u"Ö": "Oe",
-        u"ü": "ue",
-        u"Ü": "Ue",
-        u"ß": "ss",
+        "ä": "ae",
+        "Ä": "Ae",
+        "ö": "oe",
+        "Ö": "Oe",
+        "ü": "ue",
+        "Ü": "Ue",
+        "ß": "ss",
     }
     return replacement_map
 
 
+UMLAUTE_TABLE = str.maketrans(generate_replacement_map())
+
+
 def replace_umlaute(text: str) -> str:
-    for key, value in generate_replacement_map().items():
-        text = text.replace(key, value)
-    return text
+    return text.translate(UMLAUTE_TABLE)
 
 
 def get_first_string_element(text: str) -> str:
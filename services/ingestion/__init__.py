@@ -0,0 +1,291 @@
+# standard library imports
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Tuple,
+    Union,
+)
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+# local services imports
+from services.cleaning import clean_text_values
+from services.encoding import encode_sentiment_scores_array
+from services.instrumentation import SETTINGS, emit_event
+from services.transformation import (
+    SentimentWords,
+    score_token_store,
+    tokenize_text_values,
+)
+
+MIN_BATCH_SIZE = 16
+MAX_BATCH_SIZE = 4096
+# NOTE: batches grow or shrink so scoring one takes about this long
+TARGET_BATCH_SECONDS = 0.05
+# NOTE: the async api scores a batch at the latest this long after its
+# first review arrived, even if the batch is not full yet
+MAX_WAIT_SECONDS = 0.05
+QUEUE_SIZE = 1024
+LATENCY_WINDOW = 10_000
+
+
+class ScoredReview(NamedTuple):
+    product_id: str
+    score: float
+    encoded_score: str
+
+
+class BatchStats:
+    """Sizes and latencies of the scored batches
+    :param window: percentiles are computed over the latencies of this many
+        most recent batches, so a long running ingestion needs constant memory
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.batches = 0
+        self.reviews = 0
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+
+    def add(self, batch_size: int, latency: float) -> None:
+        self.batches += 1
+        self.reviews += batch_size
+        self.latencies.append(latency)
+        self.batch_sizes.append(batch_size)
+
+    def percentiles(self, percents: Tuple[int, ...] = (50, 90, 99)) -> dict:
+        if not self.latencies:
+            return {f"p{percent}": None for percent in percents}
+        values = np.percentile(np.fromiter(self.latencies, dtype="float64"), percents)
+        return {f"p{percent}": float(value) for percent, value in zip(percents, values)}
+
+    def summary(self) -> dict:
+        return {
+            "batches": self.batches,
+            "reviews": self.reviews,
+            "mean_batch_size": (
+                float(np.mean(self.batch_sizes)) if self.batch_sizes else None
+            ),
+            "latency_seconds": self.percentiles(),
+        }
+
+
+class BatchSizer:
+    """Adapts the batch size to the observed scoring time per review
+    :param min_size: smallest batch, also the size of the first batch
+    :param max_size: largest batch
+    :param target_seconds: scoring time a batch should take
+    """
+
+    def __init__(
+        self,
+        min_size: int = MIN_BATCH_SIZE,
+        max_size: int = MAX_BATCH_SIZE,
+        target_seconds: float = TARGET_BATCH_SECONDS,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.size = min_size
+
+    def update(self, batch_size: int, seconds: float) -> int:
+        seconds_per_review = seconds / batch_size if batch_size else 0.0
+        if seconds_per_review > 0:
+            # NOTE: grow at most twofold per batch, a single fast batch of
+            # short texts should not blow up the latency of the next one
+            size = min(self.target_seconds / seconds_per_review, 2 * self.size)
+        else:
+            size = 2 * self.size
+        self.size = int(min(max(size, self.min_size), self.max_size))
+        return self.size
+
+
+Record = Union[dict, Tuple[str, str]]
+
+
+def get_record_fields(record: Record) -> Tuple[str, str]:
+    if isinstance(record, dict):
+        product_id, text = record["product_id"], record["text"]
+    else:
+        product_id, text = record[0], record[1]
+    return str(product_id), "" if text is None else str(text)
+
+
+def score_batch(
+    records: List[Record], sentiment_words: SentimentWords
+) -> List[ScoredReview]:
+    # NOTE: the batch path on a frame of one batch, scores do not depend on
+    # which other reviews share the batch
+    df = pd.DataFrame(
+        [get_record_fields(record) for record in records],
+        columns=["product_id", "text"],
+    )
+    df = clean_text_values(df)
+    token_store = tokenize_text_values(df)
+    scores = score_token_store(token_store, sentiment_words)
+    encoded_scores = encode_sentiment_scores_array(scores)
+    return [
+        ScoredReview(product_id, float(score), str(encoded_score))
+        for product_id, score, encoded_score in zip(
+            df.product_id, scores, encoded_scores
+        )
+    ]
+
+
+def record_batch(
+    stats: BatchStats, batch_size: int, latency: float, scoring_seconds: float
+) -> None:
+    stats.add(batch_size, latency)
+    if SETTINGS["enabled"]:
+        emit_event(
+            {
+                "event": "batch",
+                "function": f"{__name__}.score_batch",
+                "timestamp": time.time(),
+                "batch_size": batch_size,
+                "latency_seconds": latency,
+                "scoring_seconds": scoring_seconds,
+            }
+        )
+
+
+def score_reviews(
+    records: Iterable[Record],
+    sentiment_words: SentimentWords,
+    min_batch_size: int = MIN_BATCH_SIZE,
+    max_batch_size: int = MAX_BATCH_SIZE,
+    target_batch_seconds: float = TARGET_BATCH_SECONDS,
+    stats: BatchStats = None,
+) -> Iterator[ScoredReview]:
+    """Scores reviews as they are pulled from records, in input order
+    :param records: dicts with product_id and text or (product_id, text, ...)
+        tuples, e.g. the messages of an ingest queue
+    :param sentiment_words: the sentiment lexicon
+    :param stats: collects batch sizes and latencies if given, the latency of
+        a batch runs from pulling its first record until it is scored
+    """
+    stats = stats if stats is not None else BatchStats()
+    sizer = BatchSizer(min_batch_size, max_batch_size, target_batch_seconds)
+    records = iter(records)
+    # NOTE: at most one batch is held, the next records are only pulled once
+    # the consumer took all results of the current batch
+    while True:
+        batch_start = time.perf_counter()
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= sizer.size:
+                break
+        if not batch:
+            break
+        scoring_start = time.perf_counter()
+        results = score_batch(batch, sentiment_words)
+        scoring_seconds = time.perf_counter() - scoring_start
+        record_batch(
+            stats, len(batch), time.perf_counter() - batch_start, scoring_seconds
+        )
+        sizer.update(len(batch), scoring_seconds)
+        yield from results
+    logging.info(f"Scored reviews: {stats.summary()}")
+
+
+async def put_records(
+    records: Union[AsyncIterable[Record], Iterable[Record]], queue: asyncio.Queue
+) -> None:
+    # NOTE: put waits while the queue is full, a slow consumer stops the
+    # producer instead of growing the queue
+    try:
+        if hasattr(records, "__aiter__"):
+            async for record in records:
+                await queue.put((record, time.perf_counter()))
+        else:
+            for record in records:
+                await queue.put((record, time.perf_counter()))
+    except asyncio.CancelledError:
+        raise
+    except Exception as error:
+        # NOTE: the consumer re-raises the error of the records iterable
+        await queue.put(error)
+        return
+    await queue.put(None)
+
+
+async def score_reviews_async(
+    records: Union[AsyncIterable[Record], Iterable[Record]],
+    sentiment_words: SentimentWords,
+    min_batch_size: int = MIN_BATCH_SIZE,
+    max_batch_size: int = MAX_BATCH_SIZE,
+    target_batch_seconds: float = TARGET_BATCH_SECONDS,
+    max_wait_seconds: float = MAX_WAIT_SECONDS,
+    queue_size: int = QUEUE_SIZE,
+    executor: Executor = None,
+    stats: BatchStats = None,
+) -> AsyncIterator[ScoredReview]:
+    """Async counterpart of score_reviews with a bounded queue
+    :param records: an async iterable or iterable of records, consumed by a
+        producer task into a queue of at most queue_size records
+    :param max_wait_seconds: a batch is scored once it is full or its first
+        record waited this long
+    :param executor: scoring runs in this executor, the default executor of
+        the loop if not given, so the event loop keeps serving the producer
+    :param stats: collects batch sizes and latencies if given, the latency of
+        a batch runs from queueing its first record until it is scored
+    """
+    stats = stats if stats is not None else BatchStats()
+    sizer = BatchSizer(min_batch_size, max_batch_size, target_batch_seconds)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    producer = asyncio.ensure_future(put_records(records, queue))
+    finished = False
+    try:
+        while not finished:
+            item = await queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if item is None:
+                break
+            batch, batch_start = [item[0]], item[1]
+            deadline = batch_start + max_wait_seconds
+            while len(batch) < sizer.size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    if timeout > 0:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    else:
+                        item = queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if item is None:
+                    finished = True
+                    break
+                batch.append(item[0])
+
+            scoring_start = time.perf_counter()
+            results = await loop.run_in_executor(
+                executor, score_batch, batch, sentiment_words
+            )
+            scoring_seconds = time.perf_counter() - scoring_start
+            record_batch(
+                stats, len(batch), time.perf_counter() - batch_start, scoring_seconds
+            )
+            sizer.update(len(batch), scoring_seconds)
+            for result in results:
+                yield result
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+    logging.info(f"Scored reviews: {stats.summary()}")
@@ -0,0 +1,183 @@
+# standard library imports
+import atexit
+import cProfile
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+PROFILE_FOLDER = "out/profiles"
+
+# NOTE: instrumented functions only read SETTINGS["enabled"] while disabled,
+# everything else is looked up when an event is emitted
+SETTINGS = {
+    "enabled": False,
+    "sink": None,
+    "profile_stage": None,
+    "profile_folder": PROFILE_FOLDER,
+}
+SINK_LOCK = threading.Lock()
+
+
+def get_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # NOTE: no procfs on macOS, fall back to the peak resident size
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_row_count(value) -> Optional[int]:
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray, list)):
+        return len(value)
+    # NOTE: TokenStore
+    if hasattr(value, "review_count"):
+        return value.review_count
+    return None
+
+
+def get_input_row_count(args: tuple, kwargs: dict) -> Optional[int]:
+    for value in (*args, *kwargs.values()):
+        row_count = get_row_count(value)
+        if row_count is not None:
+            return row_count
+    return None
+
+
+def log_event(event: dict) -> None:
+    logging.info(json.dumps(event))
+
+
+class EventsFile:
+    """Sink that appends one json event per line to filename
+    :param filename: opened in append mode by every process that writes to
+        it, a worker reopens it instead of sharing the handle of its parent
+    """
+
+    def __init__(self, filename: Path):
+        self.filename = Path(filename)
+        self.events_file = None
+        self.pid = None
+        # NOTE: once per sink and process, not per reopen, close only closes
+        # the handle opened by the exiting process
+        atexit.register(self.close)
+
+    def __getstate__(self) -> dict:
+        return {"filename": self.filename}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["filename"])
+
+    def open(self) -> None:
+        os.makedirs(self.filename.parent, exist_ok=True)
+        self.events_file = open(self.filename, "a")
+        self.pid = os.getpid()
+
+    def close(self) -> None:
+        # NOTE: a forked child only closes its own handle, not the inherited one
+        if self.events_file is not None and self.pid == os.getpid():
+            self.events_file.close()
+        self.events_file = None
+
+    def __call__(self, event: dict) -> None:
+        if self.events_file is None or self.pid != os.getpid():
+            self.open()
+        self.events_file.write(json.dumps(event) + "\n")
+        # NOTE: pool workers may exit without running atexit handlers
+        self.events_file.flush()
+
+
+def write_events_to(filename: Path) -> EventsFile:
+    return EventsFile(filename)
+
+
+def emit_event(event: dict) -> None:
+    sink = SETTINGS["sink"] or log_event
+    with SINK_LOCK:
+        sink(event)
+
+
+def enable_instrumentation(
+    sink: Callable[[dict], None] = None,
+    profile_stage: str = None,
+    profile_folder: str = PROFILE_FOLDER,
+) -> None:
+    SETTINGS.update(
+        enabled=True,
+        sink=sink,
+        profile_stage=profile_stage,
+        profile_folder=profile_folder,
+    )
+
+
+def disable_instrumentation() -> None:
+    if isinstance(SETTINGS["sink"], EventsFile):
+        SETTINGS["sink"].close()
+    SETTINGS.update(enabled=False, sink=None, profile_stage=None)
+
+
+def is_profiled(func: Callable, name: str) -> bool:
+    profile_stage = SETTINGS["profile_stage"]
+    return profile_stage is not None and profile_stage in (name, func.__name__)
+
+
+def call_instrumented(func: Callable, name: str, args: tuple, kwargs: dict):
+    rows_in = get_input_row_count(args, kwargs)
+    profile = cProfile.Profile() if is_profiled(func, name) else None
+    rss_before = get_rss_bytes()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    if profile is None:
+        result = func(*args, **kwargs)
+    else:
+        result = profile.runcall(func, *args, **kwargs)
+    wall_seconds = time.perf_counter() - wall_start
+    cpu_seconds = time.process_time() - cpu_start
+    rss_delta = get_rss_bytes() - rss_before
+
+    rows_out = get_row_count(result)
+    rows = rows_in if rows_in is not None else rows_out
+    event = {
+        "event": "call",
+        "function": name,
+        "timestamp": time.time(),
+        "pid": os.getpid(),
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": cpu_seconds,
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "rows_per_second": rows / wall_seconds if rows and wall_seconds else None,
+        "rss_delta_mb": rss_delta / 2**20,
+    }
+    if profile is not None:
+        profile_path = Path(SETTINGS["profile_folder"], f"{name}.{os.getpid()}.prof")
+        os.makedirs(profile_path.parent, exist_ok=True)
+        profile.dump_stats(profile_path)
+        event["profile"] = str(profile_path)
+    emit_event(event)
+    return result
+
+
+def instrumented(func: Callable) -> Callable:
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not SETTINGS["enabled"]:
+            return func(*args, **kwargs)
+        return call_instrumented(func, name, args, kwargs)
+
+    return wrapper
@@ -0,0 +1,331 @@
+# standard library imports
+import hashlib
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# third party imports
+import numpy as np
+
+
+class Lexicon:
+    """An immutable set of words with O(1) membership and batch filtering
+    :param words: the words of the lexicon, duplicates are dropped
+    :param with_token_ids: additionally map every word to an integer id,
+        ids follow the sorted order of the words
+    """
+
+    __slots__ = ("words", "token_ids")
+
+    def __init__(self, words: Iterable[str], with_token_ids: bool = False):
+        self.words = frozenset(sys.intern(word) for word in words)
+        self.token_ids: Optional[Dict[str, int]] = None
+        if with_token_ids:
+            self.token_ids = {word: i for i, word in enumerate(sorted(self.words))}
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.words
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.words)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __repr__(self) -> str:
+        return f"Lexicon({len(self.words)} words)"
+
+    def difference(self, other: Iterable[str]) -> "Lexicon":
+        return Lexicon(self.words.difference(other), self.token_ids is not None)
+
+    def union(self, other: Iterable[str]) -> "Lexicon":
+        return Lexicon(self.words.union(other), self.token_ids is not None)
+
+    def filter(self, words: Iterable[str]) -> List[str]:
+        words_set = self.words
+        return [word for word in words if word in words_set]
+
+    def filter_batches(self, batches: Iterable[Iterable[str]]) -> List[List[str]]:
+        words_set = self.words
+        return [[word for word in words if word in words_set] for words in batches]
+
+    def encode(self, words: Iterable[str]) -> List[int]:
+        if self.token_ids is None:
+            raise ValueError("Lexicon was built without token ids")
+        token_ids = self.token_ids
+        return [token_ids[word] for word in words if word in token_ids]
+
+
+class SentimentLexicon:
+    """Sentiment scores as a sorted word array and an aligned score array
+    :param words: sorted unicode array of the scored words
+    :param scores: float array, scores[i] belongs to words[i]
+    :param cache_dir: folder the arrays were memory mapped from, if set the
+        lexicon is pickled as this path and re-attached by the receiver
+    """
+
+    __slots__ = ("words", "scores", "cache_dir")
+
+    def __init__(self, words: np.ndarray, scores: np.ndarray, cache_dir: Path = None):
+        self.words = words
+        self.scores = scores
+        self.cache_dir = cache_dir
+
+    @classmethod
+    def from_cache(cls, cache_dir: Path) -> "SentimentLexicon":
+        words = np.load(Path(cache_dir).joinpath("words.npy"), mmap_mode="r")
+        scores = np.load(Path(cache_dir).joinpath("scores.npy"), mmap_mode="r")
+        return cls(words, scores, cache_dir)
+
+    def __reduce__(self):
+        if self.cache_dir is not None:
+            return (SentimentLexicon.from_cache, (self.cache_dir,))
+        return (SentimentLexicon, (np.asarray(self.words), np.asarray(self.scores)))
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __repr__(self) -> str:
+        return f"SentimentLexicon({len(self.words)} words)"
+
+    def find(self, tokens: Sequence[str]) -> (np.ndarray, np.ndarray):
+        tokens = np.asarray(tokens, dtype=str)
+        if not len(self.words) or not len(tokens):
+            return np.zeros(len(tokens), dtype="int64"), np.zeros(len(tokens), bool)
+        positions = np.searchsorted(self.words, tokens)
+        positions[positions == len(self.words)] = 0
+        found = self.words[positions] == tokens
+        return positions, found
+
+    def lookup(self, tokens: Sequence[str]) -> np.ndarray:
+        positions, found = self.find(tokens)
+        if not found.any():
+            return np.zeros(len(found), dtype="float64")
+        return np.where(found, self.scores[positions], 0.0)
+
+
+def as_lexicon(words: Iterable[str]) -> Lexicon:
+    if isinstance(words, Lexicon):
+        return words
+    return Lexicon(words)
+
+
+COMPOUND_MIN_HEAD_LENGTH = 4
+COMPOUND_MIN_MODIFIER_LENGTH = 4
+# NOTE: suffixes that are words as well, "passende" is not a compound of
+# "ende" and "vorteilhaft" not one of "haft"
+COMPOUND_EXCLUDED_HEADS = ("ende", "endem", "enden", "ender", "endes", "haft")
+# NOTE: particles of separable verbs, "ausgesucht" is no compound of "sucht"
+COMPOUND_PARTICLES = ("auf", "aus", "ein", "nach", "vor", "weg", "zurueck")
+COMPOUND_EXCLUDED_MODIFIERS = (
+    *COMPOUND_PARTICLES,
+    *(f"{particle}ge" for particle in COMPOUND_PARTICLES),
+)
+COMPOUND_MEMO_SIZE = 1_000_000
+# NOTE: key of the head that ends at a trie node, no character is empty
+TRIE_HEAD = ""
+
+
+class CompoundMatcher:
+    """Finds the head of a German compound, the longest known word it ends in
+    :param heads: the words a compound may end in, e.g. all SentiWS base
+        forms and inflections, the lexicons decide which heads they contain
+    :param min_head_length: shorter heads are not matched, "mut" would
+        otherwise turn "armut" positive
+    :param min_modifier_length: shortest part in front of the head, shorter
+        parts are mostly verb prefixes like "emp" in "empfehle"
+    :param excluded_heads: suffixes that are words, but no heads
+    :param excluded_modifiers: prefixes that do not form compounds
+    """
+
+    __slots__ = (
+        "heads",
+        "min_head_length",
+        "min_modifier_length",
+        "excluded_modifiers",
+        "trie",
+        "memo",
+    )
+
+    def __init__(
+        self,
+        heads: Iterable[str],
+        min_head_length: int = COMPOUND_MIN_HEAD_LENGTH,
+        min_modifier_length: int = COMPOUND_MIN_MODIFIER_LENGTH,
+        excluded_heads: Iterable[str] = COMPOUND_EXCLUDED_HEADS,
+        excluded_modifiers: Iterable[str] = COMPOUND_EXCLUDED_MODIFIERS,
+    ):
+        self.heads = frozenset(heads).difference(excluded_heads)
+        self.min_head_length = min_head_length
+        self.min_modifier_length = min_modifier_length
+        self.excluded_modifiers = frozenset(excluded_modifiers)
+        # NOTE: a trie of the reversed heads, one walk from the last character
+        # of a token finds every head the token ends in
+        self.trie = {}
+        for head in self.heads:
+            if len(head) < min_head_length:
+                continue
+            node = self.trie
+            for char in reversed(head):
+                node = node.setdefault(char, {})
+            node[TRIE_HEAD] = sys.intern(head)
+        # NOTE: head or None per token, repeated tokens cost one dict lookup
+        self.memo: Dict[str, Optional[str]] = {}
+
+    def __reduce__(self):
+        # NOTE: the memo is not sent to worker processes
+        return (
+            CompoundMatcher,
+            (
+                sorted(self.heads),
+                self.min_head_length,
+                self.min_modifier_length,
+                (),
+                sorted(self.excluded_modifiers),
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.heads)
+
+    def __repr__(self) -> str:
+        return f"CompoundMatcher({len(self.heads)} heads)"
+
+    def find_head(self, token: str) -> Optional[str]:
+        # NOTE: the longest head wins, e.g. "kleid" over "leid"
+        node, head = self.trie, None
+        for start in range(len(token) - 1, self.min_modifier_length - 1, -1):
+            node = node.get(token[start])
+            if node is None:
+                break
+            if TRIE_HEAD in node and token[:start] not in self.excluded_modifiers:
+                head = node[TRIE_HEAD]
+        return head
+
+    def match(self, token: str) -> Optional[str]:
+        try:
+            return self.memo[token]
+        except KeyError:
+            if len(self.memo) >= COMPOUND_MEMO_SIZE:
+                self.memo.clear()
+            head = self.memo[token] = self.find_head(token)
+            return head
+
+    def decompose(self, token: str) -> Optional[Tuple[str, str]]:
+        head = self.match(token)
+        if head is None:
+            return None
+        return token[: -len(head)], head
+
+    def get_digest(self) -> str:
+        sha256 = hashlib.sha256()
+        sha256.update(f"{self.min_head_length}:{self.min_modifier_length}".encode())
+        sha256.update("\n".join(sorted(self.heads)).encode("utf-8"))
+        sha256.update("\n".join(sorted(self.excluded_modifiers)).encode("utf-8"))
+        return sha256.hexdigest()
+
+
+class CompoundLexicon(Lexicon):
+    """A Lexicon that also contains the compounds whose head it contains
+    :param words: the words contained as they are and the heads
+    :param matcher: finds the head of a compound
+    :param excluded: never contained, not even as compound, e.g. stopwords
+    """
+
+    __slots__ = ("matcher", "excluded")
+
+    def __init__(
+        self,
+        words: Iterable[str],
+        matcher: CompoundMatcher,
+        excluded: Iterable[str] = (),
+    ):
+        super().__init__(words)
+        self.matcher = matcher
+        self.excluded = frozenset(excluded)
+
+    def __contains__(self, word: str) -> bool:
+        if word in self.words:
+            return True
+        if word in self.excluded:
+            return False
+        return self.matcher.match(word) in self.words
+
+    def __repr__(self) -> str:
+        return f"CompoundLexicon({len(self.words)} words, {len(self.matcher)} heads)"
+
+    def difference(self, other: Iterable[str]) -> "CompoundLexicon":
+        other = frozenset(other)
+        return CompoundLexicon(
+            self.words.difference(other), self.matcher, self.excluded.union(other)
+        )
+
+    def union(self, other: Iterable[str]) -> "CompoundLexicon":
+        return CompoundLexicon(self.words.union(other), self.matcher, self.excluded)
+
+    def filter(self, words: Iterable[str]) -> List[str]:
+        return [word for word in words if word in self]
+
+    def filter_batches(self, batches: Iterable[Iterable[str]]) -> List[List[str]]:
+        return [[word for word in words if word in self] for words in batches]
+
+
+class CompoundSentimentLexicon(SentimentLexicon):
+    """A SentimentLexicon that scores a compound by the score of its head
+    :param matcher: finds the head of tokens missing from the lexicon
+    :param excluded: never scored as compound, e.g. "vielleicht" is no
+        compound of "leicht"
+    """
+
+    __slots__ = ("matcher", "excluded")
+
+    def __init__(
+        self,
+        words: np.ndarray,
+        scores: np.ndarray,
+        cache_dir: Path = None,
+        matcher: CompoundMatcher = None,
+        excluded: Iterable[str] = (),
+    ):
+        super().__init__(words, scores, cache_dir)
+        self.matcher = matcher
+        self.excluded = frozenset(excluded)
+
+    @classmethod
+    def from_lexicon(
+        cls,
+        lexicon: SentimentLexicon,
+        matcher: CompoundMatcher,
+        excluded: Iterable[str] = (),
+    ) -> "CompoundSentimentLexicon":
+        return cls(lexicon.words, lexicon.scores, lexicon.cache_dir, matcher, excluded)
+
+    def __reduce__(self):
+        lexicon = SentimentLexicon(self.words, self.scores, self.cache_dir)
+        return (
+            CompoundSentimentLexicon.from_lexicon,
+            (lexicon, self.matcher, self.excluded),
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"CompoundSentimentLexicon({len(self.words)} words, "
+            f"{len(self.matcher)} heads)"
+        )
+
+    def lookup(self, tokens: Sequence[str]) -> np.ndarray:
+        tokens = list(tokens)
+        positions, found = self.find(tokens)
+        scores = np.zeros(len(tokens), dtype="float64")
+        scores[found] = self.scores[positions[found]]
+        missing, heads = [], []
+        for i in np.flatnonzero(~found).tolist():
+            if tokens[i] in self.excluded:
+                continue
+            head = self.matcher.match(tokens[i])
+            if head is not None:
+                missing.append(i)
+                heads.append(head)
+        if heads:
+            scores[missing] = super().lookup(heads)
+        return scores
@@ -0,0 +1,277 @@
+# standard library imports
+import hashlib
+import json
+import logging
+import os
+from typing import List, NamedTuple
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+# local services imports
+from services.cleaning import clean_text_values
+from services.encoding import encode_sentiment_scores_array
+from services.instrumentation import instrumented
+from services.lexicon import (
+    CompoundLexicon,
+    CompoundSentimentLexicon,
+    Lexicon,
+    SentimentLexicon,
+    as_lexicon,
+)
+from services.transformation import (
+    SentimentWords,
+    TokenStore,
+    build_score_table,
+    filter_token_store,
+    score_token_store,
+    tokenize_text_values,
+)
+from services.utilities import get_input_file
+
+REVIEW_STORE_FOLDER = "resources/cache/review_store"
+REVIEW_STORE_VERSION = 1
+RESULT_COLUMNS = ["cleaned_text", "token_ids", "score", "filtered"]
+
+
+class ReviewStore(NamedTuple):
+    """Per-review results of earlier runs
+    :param results: cleaned_text, token_ids, score and filtered words per
+        review, indexed by the content key of (product_id, text, rating)
+    :param vocabulary: the words the stored token ids point to
+    :param lexicon_version: version of the lexicons score and filtered were
+        computed with
+    """
+
+    results: pd.DataFrame
+    vocabulary: List[str]
+    lexicon_version: str
+
+
+class StoreStats(NamedTuple):
+    hits: int
+    misses: int
+    rescored: int
+    pruned: int
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def get_key_ratings(ratings: pd.Series) -> np.ndarray:
+    # NOTE: ratings are int8 or float if a rating of the input is missing,
+    # the keys use the integer rating and -1 for a missing one either way
+    ratings = ratings.to_numpy(dtype="float64")
+    return np.where(np.isnan(ratings), -1, ratings).astype("int64")
+
+
+def get_review_keys(df: pd.DataFrame) -> pd.Index:
+    keys = [
+        hashlib.blake2b(
+            f"{product_id}\x00{text}\x00{rating}".encode("utf-8", "surrogatepass"),
+            digest_size=16,
+        ).hexdigest()
+        for product_id, text, rating in zip(
+            df.product_id, df.text, get_key_ratings(df.rating)
+        )
+    ]
+    return pd.Index(keys, name="key")
+
+
+def get_lexicon_version(
+    sentiment_words: SentimentWords, stopwords: Lexicon, nouns: Lexicon
+) -> str:
+    sha256 = hashlib.sha256()
+    if isinstance(sentiment_words, SentimentLexicon):
+        sha256.update(np.asarray(sentiment_words.words).tobytes())
+        sha256.update(np.asarray(sentiment_words.scores).tobytes())
+    else:
+        score_table = build_score_table(sentiment_words).sort_index()
+        sha256.update(json.dumps(list(score_table.items())).encode("utf-8"))
+    kept_words = as_lexicon(nouns).difference(as_lexicon(stopwords))
+    sha256.update("\n".join(sorted(kept_words)).encode("utf-8"))
+    # NOTE: compound matching changes scores and filtered words as well
+    for lexicon in (sentiment_words, kept_words):
+        if isinstance(lexicon, (CompoundSentimentLexicon, CompoundLexicon)):
+            sha256.update(lexicon.matcher.get_digest().encode("utf-8"))
+            sha256.update("\n".join(sorted(lexicon.excluded)).encode("utf-8"))
+    return sha256.hexdigest()
+
+
+def empty_review_store(lexicon_version: str = "") -> ReviewStore:
+    results = pd.DataFrame(
+        {
+            col: pd.Series(dtype="float64" if col == "score" else object)
+            for col in RESULT_COLUMNS
+        },
+        index=pd.Index([], name="key", dtype=object),
+    )
+    return ReviewStore(results, [], lexicon_version)
+
+
+@instrumented
+def load_review_store(folder: str = REVIEW_STORE_FOLDER) -> ReviewStore:
+    store_dir = get_input_file(folder, "")
+    manifest_path = store_dir.joinpath("manifest.json")
+    if not os.path.exists(manifest_path):
+        return empty_review_store()
+    with open(manifest_path, "r") as json_file:
+        manifest = json.load(json_file)
+    if manifest.get("version") != REVIEW_STORE_VERSION:
+        return empty_review_store()
+    results = pd.read_pickle(store_dir.joinpath("results.pkl"))
+    return ReviewStore(results, manifest["vocabulary"], manifest["lexicon_version"])
+
+
+@instrumented
+def save_review_store(store: ReviewStore, folder: str = REVIEW_STORE_FOLDER) -> None:
+    store_dir = get_input_file(folder, "")
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_path = store_dir.joinpath(f"results.{os.getpid()}.tmp")
+    store.results.to_pickle(tmp_path)
+    os.replace(tmp_path, store_dir.joinpath("results.pkl"))
+    manifest = {
+        "version": REVIEW_STORE_VERSION,
+        "lexicon_version": store.lexicon_version,
+        "vocabulary": store.vocabulary,
+    }
+    tmp_path = store_dir.joinpath(f"manifest.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as json_file:
+        json.dump(manifest, json_file)
+    os.replace(tmp_path, store_dir.joinpath("manifest.json"))
+
+
+def split_token_ids(token_store: TokenStore, token_ids: np.ndarray) -> list:
+    if not token_store.review_count:
+        return []
+    return np.split(token_ids, token_store.offsets[1:-1])
+
+
+def get_token_store_from_results(results: pd.DataFrame, vocabulary: list) -> TokenStore:
+    lengths = results.token_ids.map(len).to_numpy()
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype("int64")
+    token_ids = np.concatenate([np.zeros(0, dtype="int32"), *results.token_ids])
+    return TokenStore(
+        token_ids.astype("int32"),
+        offsets,
+        np.asarray(vocabulary, dtype=object),
+        results.index,
+    )
+
+
+def process_reviews(
+    df: pd.DataFrame,
+    vocabulary: list,
+    sentiment_words: SentimentWords,
+    stopwords: Lexicon,
+    nouns: Lexicon,
+) -> pd.DataFrame:
+    df = clean_text_values(df)
+    token_store = tokenize_text_values(df)
+    # NOTE: local token ids are translated into the ids of the store, new
+    # words are appended to its vocabulary
+    word_ids = {word: i for i, word in enumerate(vocabulary)}
+    mapping = np.empty(len(token_store.vocabulary), dtype="int32")
+    for i, word in enumerate(token_store.vocabulary):
+        if word not in word_ids:
+            word_ids[word] = len(vocabulary)
+            vocabulary.append(word)
+        mapping[i] = word_ids[word]
+    token_ids = split_token_ids(token_store, mapping[token_store.token_ids])
+    results = pd.DataFrame(
+        {
+            "cleaned_text": df.text.to_numpy(),
+            "token_ids": pd.Series(token_ids, dtype=object).to_numpy(),
+            "score": score_token_store(token_store, sentiment_words),
+            "filtered": filter_token_store(token_store, stopwords, nouns).token_lists(),
+        },
+        index=df.index,
+    )
+    return results
+
+
+def rescore_results(
+    results: pd.DataFrame,
+    vocabulary: list,
+    sentiment_words: SentimentWords,
+    stopwords: Lexicon,
+    nouns: Lexicon,
+) -> pd.DataFrame:
+    token_store = get_token_store_from_results(results, vocabulary)
+    results = results.copy()
+    results["score"] = score_token_store(token_store, sentiment_words)
+    results["filtered"] = filter_token_store(
+        token_store, stopwords, nouns
+    ).token_lists()
+    return results
+
+
+@instrumented
+def update_review_store(
+    store: ReviewStore,
+    df: pd.DataFrame,
+    sentiment_words: SentimentWords,
+    stopwords: Lexicon,
+    nouns: Lexicon,
+) -> (ReviewStore, pd.DataFrame, StoreStats):
+    lexicon_version = get_lexicon_version(sentiment_words, stopwords, nouns)
+    keys = get_review_keys(df)
+    known = keys.isin(store.results.index)
+    missing = ~known & ~keys.duplicated()
+    results = store.results
+    rescored = 0
+    if store.lexicon_version != lexicon_version:
+        # NOTE: cleaned text and tokens do not depend on the lexicons, only
+        # scores and filtered words of this export's reviews are recomputed
+        # from the stored token ids, all other stored reviews are dropped
+        results = rescore_results(
+            results.loc[keys[known].unique()],
+            store.vocabulary,
+            sentiment_words,
+            stopwords,
+            nouns,
+        )
+        rescored = len(results)
+
+    vocabulary = list(store.vocabulary)
+    new_results = process_reviews(
+        df[missing], vocabulary, sentiment_words, stopwords, nouns
+    )
+    new_results.index = keys[missing]
+    results = pd.concat([results, new_results])
+    # NOTE: reviews that are not part of this input anymore are pruned, the
+    # saved store only grows with the input
+    current = results.index.isin(keys)
+    pruned = int((~current).sum())
+    results = results[current]
+    store = ReviewStore(results, vocabulary, lexicon_version)
+
+    review_results = results.loc[keys]
+    review_results_df = pd.DataFrame(
+        {
+            "product_id": df.product_id.to_numpy(),
+            "text": review_results.cleaned_text.to_numpy(),
+            "rating": df.rating.to_numpy(),
+            "score": review_results.score.to_numpy(),
+            "encoded_score": encode_sentiment_scores_array(
+                review_results.score.to_numpy(dtype="float64")
+            ),
+            "filtered": review_results.filtered.to_numpy(),
+        },
+        index=df.index,
+    )
+    stats = StoreStats(
+        hits=int(known.sum()),
+        misses=int((~known).sum()),
+        rescored=rescored,
+        pruned=pruned,
+    )
+    logging.info(
+        f"Review store: {stats.hits} hits, {stats.misses} misses "
+        f"({stats.hit_ratio:.1%} hit ratio), {stats.rescored} rescored, "
+        f"{stats.pruned} pruned"
+    )
+    return store, review_results_df, stats
@@ -1,16 +1,36 @@
 # standard library imports
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor as Executor
 from pathlib import Path
+from typing import Any, NamedTuple, Sequence
 
 # third party imports
-import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
-from wordcloud import WordCloud
+
+# local services imports
+from services.instrumentation import instrumented
+from services.utilities import get_input_file
 
 
 def plot_pie_chart(series: pd.Series, output_path: Path, title: str) -> None:
-    labels = series.value_counts().index
-    sizes = series.value_counts().values
+    plot_pie_chart_from_counts(series.value_counts(), output_path, title)
+
+
+def plot_pie_chart_from_counts(
+    counts: pd.Series, output_path: Path, title: str
+) -> None:
+    # NOTE: the plotting libraries are imported on the first rendered chart,
+    # importing them takes longer than computing all stats
+    import matplotlib.pyplot as plt
+
+    labels = counts.index
+    sizes = counts.values
     fig1, ax1 = plt.subplots()
     ax1.pie(sizes, labels=labels, autopct="%1.1f%%", shadow=True, startangle=90)
     ax1.axis("equal")
@@ -29,25 +49,133 @@ def plot_histogram(data: pd.DataFrame, config: dict, output_path: Path) -> None:
         title = config.get("title", "")
     else:
         raise ValueError("No plotting config provided")
-    sns.set()
-    _ = plt.figure(figsize=(10, 6))
-    _ = plt.xticks(rotation=45, fontsize=12)
-    _ = plt.xlabel(x_label, fontsize=20)
-    _ = plt.ylabel(y_label, fontsize=20)
-    _ = plt.title(title, fontsize=30)
-    _ = sns.barplot(x_value, y=y_value, data=data)
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=300, orientation="landscape")
-    plt.close()
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # NOTE: the seaborn theme is restored afterwards, otherwise every chart
+    # rendered later in the same process would depend on the plotting order
+    with plt.rc_context():
+        sns.set()
+        _ = plt.figure(figsize=(10, 6))
+        _ = plt.xticks(rotation=45, fontsize=12)
+        _ = plt.xlabel(x_label, fontsize=20)
+        _ = plt.ylabel(y_label, fontsize=20)
+        _ = plt.title(title, fontsize=30)
+        _ = sns.barplot(x_value, y=y_value, data=data)
+        plt.tight_layout()
+        plt.savefig(output_path, dpi=300, orientation="landscape")
+        plt.close()
 
 
-def plot_wordcloud(data: list, output_path: Path) -> None:
+def plot_wordcloud(frequencies: dict, output_path: Path) -> None:
+    import matplotlib.pyplot as plt
+    from wordcloud import WordCloud
+
     wordcloud = WordCloud(
         width=1600, height=800, background_color="white", collocations=False
-    ).generate_from_text(" ".join(data))
+    ).generate_from_frequencies(frequencies)
     plt.figure(figsize=(20, 10))
     plt.imshow(wordcloud, interpolation="bilinear")
     plt.axis("off")
     plt.tight_layout(pad=0)
     wordcloud.to_file(output_path)
     plt.close()
+
+
+class PlotJob(NamedTuple):
+    """A chart to render
+    :param kind: one of PLOT_FUNCTIONS
+    :param data: value counts for a pie chart, the frame for a histogram or
+        the count per word for a wordcloud
+    :param output_path: where to save the png
+    :param title: title of a pie chart
+    :param config: plotting config of a histogram
+    """
+
+    kind: str
+    data: Any
+    output_path: Path
+    title: str = ""
+    config: dict = None
+
+
+PLOT_FUNCTIONS = {
+    "pie": lambda job: plot_pie_chart_from_counts(job.data, job.output_path, job.title),
+    "histogram": lambda job: plot_histogram(job.data, job.config, job.output_path),
+    "wordcloud": lambda job: plot_wordcloud(job.data, job.output_path),
+}
+PLOT_CACHE_FOLDER = "resources/cache"
+PLOT_CACHE_FILE = "plots.json"
+# NOTE: bump when a plotting function changes its output for the same data
+PLOT_CACHE_VERSION = 3
+
+
+def get_plot_digest(job: PlotJob) -> str:
+    sha256 = hashlib.sha256()
+    sha256.update(f"{PLOT_CACHE_VERSION}\x00{job.kind}\x00{job.title}".encode("utf-8"))
+    sha256.update(json.dumps(job.config, sort_keys=True).encode("utf-8"))
+    if isinstance(job.data, (pd.DataFrame, pd.Series)):
+        sha256.update(job.data.to_csv().encode("utf-8"))
+    else:
+        sha256.update(json.dumps(job.data).encode("utf-8"))
+    return sha256.hexdigest()
+
+
+def init_plot_worker() -> None:
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def render_plot(job: PlotJob) -> (str, float):
+    start = time.time()
+    PLOT_FUNCTIONS[job.kind](job)
+    return job.kind, time.time() - start
+
+
+@instrumented
+def render_plots(jobs: Sequence[PlotJob], workers: int = None) -> dict:
+    cache_path = get_input_file(PLOT_CACHE_FOLDER, PLOT_CACHE_FILE)
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as json_file:
+            cache = json.load(json_file)
+
+    # NOTE: a chart is only rendered if the data and config behind it changed
+    # since the png was written or the png does not exist anymore
+    digests = [get_plot_digest(job) for job in jobs]
+    pending = [
+        (job, digest)
+        for job, digest in zip(jobs, digests)
+        if cache.get(str(job.output_path)) != digest
+        or not os.path.exists(job.output_path)
+    ]
+
+    # NOTE: the initializer picks the backend of workers that do not fork,
+    # in process it is up to the caller, e.g. the command line
+    workers = workers or multiprocessing.cpu_count()
+    if workers > 1 and len(pending) > 1:
+        with Executor(max_workers=workers, initializer=init_plot_worker) as exe:
+            durations = list(exe.map(render_plot, [job for job, _ in pending]))
+    else:
+        durations = [render_plot(job) for job, _ in pending]
+
+    for job, digest in pending:
+        cache[str(job.output_path)] = digest
+    os.makedirs(cache_path.parent, exist_ok=True)
+    with open(cache_path, "w") as json_file:
+        json.dump(cache, json_file, indent=2, sort_keys=True)
+
+    seconds_per_kind = defaultdict(float)
+    for kind, duration in durations:
+        seconds_per_kind[kind] += duration
+    stats = {
+        "rendered": len(pending),
+        "reused": len(jobs) - len(pending),
+        "seconds_per_kind": dict(seconds_per_kind),
+    }
+    logging.info(
+        f"Plots: {stats['rendered']} rendered, {stats['reused']} reused, "
+        f"seconds per chart type {stats['seconds_per_kind']}"
+    )
+    return stats
@@ -0,0 +1,188 @@
+# standard library imports
+import logging
+from typing import Iterable, NamedTuple, Optional
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+# local services imports
+from services.instrumentation import instrumented
+
+DEFAULT_SAMPLE_SIZE = 200
+DEFAULT_CONFIDENCE = 0.95
+SAMPLE_SEED = 0
+# NOTE: two sided quantiles of the normal distribution, scipy is not a
+# dependency and statistics.NormalDist needs python 3.8
+Z_SCORES = {0.8: 1.2816, 0.9: 1.6449, 0.95: 1.9600, 0.99: 2.5758}
+
+
+class ReviewSample(NamedTuple):
+    """Reviews sampled uniformly per product in one pass over the input
+    :param df: at most sample_size reviews of every product, all reviews of
+        smaller products
+    :param population: reviews per product_id in the whole input
+    :param sample_size: reviews kept per product
+    """
+
+    df: pd.DataFrame
+    population: pd.Series
+    sample_size: int
+
+    @property
+    def sampled(self) -> pd.Series:
+        counts = self.df.groupby("product_id").size()
+        return counts.reindex(self.population.index, fill_value=0)
+
+
+def update_reservoirs(
+    reservoirs: Optional[pd.DataFrame],
+    population: pd.Series,
+    chunk: pd.DataFrame,
+    sample_size: int,
+    rng: np.random.Generator,
+) -> (pd.DataFrame, pd.Series):
+    # NOTE: algorithm R per product, the t-th review of a product takes slot
+    # t if t <= sample_size, otherwise a uniform slot below t if that is a
+    # slot of the reservoir. The draws do not depend on the reservoir, so a
+    # chunk is done at once and the last review per slot wins
+    # NOTE: reviews without a rating are sampled as well, they count toward
+    # the sentiment, the rating estimates skip them
+    product_ids = chunk.product_id.to_numpy(dtype=object)
+    codes, products = pd.factorize(product_ids)
+    seen = population.reindex(products, fill_value=0).to_numpy()
+    positions = seen[codes] + pd.Series(codes).groupby(codes).cumcount().to_numpy()
+    random_slots = (rng.random(len(positions)) * (positions + 1)).astype("int64")
+    slots = np.where(positions < sample_size, positions, random_slots)
+    kept = slots < sample_size
+    candidates = chunk[kept].assign(product_id=product_ids[kept], slot=slots[kept])
+    if reservoirs is not None:
+        candidates = pd.concat([reservoirs, candidates])
+    reservoirs = candidates.drop_duplicates(["product_id", "slot"], keep="last")
+    counts = pd.Series(np.bincount(codes), index=products)
+    population = population.add(counts, fill_value=0).astype("int64")
+    return reservoirs, population
+
+
+@instrumented
+def sample_reviews_per_product(
+    chunks: Iterable[pd.DataFrame],
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    seed: int = SAMPLE_SEED,
+) -> ReviewSample:
+    """Stratified reservoir sample of the reviews of chunks
+    :param chunks: e.g. load_data_chunks, only the reservoirs of at most
+        sample_size reviews per product are held besides the current chunk
+    """
+    rng = np.random.default_rng(seed)
+    reservoirs = None
+    population = pd.Series([], dtype="int64")
+    for chunk in chunks:
+        reservoirs, population = update_reservoirs(
+            reservoirs, population, chunk, sample_size, rng
+        )
+    if reservoirs is None:
+        reservoirs = pd.DataFrame(columns=["product_id", "text", "rating", "slot"])
+    df = reservoirs.sort_values(["product_id", "slot"], kind="stable")
+    df = df.drop(columns="slot").reset_index(drop=True)
+    df = df.astype({"product_id": "category"})
+    population = population.sort_index().rename_axis("product_id")
+    logging.info(
+        f"Sampled {len(df)} of {population.sum()} reviews, at most "
+        f"{sample_size} of each of {len(population)} products"
+    )
+    return ReviewSample(df, population, sample_size)
+
+
+def get_z_score(confidence: float) -> float:
+    if confidence not in Z_SCORES:
+        raise ValueError(
+            f"Unsupported confidence: {confidence}, use one of {sorted(Z_SCORES)}"
+        )
+    return Z_SCORES[confidence]
+
+
+def get_finite_population_corrections(sample: ReviewSample) -> pd.Series:
+    # NOTE: zero for products that were sampled completely, their numbers
+    # are exact
+    return 1 - sample.sampled / sample.population
+
+
+def estimate_average_rating_per_id(
+    sample: ReviewSample, confidence: float = DEFAULT_CONFIDENCE
+) -> pd.DataFrame:
+    """Mean rating per product with the normal confidence interval"""
+    ratings = sample.df.rating.astype("float64").groupby(sample.df.product_id)
+    stats = ratings.agg(["mean", "var", "count"])
+    stats = stats.reindex(sample.population.index)
+    corrections = get_finite_population_corrections(sample)
+    variances = (stats["var"] / stats["count"] * corrections).where(corrections > 0, 0)
+    margins = get_z_score(confidence) * np.sqrt(variances)
+    return pd.DataFrame(
+        {
+            "article": stats.index.to_numpy(),
+            "rating": round(stats["mean"], 2).to_numpy(),
+            "ci_low": round(stats["mean"] - margins, 2).to_numpy(),
+            "ci_high": round(stats["mean"] + margins, 2).to_numpy(),
+            "sampled": sample.sampled.to_numpy(),
+            "reviews": sample.population.to_numpy(),
+        }
+    )
+
+
+def estimate_counts(
+    sample: ReviewSample, values: pd.Series, confidence: float = DEFAULT_CONFIDENCE
+) -> pd.DataFrame:
+    """Reviews per value in the whole input, estimated from the shares of the
+    values in every product, the stratified estimator of a total
+    :param values: one value per review of the sample, e.g. the ratings
+    """
+    reviews_df = pd.DataFrame(
+        {"product_id": sample.df.product_id.to_numpy(), "value": values.to_numpy()}
+    )
+    counts = reviews_df.groupby(["product_id", "value"]).size().unstack(fill_value=0)
+    counts = counts.reindex(sample.population.index, fill_value=0)
+    sampled = sample.sampled.to_numpy()[:, None]
+    population = sample.population.to_numpy()[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(sampled > 0, counts.to_numpy() / sampled, 0)
+        corrections = get_finite_population_corrections(sample).to_numpy()[:, None]
+        variances = np.where(
+            corrections > 0,
+            population**2 * corrections * shares * (1 - shares) / (sampled - 1),
+            0,
+        )
+    estimates = (population * shares).sum(axis=0)
+    margins = get_z_score(confidence) * np.sqrt(np.nan_to_num(variances).sum(axis=0))
+    return pd.DataFrame(
+        {
+            "count": np.round(estimates).astype("int64"),
+            "ci_low": np.round(np.maximum(estimates - margins, 0)).astype("int64"),
+            "ci_high": np.round(estimates + margins).astype("int64"),
+        },
+        index=counts.columns,
+    )
+
+
+@instrumented
+def estimate_ratings_in_total(
+    sample: ReviewSample, confidence: float = DEFAULT_CONFIDENCE
+) -> pd.DataFrame:
+    counts = estimate_counts(sample, sample.df.rating, confidence)
+    counts = counts[counts["count"] > 0]
+    return counts.rename_axis("rating").reset_index()
+
+
+@instrumented
+def estimate_overall_sentiment(
+    sample: ReviewSample,
+    sentiment_df: pd.DataFrame,
+    confidence: float = DEFAULT_CONFIDENCE,
+) -> pd.DataFrame:
+    """Reviews per encoded sentiment
+    :param sentiment_df: the scores of the reviews of the sample
+    """
+    counts = estimate_counts(sample, sentiment_df.encoded_score, confidence)
+    counts = counts[counts["count"] > 0]
+    counts = counts.sort_values("count", ascending=False, kind="stable")
+    return counts.rename_axis("sentiment").reset_index()
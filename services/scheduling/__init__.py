@@ -0,0 +1,103 @@
+# standard library imports
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+# local services imports
+from services.instrumentation import SETTINGS, emit_event
+
+
+class Stage(NamedTuple):
+    """A node of the pipeline graph
+    :param func: called with the results of inputs as positional arguments
+    :param inputs: names of the stages or seeded values func depends on
+    """
+
+    func: Callable
+    inputs: Tuple[str, ...] = ()
+
+
+class Pipeline:
+    """Runs the subgraph of stages needed for the requested outputs
+    :param stages: stage per output name
+    :param executor: runs independent stages concurrently if given,
+        otherwise stages run one after another in the calling thread
+    :param values: seeded results, e.g. paths and flags the stages read
+    """
+
+    def __init__(
+        self, stages: Dict[str, Stage], executor: Executor = None, **values: Any
+    ):
+        self.stages = stages
+        self.executor = executor
+        # NOTE: results are memoized, a later run only executes stages whose
+        # output has not been computed yet
+        self.results: Dict[str, Any] = dict(values)
+
+    def get_required_stages(self, targets: Sequence[str]) -> List[str]:
+        required, visiting = [], set()
+
+        def visit(name: str) -> None:
+            if name in self.results or name in required:
+                return
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage or input: {name}")
+            if name in visiting:
+                raise ValueError(f"Cycle in pipeline at stage: {name}")
+            visiting.add(name)
+            for input_name in self.stages[name].inputs:
+                visit(input_name)
+            visiting.discard(name)
+            required.append(name)
+
+        for target in targets:
+            visit(target)
+        return required
+
+    def run_stage(self, name: str) -> Any:
+        stage = self.stages[name]
+        args = [self.results[input_name] for input_name in stage.inputs]
+        return stage.func(*args)
+
+    def run(self, targets: Sequence[str]) -> Dict[str, Any]:
+        pending = self.get_required_stages(targets)
+        if self.executor is None:
+            for name in pending:
+                start = time.time()
+                self.results[name] = self.run_stage(name)
+                log_stage(name, time.time() - start)
+        else:
+            self.run_concurrently(pending)
+        return {target: self.results[target] for target in targets}
+
+    def run_concurrently(self, pending: List[str]) -> None:
+        running = {}
+        while pending or running:
+            ready = [
+                name
+                for name in pending
+                if all(i in self.results for i in self.stages[name].inputs)
+            ]
+            for name in ready:
+                pending.remove(name)
+                future = self.executor.submit(self.run_stage, name)
+                running[future] = (name, time.time())
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, start = running.pop(future)
+                self.results[name] = future.result()
+                log_stage(name, time.time() - start)
+
+
+def log_stage(name: str, duration: float) -> None:
+    logging.info(f"stage {name} finished in {duration} seconds")
+    if SETTINGS["enabled"]:
+        emit_event(
+            {
+                "event": "stage",
+                "stage": name,
+                "timestamp": time.time(),
+                "wall_seconds": duration,
+            }
+        )
@@ -0,0 +1,417 @@
+# standard library imports
+import http.client
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Tuple, Union
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# third party imports
+import pandas as pd
+
+# local services imports
+from services.aggregation import (
+    aggregate_chunks,
+    empty_aggregates,
+    get_product_stats_from_aggregates,
+    merge_aggregates,
+    merge_all_aggregates,
+)
+from services.dataloaders import DEFAULT_CHUNKSIZE, load_data_chunks
+from services.lexicon import Lexicon
+from services.plotting import PlotJob, render_plot
+from services.transformation import SentimentWords
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_CHART_CACHE_SIZE = 64
+Address = Union[Tuple[str, int], str]
+ChartBuilder = Callable[..., PlotJob]
+
+
+class LRUCache:
+    """A thread safe mapping that drops the least recently used entry
+    :param maxsize: entries kept at most
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CHART_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Any:
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class ReviewIndex:
+    """Aggregates of a review csv, kept in memory and updated by reload
+    :param input_filename: the csv, rows appended to it later are aggregated
+        by reload without reading the earlier rows again
+    :param sentiment_words: sentiment lexicon, loaded once
+    :param stopwords: stopwords, loaded once
+    :param nouns: filter nouns, loaded once
+    :param product_charts: chart builder per chart name, called with the
+        aggregates and a product id
+    :param global_charts: chart builder per chart name, called with the
+        aggregates
+    :param chart_cache_size: rendered charts kept in the LRU cache
+    :param word_capacity: bounds the word counts, see WordFrequencies
+    """
+
+    def __init__(
+        self,
+        input_filename: Path,
+        sentiment_words: SentimentWords,
+        stopwords: Lexicon,
+        nouns: Lexicon,
+        product_charts: Dict[str, ChartBuilder] = None,
+        global_charts: Dict[str, ChartBuilder] = None,
+        chart_cache_size: int = DEFAULT_CHART_CACHE_SIZE,
+        word_capacity: int = None,
+        chunksize: int = DEFAULT_CHUNKSIZE,
+    ):
+        self.input_filename = input_filename
+        self.sentiment_words = sentiment_words
+        self.stopwords = stopwords
+        self.nouns = nouns
+        self.product_charts = product_charts or {}
+        self.global_charts = global_charts or {}
+        self.charts = LRUCache(chart_cache_size)
+        self.word_capacity = word_capacity
+        self.chunksize = chunksize
+        # NOTE: reload holds the lock while it aggregates new rows, queries
+        # keep reading the previous aggregates until they are swapped
+        self.reload_lock = threading.Lock()
+        # NOTE: pyplot is not thread safe, charts are rendered one at a time
+        self.render_lock = threading.Lock()
+        # NOTE: cached charts are keyed by the version of the aggregates they
+        # were rendered from, it only ever increases
+        self.version = 0
+        self.reset()
+        self.reload()
+
+    def reset(self) -> None:
+        self.offset = 0
+        self.header = b""
+        self.seen = set()
+        self.aggregates = empty_aggregates()
+        self.product_stats = get_product_stats_from_aggregates(self.aggregates)
+        self.charts.clear()
+
+    def read_new_rows(self) -> bytes:
+        size = os.path.getsize(self.input_filename)
+        if size < self.offset:
+            # NOTE: the file was replaced or truncated, start over
+            logging.info(f"{self.input_filename} shrank, rebuilding the index")
+            self.reset()
+        with open(self.input_filename, "rb") as csv_file:
+            if not self.header:
+                self.header = csv_file.readline()
+                self.offset = len(self.header)
+            csv_file.seek(self.offset)
+            data = csv_file.read(size - self.offset)
+        # NOTE: a row that is still being appended is read by the next reload
+        data = data[: data.rfind(b"\n") + 1]
+        self.offset += len(data)
+        return data
+
+    def reload(self) -> dict:
+        start = time.time()
+        with self.reload_lock:
+            data = self.read_new_rows()
+            review_count = 0
+            if data:
+                chunks = load_data_chunks(
+                    io.BytesIO(self.header + data), self.chunksize, self.seen
+                )
+                new_aggregates = merge_all_aggregates(
+                    aggregate_chunks(
+                        chunks,
+                        self.sentiment_words,
+                        self.stopwords,
+                        self.nouns,
+                        self.word_capacity,
+                    )
+                )
+                # NOTE: every review has a sentiment, not every one a rating
+                review_count = int(new_aggregates.sentiment_counts.to_numpy().sum())
+            if review_count:
+                aggregates = merge_aggregates(self.aggregates, new_aggregates)
+                product_stats = get_product_stats_from_aggregates(aggregates)
+                self.aggregates, self.product_stats = aggregates, product_stats
+                self.version += 1
+                self.charts.clear()
+        stats = {
+            "new_reviews": review_count,
+            "reviews": int(self.product_stats.review_count.sum()),
+            "version": self.version,
+            "seconds": time.time() - start,
+        }
+        logging.info(f"Review index reloaded: {stats}")
+        return stats
+
+    def get_products(self) -> dict:
+        product_stats = self.product_stats
+        return {
+            "products": [
+                {"product_id": str(product_id), "review_count": int(review_count)}
+                for product_id, review_count in product_stats.review_count.items()
+            ]
+        }
+
+    def get_product(self, product_id: str) -> dict:
+        aggregates, product_stats = self.aggregates, self.product_stats
+        if product_id not in product_stats.index:
+            raise KeyError(product_id)
+        stats = product_stats.loc[product_id]
+        # NOTE: a product without a rated review may have no rating counts
+        rating_counts = aggregates.rating_counts.reindex([product_id], fill_value=0)
+        return {
+            "product_id": product_id,
+            "review_count": int(stats.review_count),
+            "mean_rating": (
+                None if pd.isna(stats.mean_rating) else float(stats.mean_rating)
+            ),
+            "ratings": get_count_dict(rating_counts.loc[product_id]),
+            "sentiment": get_count_dict(aggregates.sentiment_counts.loc[product_id]),
+        }
+
+    def get_stats(self, words: int = 10) -> dict:
+        aggregates, product_stats = self.aggregates, self.product_stats
+        rating_counts = aggregates.rating_counts.sum(axis=0)
+        rated_count = int(rating_counts.sum())
+        rating_sum = float((rating_counts * rating_counts.index.astype(float)).sum())
+        return {
+            "review_count": int(product_stats.review_count.sum()),
+            "product_count": len(product_stats),
+            "mean_rating": rating_sum / rated_count if rated_count else None,
+            "ratings": get_count_dict(rating_counts),
+            "sentiment": get_count_dict(aggregates.sentiment_counts.sum(axis=0)),
+            "top_words": aggregates.word_counts.most_common(words),
+        }
+
+    def get_chart(self, chart: str, product_id: str = None) -> bytes:
+        aggregates, version = self.aggregates, self.version
+        if product_id is None:
+            build_job = self.global_charts[chart]
+            args = (aggregates,)
+        else:
+            build_job = self.product_charts[chart]
+            if product_id not in self.product_stats.index:
+                raise KeyError(product_id)
+            args = (aggregates, product_id)
+        key = (chart, product_id, version)
+        png = self.charts.get(key)
+        if png is None:
+            png = self.render_chart(build_job(*args))
+            self.charts.put(key, png)
+        return png
+
+    def render_chart(self, job: PlotJob) -> bytes:
+        with self.render_lock, tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = Path(tmp_dir, "chart.png")
+            render_plot(job._replace(output_path=output_path))
+            return output_path.read_bytes()
+
+
+def get_count_dict(counts: pd.Series) -> Dict[str, int]:
+    return {str(label): int(count) for label, count in counts.items() if count > 0}
+
+
+class ReviewRequestHandler(BaseHTTPRequestHandler):
+    """Answers the queries of a ReviewIndex
+    GET /health, /stats?words=k, /products, /products/<id>,
+    /charts/<chart>.png, /products/<id>/charts/<chart>.png
+    POST /reload
+    """
+
+    server_version = "ReviewService/1.0"
+
+    def log_message(self, format: str, *args) -> None:
+        # NOTE: unix socket clients have no address
+        logging.info(f"{self.command} {self.path}: {format % args}")
+
+    def send_body(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, data: dict) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_body(status, body, "application/json")
+
+    def do_GET(self) -> None:
+        index: ReviewIndex = self.server.index
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+        query = parse_qs(url.query)
+        try:
+            if parts == ["health"]:
+                self.send_json(200, {"status": "ok", "version": index.version})
+            elif parts == ["stats"]:
+                words = int(query.get("words", ["10"])[0])
+                self.send_json(200, index.get_stats(words))
+            elif parts == ["products"]:
+                self.send_json(200, index.get_products())
+            elif len(parts) == 2 and parts[0] == "products":
+                self.send_json(200, index.get_product(parts[1]))
+            elif len(parts) == 2 and parts[0] == "charts":
+                chart = parts[1][: -len(".png")] if parts[1].endswith(".png") else ""
+                self.send_body(200, index.get_chart(chart), "image/png")
+            elif len(parts) == 4 and parts[0] == "products" and parts[2] == "charts":
+                chart = parts[3][: -len(".png")] if parts[3].endswith(".png") else ""
+                self.send_body(200, index.get_chart(chart, parts[1]), "image/png")
+            else:
+                self.send_json(404, {"error": f"Unknown path: {url.path}"})
+        except KeyError as error:
+            self.send_json(404, {"error": f"Not found: {error.args[0]}"})
+        except ValueError as error:
+            self.send_json(400, {"error": str(error)})
+        except Exception:
+            self.send_internal_error()
+
+    def do_POST(self) -> None:
+        if urlsplit(self.path).path.rstrip("/") != "/reload":
+            self.send_json(404, {"error": f"Unknown path: {self.path}"})
+            return
+        try:
+            self.send_json(200, self.server.index.reload())
+        except Exception:
+            self.send_internal_error()
+
+    def send_internal_error(self) -> None:
+        # NOTE: the traceback is only logged, the client gets no internals
+        logging.exception(f"{self.command} {self.path} failed")
+        self.send_json(500, {"error": "Internal server error"})
+
+
+class ThreadingUnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # NOTE: BaseHTTPRequestHandler expects an address tuple
+        return request, ("local", 0)
+
+
+def create_server(
+    index: ReviewIndex, address: Address = (DEFAULT_HOST, DEFAULT_PORT)
+) -> socketserver.BaseServer:
+    """Binds the service without serving yet, call serve_forever on the result
+    :param index: the index the queries are answered from
+    :param address: (host, port) for http over tcp or the path of a unix socket
+    """
+    if isinstance(address, str):
+        if os.path.exists(address):
+            os.remove(address)
+        server = ThreadingUnixHTTPServer(address, ReviewRequestHandler)
+    else:
+        server = ThreadingHTTPServer(address, ReviewRequestHandler)
+    server.index = index
+    return server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class ReviewServiceClient:
+    """A client of a running review service, needs no network access
+    :param address: (host, port) or the path of a unix socket
+    :param timeout: seconds per request
+    """
+
+    def __init__(
+        self, address: Address = (DEFAULT_HOST, DEFAULT_PORT), timeout: float = 60
+    ):
+        self.address = address
+        self.timeout = timeout
+
+    def get_connection(self) -> http.client.HTTPConnection:
+        if isinstance(self.address, str):
+            return UnixHTTPConnection(self.address, self.timeout)
+        host, port = self.address
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def request(self, method: str, path: str) -> bytes:
+        connection = self.get_connection()
+        try:
+            connection.request(method, path)
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise ServiceError(response.status, json.loads(body).get("error", ""))
+        return body
+
+    def get_json(self, path: str) -> dict:
+        return json.loads(self.request("GET", path))
+
+    def health(self) -> dict:
+        return self.get_json("/health")
+
+    def stats(self, words: int = 10) -> dict:
+        return self.get_json(f"/stats?words={words}")
+
+    def products(self) -> list:
+        return self.get_json("/products")["products"]
+
+    def product(self, product_id: str) -> dict:
+        return self.get_json(f"/products/{product_id}")
+
+    def chart(self, chart: str, product_id: str = None) -> bytes:
+        if product_id is None:
+            return self.request("GET", f"/charts/{chart}.png")
+        return self.request("GET", f"/products/{product_id}/charts/{chart}.png")
+
+    def reload(self) -> dict:
+        return json.loads(self.request("POST", "/reload"))
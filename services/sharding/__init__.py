@@ -0,0 +1,243 @@
+# standard library imports
+import ctypes
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor as Executor
+from multiprocessing.sharedctypes import RawArray
+from pathlib import Path
+from typing import List, NamedTuple, Sequence, Set, Tuple
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+# local services imports
+from services.aggregation import (
+    ReviewAggregates,
+    aggregate_chunks,
+    merge_all_aggregates,
+)
+from services.dataloaders import get_review_digests, load_data
+from services.instrumentation import SETTINGS, instrumented
+from services.lexicon import Lexicon
+from services.transformation import SentimentWords
+
+# NOTE: shards are smaller than rows / workers so that a slow shard does not
+# leave the other workers idle at the end of a run
+SHARDS_PER_WORKER = 4
+MIN_SHARD_SIZE = 1_000
+SHARD_CONTEXT = {}
+# NOTE: the pools are started from the threads of the pipeline scheduler, a
+# forked worker could inherit a lock held by another thread and deadlock, the
+# workers are started from a fresh process instead and get their context via
+# the initializer
+POOL_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def get_pool_context() -> multiprocessing.context.BaseContext:
+    context = multiprocessing.get_context(POOL_START_METHOD)
+    if POOL_START_METHOD == "forkserver":
+        # NOTE: the fork server imports the services once, the workers fork
+        # from it with pandas and the aggregation already loaded
+        context.set_forkserver_preload([__name__])
+    return context
+
+
+class SharedReviews(NamedTuple):
+    """Raw reviews in shared memory, passed to the pool workers on start
+    :param text_buffer: utf-8 bytes of all texts back to back
+    :param text_offsets: text i is text_buffer[text_offsets[i]:text_offsets[i + 1]]
+    :param product_codes: index into product_ids per review
+    :param ratings: rating per review, int8 or float64 with missing ratings
+    :param product_ids: the distinct product ids
+    """
+
+    text_buffer: RawArray
+    text_offsets: RawArray
+    product_codes: RawArray
+    ratings: RawArray
+    product_ids: list
+
+
+def to_raw_array(typecode, values: np.ndarray) -> RawArray:
+    raw_array = RawArray(typecode, max(len(values), 1))
+    np.frombuffer(raw_array, dtype=values.dtype)[: len(values)] = values
+    return raw_array
+
+
+def share_reviews(df: pd.DataFrame) -> SharedReviews:
+    encoded = [text.encode("utf-8", "surrogatepass") for text in df.text]
+    lengths = np.fromiter(map(len, encoded), dtype="int64", count=len(encoded))
+    text_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype("int64")
+    text_buffer = np.frombuffer(b"".join(encoded), dtype="uint8")
+    product_codes, product_ids = pd.factorize(df.product_id)
+    ratings = df.rating.to_numpy()
+    return SharedReviews(
+        text_buffer=to_raw_array(ctypes.c_uint8, text_buffer),
+        text_offsets=to_raw_array(ctypes.c_int64, text_offsets),
+        product_codes=to_raw_array(ctypes.c_int64, product_codes.astype("int64")),
+        # NOTE: the ratings keep their dtype, float if a rating is missing,
+        # so that the shards aggregate like the whole frame does
+        ratings=to_raw_array(np.ctypeslib.as_ctypes_type(ratings.dtype), ratings),
+        product_ids=list(product_ids),
+    )
+
+
+def attach_reviews(shared: SharedReviews, start: int, end: int) -> pd.DataFrame:
+    text_buffer = np.frombuffer(shared.text_buffer, dtype="uint8")
+    text_offsets = np.frombuffer(shared.text_offsets, dtype="int64")
+    buffer = text_buffer[text_offsets[start] : text_offsets[end]].tobytes()
+    offsets = (text_offsets[start : end + 1] - text_offsets[start]).tolist()
+    texts = [
+        buffer[offsets[i] : offsets[i + 1]].decode("utf-8", "surrogatepass")
+        for i in range(end - start)
+    ]
+    product_codes = np.frombuffer(shared.product_codes, dtype="int64")[start:end]
+    product_ids = pd.Categorical.from_codes(product_codes, shared.product_ids)
+    ratings = np.ctypeslib.as_array(shared.ratings)[start:end]
+    df = pd.DataFrame(
+        {"product_id": product_ids, "text": texts, "rating": ratings.copy()},
+        index=pd.RangeIndex(start, end),
+    )
+    return df
+
+
+def init_shard_worker(
+    shared: SharedReviews,
+    sentiment_words: SentimentWords,
+    stopwords: Lexicon,
+    nouns: Lexicon,
+    word_capacity: int = None,
+    instrumentation: dict = None,
+) -> None:
+    # NOTE: the workers do not fork from the caller, its instrumentation
+    # settings are passed on explicitly
+    SETTINGS.update(instrumentation or {})
+    SHARD_CONTEXT.update(
+        shared=shared,
+        sentiment_words=sentiment_words,
+        stopwords=stopwords,
+        nouns=nouns,
+        word_capacity=word_capacity,
+    )
+
+
+def process_shard(start: int, end: int) -> ReviewAggregates:
+    df = attach_reviews(SHARD_CONTEXT["shared"], start, end)
+    chunk_aggregates = aggregate_chunks(
+        [df],
+        SHARD_CONTEXT["sentiment_words"],
+        SHARD_CONTEXT["stopwords"],
+        SHARD_CONTEXT["nouns"],
+        SHARD_CONTEXT["word_capacity"],
+    )
+    return next(chunk_aggregates)
+
+
+def get_shard_ranges(rows: int, workers: int) -> List[Tuple[int, int]]:
+    shard_size = max(MIN_SHARD_SIZE, -(-rows // (workers * SHARDS_PER_WORKER)))
+    return [
+        (start, min(start + shard_size, rows)) for start in range(0, rows, shard_size)
+    ]
+
+
+@instrumented
+def run_sharded(
+    df: pd.DataFrame,
+    sentiment_words: SentimentWords,
+    stopwords: Lexicon,
+    nouns: Lexicon,
+    workers: int = None,
+    word_capacity: int = None,
+) -> ReviewAggregates:
+    workers = workers or multiprocessing.cpu_count()
+    start = time.time()
+    shared = share_reviews(df)
+    shard_ranges = get_shard_ranges(len(df), workers)
+    initargs = (shared, sentiment_words, stopwords, nouns, word_capacity, SETTINGS)
+    with Executor(
+        max_workers=workers,
+        mp_context=get_pool_context(),
+        initializer=init_shard_worker,
+        initargs=initargs,
+    ) as exe:
+        jobs = [exe.submit(process_shard, *shard_range) for shard_range in shard_ranges]
+        # NOTE: partials are merged in shard order, which keeps the word
+        # counts in order of first occurrence
+        aggregates = merge_all_aggregates(job.result() for job in jobs)
+    duration = time.time() - start
+    logging.info(
+        f"Processed {len(df)} reviews in {len(shard_ranges)} shards "
+        f"on {workers} workers in {duration} seconds"
+    )
+    return aggregates
+
+
+def get_file_digests(filename: Path) -> List[bytes]:
+    return get_review_digests(load_data(filename))
+
+
+def process_file(filename: Path, keep: np.ndarray = None) -> ReviewAggregates:
+    df = load_data(filename)
+    if keep is not None:
+        df = df[keep]
+    chunk_aggregates = aggregate_chunks(
+        [df],
+        SHARD_CONTEXT["sentiment_words"],
+        SHARD_CONTEXT["stopwords"],
+        SHARD_CONTEXT["nouns"],
+        SHARD_CONTEXT["word_capacity"],
+    )
+    return next(chunk_aggregates)
+
+
+def get_unseen_mask(digests: List[bytes], seen: Set[bytes]) -> np.ndarray:
+    # NOTE: load_data already dropped the copies within the file
+    keep = np.fromiter((digest not in seen for digest in digests), bool, len(digests))
+    seen.update(digests)
+    return keep
+
+
+@instrumented
+def run_file_shards(
+    filenames: Sequence[Path],
+    sentiment_words: SentimentWords,
+    stopwords: Lexicon,
+    nouns: Lexicon,
+    workers: int = None,
+    word_capacity: int = None,
+) -> ReviewAggregates:
+    """Partial aggregates of every csv file on a pool, merged in file order
+    :param filenames: shards of one export, a review that is in several files
+        is only counted for the first of them, like load_data on their
+        concatenation
+    """
+    workers = workers or multiprocessing.cpu_count()
+    start = time.time()
+    initargs = (None, sentiment_words, stopwords, nouns, word_capacity, SETTINGS)
+    with Executor(
+        max_workers=workers,
+        mp_context=get_pool_context(),
+        initializer=init_shard_worker,
+        initargs=initargs,
+    ) as exe:
+        # NOTE: a first pass only parses and hashes the files, a file is
+        # processed as soon as the digests of all files before it are known,
+        # parsing twice costs less than cleaning and scoring any file twice
+        digest_jobs = [exe.submit(get_file_digests, filename) for filename in filenames]
+        seen, jobs, dropped = set(), [], 0
+        for filename, digest_job in zip(filenames, digest_jobs):
+            keep = get_unseen_mask(digest_job.result(), seen)
+            dropped += len(keep) - int(keep.sum())
+            keep = None if keep.all() else keep
+            jobs.append(exe.submit(process_file, filename, keep))
+        aggregates = merge_all_aggregates(job.result() for job in jobs)
+    duration = time.time() - start
+    logging.info(
+        f"Processed {len(filenames)} files on {workers} workers in {duration} "
+        f"seconds, dropped {dropped} reviews of earlier files"
+    )
+    return aggregates
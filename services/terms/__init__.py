@@ -0,0 +1,182 @@
+# standard library imports
+from typing import NamedTuple
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+# local services imports
+from services.instrumentation import instrumented
+from services.transformation import TokenStore
+
+DEFAULT_TOP_TERMS = 10
+# NOTE: strength of the informative dirichlet prior of the log odds ratio,
+# in pseudo counts spread over the terms by their overall frequency
+LOG_ODDS_PRIOR = 500.0
+
+
+class CountMatrix(NamedTuple):
+    """Sparse row x term counts in compressed sparse row layout
+    :param data: nonzero counts, row i has data[indptr[i]:indptr[i + 1]]
+    :param indices: term id of every count, ascending within a row
+    :param indptr: offsets of the rows into data and indices
+    :param rows: label of every row, e.g. the product ids
+    :param terms: object array of the words, the term ids index into it
+    """
+
+    data: np.ndarray
+    indices: np.ndarray
+    indptr: np.ndarray
+    rows: pd.Index
+    terms: np.ndarray
+
+    @property
+    def shape(self) -> (int, int):
+        return len(self.indptr) - 1, len(self.terms)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.data)
+
+    def row_ids(self) -> np.ndarray:
+        return np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+
+    def row_sums(self) -> np.ndarray:
+        return np.bincount(self.row_ids(), weights=self.data, minlength=self.shape[0])
+
+    def term_sums(self) -> np.ndarray:
+        return np.bincount(self.indices, weights=self.data, minlength=self.shape[1])
+
+    def document_frequencies(self) -> np.ndarray:
+        # NOTE: a term is stored at most once per row
+        return np.bincount(self.indices, minlength=self.shape[1])
+
+    def row(self, label) -> pd.Series:
+        i = self.rows.get_loc(label)
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return pd.Series(
+            self.data[start:end], index=self.terms[self.indices[start:end]]
+        )
+
+
+def build_count_matrix(
+    row_ids: np.ndarray, term_ids: np.ndarray, rows: pd.Index, terms: np.ndarray
+) -> CountMatrix:
+    # NOTE: one sort of the (row, term) keys counts every pair, nothing of
+    # the size rows x terms is ever allocated
+    term_count = max(len(terms), 1)
+    keys = row_ids.astype("int64") * term_count + term_ids
+    keys, counts = np.unique(keys, return_counts=True)
+    pair_rows, indices = np.divmod(keys, term_count)
+    indptr = np.zeros(len(rows) + 1, dtype="int64")
+    np.cumsum(np.bincount(pair_rows, minlength=len(rows)), out=indptr[1:])
+    index_dtype = "int32" if term_count < 2**31 else "int64"
+    return CountMatrix(counts, indices.astype(index_dtype), indptr, rows, terms)
+
+
+def compact_terms(token_store: TokenStore) -> (np.ndarray, np.ndarray):
+    # NOTE: a filtered store keeps the full vocabulary, only words that are
+    # left become terms, in their order of first occurrence
+    counts = np.bincount(token_store.token_ids, minlength=len(token_store.vocabulary))
+    kept = np.flatnonzero(counts)
+    term_ids = np.full(len(token_store.vocabulary), -1, dtype="int64")
+    term_ids[kept] = np.arange(len(kept))
+    return term_ids[token_store.token_ids], token_store.vocabulary[kept]
+
+
+@instrumented
+def build_review_term_matrix(token_store: TokenStore) -> CountMatrix:
+    term_ids, terms = compact_terms(token_store)
+    return build_count_matrix(
+        token_store.review_ids(), term_ids, token_store.index, terms
+    )
+
+
+@instrumented
+def build_product_term_matrix(
+    product_ids: pd.Series, token_store: TokenStore
+) -> CountMatrix:
+    """Counts of every term per product
+    :param product_ids: product of every review of the token store
+    :param token_store: e.g. the nouns left by filter_token_store
+    """
+    codes, products = pd.factorize(np.asarray(product_ids), sort=True)
+    term_ids, terms = compact_terms(token_store)
+    row_ids = codes[token_store.review_ids()]
+    rows = pd.Index(np.asarray(products), name="product_id")
+    return build_count_matrix(row_ids, term_ids, rows, terms)
+
+
+def get_tf_idf(matrix: CountMatrix) -> np.ndarray:
+    # NOTE: smoothed idf, a term of every row still gets a weight of 1
+    row_count = matrix.shape[0]
+    idf = np.log((1 + row_count) / (1 + matrix.document_frequencies())) + 1
+    term_frequencies = matrix.data / matrix.row_sums()[matrix.row_ids()]
+    return term_frequencies * idf[matrix.indices]
+
+
+def get_log_odds(matrix: CountMatrix, prior: float = LOG_ODDS_PRIOR) -> np.ndarray:
+    # NOTE: z-scores of the log odds ratio of a term in a row against all
+    # other rows with an informative dirichlet prior (Monroe et al. 2008),
+    # rare terms of small rows do not dominate like with plain ratios
+    term_sums = matrix.term_sums()
+    total = term_sums.sum()
+    alphas = prior * term_sums / total if total else term_sums
+    row_sums = matrix.row_sums()[matrix.row_ids()]
+    counts = matrix.data.astype("float64")
+    alpha = alphas[matrix.indices]
+    rest_counts = term_sums[matrix.indices] - counts
+    rest_sums = total - row_sums
+    # NOTE: only a single row or a single term make the odds infinite
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_odds = np.log((counts + alpha) / (row_sums + prior - counts - alpha))
+        rest_log_odds = np.log(
+            (rest_counts + alpha) / (rest_sums + prior - rest_counts - alpha)
+        )
+        variances = 1 / (counts + alpha) + 1 / (rest_counts + alpha)
+        return (log_odds - rest_log_odds) / np.sqrt(variances)
+
+
+def get_top_entries(
+    matrix: CountMatrix, scores: np.ndarray, k: int = DEFAULT_TOP_TERMS
+) -> (np.ndarray, np.ndarray):
+    # NOTE: positions of the k best scored entries per row, ties in order of
+    # first occurrence of the term, sorted row by row
+    row_ids = matrix.row_ids()
+    order = np.lexsort((matrix.indices, -scores, row_ids))
+    ranks = np.arange(matrix.nnz) - matrix.indptr[row_ids[order]]
+    kept = ranks < k
+    return order[kept], ranks[kept]
+
+
+def get_term_frame(
+    matrix: CountMatrix, positions: np.ndarray, ranks: np.ndarray, **scores
+) -> pd.DataFrame:
+    row_ids = matrix.row_ids()[positions]
+    return pd.DataFrame(
+        {
+            matrix.rows.name or "row": matrix.rows.to_numpy()[row_ids],
+            "rank": ranks + 1,
+            "word": matrix.terms[matrix.indices[positions]],
+            "count": matrix.data[positions],
+            **{name: values[positions] for name, values in scores.items()},
+        }
+    )
+
+
+@instrumented
+def get_top_terms(matrix: CountMatrix, k: int = DEFAULT_TOP_TERMS) -> pd.DataFrame:
+    positions, ranks = get_top_entries(matrix, matrix.data, k)
+    return get_term_frame(matrix, positions, ranks)
+
+
+@instrumented
+def get_distinctive_terms(
+    matrix: CountMatrix, k: int = DEFAULT_TOP_TERMS, prior: float = LOG_ODDS_PRIOR
+) -> pd.DataFrame:
+    # NOTE: ranked by the log odds z-score, tf-idf is reported alongside
+    log_odds = get_log_odds(matrix, prior)
+    positions, ranks = get_top_entries(matrix, log_odds, k)
+    return get_term_frame(
+        matrix, positions, ranks, tf_idf=get_tf_idf(matrix), log_odds=log_odds
+    )
@@ -1,13 +1,22 @@
 # standard library imports
-import re
 from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Tuple, Union
 
 # third party imports
+import numpy as np
 import pandas as pd
 
 # local services imports
-from services.encoding import encode_sentiment_scores
-from services.utilities import get_sentiment, filter_words
+from services.encoding import encode_sentiment_scores_categorical
+from services.instrumentation import instrumented
+from services.lexicon import Lexicon, SentimentLexicon, as_lexicon
+
+SentimentWords = Union[dict, pd.Series, SentimentLexicon]
+
+# NOTE: cleaned reviews never contain it, remove_accents drops non-printables
+TOKEN_SEPARATOR = "\x00"
+TOKENIZE_CHUNKSIZE = 50_000
+
 
 # NOTE: not really needed
 # or rather only for nicer annotations while plotting
@@ -18,55 +27,329 @@ def reformat_product_ids(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+class TokenStore(NamedTuple):
+    """Columnar tokens of a set of reviews
+    :param token_ids: flat array of all tokens as ids into vocabulary
+    :param offsets: tokens of review i are token_ids[offsets[i]:offsets[i + 1]]
+    :param vocabulary: object array of the distinct tokens, ids are assigned
+        in order of first occurrence
+    :param index: index of the reviews in the source frame
+    """
+
+    token_ids: np.ndarray
+    offsets: np.ndarray
+    vocabulary: np.ndarray
+    index: pd.Index
+
+    @property
+    def review_count(self) -> int:
+        return len(self.offsets) - 1
+
+    def review_ids(self) -> np.ndarray:
+        return np.repeat(np.arange(self.review_count), np.diff(self.offsets))
+
+    def words(self) -> np.ndarray:
+        return self.vocabulary[self.token_ids]
+
+    def token_lists(self) -> List[list]:
+        words = self.words().tolist()
+        offsets = self.offsets.tolist()
+        return [words[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def tokenize_texts(texts: Sequence[str]) -> (np.ndarray, np.ndarray, np.ndarray):
+    # NOTE: one split over all reviews with the separator as a token of its
+    # own, the review boundaries are then the positions of its id
+    tokens = f" {TOKEN_SEPARATOR} ".join(texts).replace(".", "").split()
+    codes, vocabulary = pd.factorize(np.asarray(tokens, dtype=object))
+    vocabulary = np.asarray(vocabulary, dtype=object)
+    separator_codes = np.flatnonzero(vocabulary == TOKEN_SEPARATOR)
+    separator_code = separator_codes[0] if len(separator_codes) else -1
+    is_separator = codes == separator_code
+    separators = np.flatnonzero(is_separator)
+    if len(separators) == max(len(texts) - 1, 0):
+        token_ids = codes[~is_separator]
+        if separator_code >= 0:
+            token_ids -= token_ids > separator_code
+            vocabulary = np.delete(vocabulary, separator_code)
+        ends = separators - np.arange(len(separators))
+    else:
+        # NOTE: a review contains the separator itself, split one by one
+        tokenized = [text.replace(".", "").split() for text in texts]
+        tokens = [token for words in tokenized for token in words]
+        token_ids, vocabulary = pd.factorize(np.asarray(tokens, dtype=object))
+        vocabulary = np.asarray(vocabulary, dtype=object)
+        ends = np.cumsum([len(words) for words in tokenized])[:-1]
+    offsets = np.zeros(1, dtype="int64")
+    if len(texts):
+        offsets = np.concatenate([[0], ends, [len(token_ids)]]).astype("int64")
+    return token_ids, vocabulary, offsets
+
+
+@instrumented
+def tokenize_text_values(
+    df: pd.DataFrame, chunksize: int = TOKENIZE_CHUNKSIZE
+) -> TokenStore:
+    texts = df.text.tolist()
+    # NOTE: the token strings of one chunk are alive at a time, the local ids
+    # of a chunk are mapped to global ids in order of first occurrence, so the
+    # result does not depend on the chunksize
+    word_ids = {}
+    chunk_token_ids, chunk_offsets = [], [np.zeros(1, dtype="int64")]
+    for start in range(0, len(texts), chunksize):
+        token_ids, vocabulary, offsets = tokenize_texts(
+            texts[start : start + chunksize]
+        )
+        mapping = np.fromiter(
+            (word_ids.setdefault(word, len(word_ids)) for word in vocabulary),
+            dtype="int64",
+            count=len(vocabulary),
+        )
+        chunk_offsets.append(offsets[1:] + chunk_offsets[-1][-1])
+        chunk_token_ids.append(mapping[token_ids])
+    vocabulary = np.empty(len(word_ids), dtype=object)
+    vocabulary[:] = list(word_ids)
+    token_ids = np.concatenate(chunk_token_ids or [np.zeros(0, dtype="int64")])
+    token_ids = token_ids.astype("int32" if len(vocabulary) < 2**31 else "int64")
+    offsets = np.concatenate(chunk_offsets)
+    return TokenStore(token_ids, offsets, vocabulary, df.index)
+
+
+@instrumented
 def get_average_rating_per_id(df: pd.DataFrame) -> pd.DataFrame:
-    avg_rating_per_id = round(df.groupby("product_id").rating.mean(), 2)
-    avg_rating = avg_rating_per_id.values.tolist()
-    ids = sorted(list(set(df.product_id.values)))
-    avg_rating_df = pd.DataFrame({"article": ids, "rating": avg_rating})
+    avg_rating_per_id = df.groupby("product_id", observed=True).rating.mean()
+    avg_rating_per_id = round(avg_rating_per_id, 2)
+    avg_rating_df = pd.DataFrame(
+        {"article": avg_rating_per_id.index, "rating": avg_rating_per_id.to_numpy()}
+    )
     return avg_rating_df
 
 
+@instrumented
 def get_ratings_in_total(df: pd.DataFrame) -> pd.DataFrame:
-    total_ratings_df = df.drop("text", axis=1)
-    total_ratings_df = total_ratings_df.groupby("rating").count()
-    total_ratings_df.columns = ["count"]
-    total_ratings_df = total_ratings_df.reset_index()
+    total_ratings_df = df.groupby("rating").size().rename("count").reset_index()
     return total_ratings_df
 
 
-def get_sentiment_from_text_df(df: pd.DataFrame, sentiment_words: dict) -> pd.DataFrame:
-    sentiment_df = df.copy()
-    sentiment_df.text = sentiment_df.text.apply(lambda val: re.sub(r"\.", "", val))
-    sentiment_df["tokenized"] = sentiment_df.text.str.split()
-    sentiment_df["score"] = sentiment_df.tokenized.apply(
-        get_sentiment, args=(sentiment_words,)
+def build_score_table(sentiment_words: Union[dict, pd.Series]) -> pd.Series:
+    if isinstance(sentiment_words, pd.Series):
+        return sentiment_words
+    scores = {word: entry.get("score", 0.0) for word, entry in sentiment_words.items()}
+    return pd.Series(scores, dtype="float64")
+
+
+def lookup_sentiment_scores(
+    sentiment_words: SentimentWords, words: Sequence[str]
+) -> np.ndarray:
+    if isinstance(sentiment_words, SentimentLexicon):
+        return sentiment_words.lookup(words)
+    score_table = build_score_table(sentiment_words)
+    return score_table.reindex(words).fillna(0.0).to_numpy()
+
+
+def score_token_store(
+    token_store: TokenStore, sentiment_words: SentimentWords
+) -> np.ndarray:
+    # NOTE: only the vocabulary is looked up in the score table, the per-token
+    # scores are then gathered by token id
+    vocabulary_scores = lookup_sentiment_scores(sentiment_words, token_store.vocabulary)
+    # NOTE: bincount accumulates the weights of a review in token order, just
+    # like get_sentiment's sum(), so scores on the thresholds encode the same
+    scores = np.bincount(
+        token_store.review_ids(),
+        weights=vocabulary_scores[token_store.token_ids],
+        minlength=token_store.review_count,
     )
-    sentiment_df["encoded_score"] = sentiment_df.score.apply(encode_sentiment_scores)
-    sentiment_df = sentiment_df[["product_id", "encoded_score"]]
+    return scores
+
+
+@instrumented
+def get_review_sentiment_scores(
+    df: pd.DataFrame, sentiment_words: SentimentWords, token_store: TokenStore = None
+) -> pd.DataFrame:
+    if token_store is None:
+        token_store = tokenize_text_values(df)
+    scores = score_token_store(token_store, sentiment_words)
+    # NOTE: only the new columns, they share the index of df
+    review_scores_df = pd.DataFrame(
+        {"score": scores, "encoded_score": encode_sentiment_scores_categorical(scores)},
+        index=df.index,
+    )
+    return review_scores_df
+
+
+@instrumented
+def get_sentiment_from_text_df(
+    df: pd.DataFrame, sentiment_words: SentimentWords, token_store: TokenStore = None
+) -> pd.DataFrame:
+    review_scores_df = get_review_sentiment_scores(df, sentiment_words, token_store)
+    sentiment_df = review_scores_df[["encoded_score"]]
     return sentiment_df
 
 
+@instrumented
 def get_overall_sentiment_from_text_df(sentiment_df: pd.DataFrame):
-    overall_sentiment_df = sentiment_df.encoded_score.value_counts().reset_index()
+    counts = sentiment_df.encoded_score.value_counts()
+    overall_sentiment_df = counts[counts > 0].reset_index()
     overall_sentiment_df.columns = ["sentiment", "count"]
     return overall_sentiment_df
 
 
+@instrumented
+def filter_token_store(
+    token_store: TokenStore, stopwords: Lexicon, nouns: Lexicon
+) -> TokenStore:
+    # NOTE: nouns without stopwords is built once and only the vocabulary is
+    # checked against it, tokens are then kept by a mask over their ids
+    kept_words = as_lexicon(nouns).difference(as_lexicon(stopwords))
+    kept_vocabulary = np.fromiter(
+        (word in kept_words for word in token_store.vocabulary),
+        dtype=bool,
+        count=len(token_store.vocabulary),
+    )
+    kept_tokens = kept_vocabulary[token_store.token_ids]
+    kept_per_review = np.bincount(
+        token_store.review_ids()[kept_tokens], minlength=token_store.review_count
+    )
+    offsets = np.concatenate([[0], np.cumsum(kept_per_review)]).astype("int64")
+    return token_store._replace(
+        token_ids=token_store.token_ids[kept_tokens], offsets=offsets
+    )
+
+
+@instrumented
 def get_filtered_text_df(
-    df: pd.DataFrame, stopwords: list, nouns: list
+    df: pd.DataFrame,
+    stopwords: Lexicon,
+    nouns: Lexicon,
+    token_store: TokenStore = None,
 ) -> pd.DataFrame:
-    filtered_text_df = df.copy()
-    filtered_text_df.text = filtered_text_df.text.apply(
-        lambda val: re.sub(r"\.", "", val)
-    )
-    filtered_text_df["tokenized"] = filtered_text_df.text.str.split()
-    filtered_text_df.text = filtered_text_df.tokenized.apply(
-        filter_words, args=(stopwords, nouns)
+    if token_store is None:
+        token_store = tokenize_text_values(df)
+    filtered_store = filter_token_store(token_store, stopwords, nouns)
+    filtered_text_df = pd.DataFrame(
+        {"text": filtered_store.token_lists()}, index=df.index
     )
-    filtered_text_df = filtered_text_df[["product_id", "text"]]
     return filtered_text_df
 
 
+@instrumented
+def get_word_counts(token_store: TokenStore) -> pd.DataFrame:
+    counts = np.bincount(token_store.token_ids, minlength=len(token_store.vocabulary))
+    # NOTE: a stable sort keeps ties in order of first occurrence, the same
+    # order Counter.most_common returns them in
+    order = np.argsort(-counts, kind="stable")
+    order = order[counts[order] > 0]
+    word_counts_df = pd.DataFrame(
+        {"word": token_store.vocabulary[order], "count": counts[order]}
+    )
+    return word_counts_df
+
+
+def get_top_ten_words_df_from_token_store(token_store: TokenStore) -> pd.DataFrame:
+    top_ten_words_df = get_word_counts(token_store).head(10)
+    return top_ten_words_df
+
+
+class WordFrequencies:
+    """Mergeable word counts, words are kept in order of first occurrence
+    :param counts: count per word
+    :param capacity: heavy hitters mode, only the capacity most frequent words
+        are kept and counts may be overestimated by at most missing_count,
+        None keeps every word with its exact count
+    :param missing_count: upper bound of the count of any word that is not
+        in counts, 0 as long as no word was evicted
+    """
+
+    __slots__ = ("counts", "capacity", "missing_count")
+
+    def __init__(
+        self,
+        counts: Dict[str, int] = None,
+        capacity: int = None,
+        missing_count: int = 0,
+    ):
+        self.counts = dict(counts or {})
+        self.capacity = capacity
+        self.missing_count = missing_count
+        self.evict()
+
+    @classmethod
+    def from_token_store(
+        cls, token_store: TokenStore, capacity: int = None
+    ) -> "WordFrequencies":
+        counts = np.bincount(
+            token_store.token_ids, minlength=len(token_store.vocabulary)
+        )
+        # NOTE: the vocabulary is in order of first occurrence, filtering drops
+        # every token of a word, so the order holds for filtered stores too
+        kept = np.flatnonzero(counts)
+        words = token_store.vocabulary[kept].tolist()
+        return cls(dict(zip(words, counts[kept].tolist())), capacity)
+
+    @classmethod
+    def from_words(
+        cls, words: Iterable[str], capacity: int = None
+    ) -> "WordFrequencies":
+        return cls(Counter(words), capacity)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, WordFrequencies)
+            and list(self.counts.items()) == list(other.counts.items())
+            and self.missing_count == other.missing_count
+        )
+
+    def __repr__(self) -> str:
+        return f"WordFrequencies({len(self.counts)} words)"
+
+    def evict(self) -> None:
+        if self.capacity is None or len(self.counts) <= self.capacity:
+            return
+        words = list(self.counts)
+        counts = np.fromiter(self.counts.values(), dtype="int64", count=len(words))
+        order = np.argsort(-counts, kind="stable")
+        kept = np.sort(order[: self.capacity])
+        self.missing_count = max(self.missing_count, int(counts[order[self.capacity]]))
+        self.counts = {words[i]: int(counts[i]) for i in kept}
+
+    def merge(self, other: "WordFrequencies") -> "WordFrequencies":
+        # NOTE: space saving merge, a word missing from one side may have been
+        # evicted there with up to its missing_count, which is added instead
+        counts = {
+            word: count + other.counts.get(word, other.missing_count)
+            for word, count in self.counts.items()
+        }
+        for word, count in other.counts.items():
+            if word not in counts:
+                counts[word] = count + self.missing_count
+        capacities = [c for c in (self.capacity, other.capacity) if c is not None]
+        return WordFrequencies(
+            counts,
+            min(capacities) if capacities else None,
+            self.missing_count + other.missing_count,
+        )
+
+    def most_common(self, k: int = None) -> List[Tuple[str, int]]:
+        # NOTE: a stable sort keeps ties in order of first occurrence, the same
+        # order Counter.most_common returns them in
+        words = list(self.counts)
+        counts = np.fromiter(self.counts.values(), dtype="int64", count=len(words))
+        order = np.argsort(-counts, kind="stable")[:k].tolist()
+        return [(words[i], int(counts[i])) for i in order]
+
+    def top_words_df(self, k: int = 10) -> pd.DataFrame:
+        return pd.DataFrame(self.most_common(k), columns=["word", "count"])
+
+
+@instrumented
+def count_words(token_store: TokenStore, capacity: int = None) -> WordFrequencies:
+    return WordFrequencies.from_token_store(token_store, capacity)
+
+
 def get_top_ten_words_df_from_list(text_list: list) -> pd.DataFrame:
     top_ten_words = Counter(text_list).most_common(10)
     top_ten_words_df = pd.DataFrame(top_ten_words, columns=["word", "count"])
@@ -8,6 +8,9 @@ from typing import Callable, Sequence, TypeVar
 # third party imports
 import pandas as pd
 
+# local services imports
+from services.lexicon import Lexicon
+
 
 def get_input_file(folder: str, file: str) -> Path:
     project_dir = Path(os.path.dirname(__package__)).absolute()
@@ -42,9 +45,8 @@ def get_sentiment(words: list, sentiment_words: dict) -> list:
     return sentiment
 
 
-def filter_words(words: list, stopwords: list, nouns: list) -> list:
-    filtered = [word for word in words if word not in stopwords]
-    filtered = [word for word in filtered if word in nouns]
+def filter_words(words: list, stopwords: Lexicon, nouns: Lexicon) -> list:
+    filtered = [word for word in words if word not in stopwords and word in nouns]
     return filtered
 
 
@@ -0,0 +1,70 @@
+# third party imports
+import numpy as np
+import pandas as pd
+
+# local application imports
+from services.aggregation import (
+    aggregate_reviews,
+    get_overall_sentiment_from_aggregates,
+    get_product_stats_from_aggregates,
+    get_ratings_in_total_from_aggregates,
+    get_sentiment_per_product_from_aggregates,
+    merge_all_aggregates,
+)
+from services.transformation import WordFrequencies
+
+
+def get_reviews() -> pd.DataFrame:
+    # NOTE: product 3 has no rated review at all
+    return pd.DataFrame(
+        {
+            "product_id": [1, 1, 1, 2, 2, 3, 3, 1],
+            "rating": [5.0, np.nan, 4.0, 1.0, np.nan, np.nan, np.nan, 5.0],
+            "encoded_score": [2, 0, 2, 0, 1, 2, 2, 1],
+        }
+    )
+
+
+def aggregate(df: pd.DataFrame):
+    return aggregate_reviews(df, df[["encoded_score"]], WordFrequencies())
+
+
+def assert_baseline_numbers(aggregates, df):
+    # NOTE: the numbers of the per-row groupby, sentiment over all reviews and
+    # ratings over the rated ones
+    sentiment_per_product = df.groupby(["product_id", "encoded_score"]).size()
+    result = get_sentiment_per_product_from_aggregates(aggregates)
+    assert result.set_index(["product_id", "encoded_score"]).counts.to_dict() == (
+        sentiment_per_product.to_dict()
+    )
+    overall_sentiment = get_overall_sentiment_from_aggregates(aggregates)
+    assert dict(zip(overall_sentiment.sentiment, overall_sentiment["count"])) == (
+        df.encoded_score.value_counts().to_dict()
+    )
+    ratings_in_total = get_ratings_in_total_from_aggregates(aggregates)
+    assert dict(zip(ratings_in_total.rating, ratings_in_total["count"])) == (
+        df.rating.value_counts().to_dict()
+    )
+    product_stats = get_product_stats_from_aggregates(aggregates)
+    assert product_stats.review_count.to_dict() == (
+        df.groupby("product_id").size().to_dict()
+    )
+    pd.testing.assert_series_equal(
+        product_stats.mean_rating,
+        df.groupby("product_id").rating.mean(),
+        check_names=False,
+    )
+    assert product_stats.filter(like="rating_").sum().sum() == df.rating.count()
+
+
+def test_unrated_reviews_count_toward_sentiment():
+    df = get_reviews()
+    assert_baseline_numbers(aggregate(df), df)
+
+
+def test_unrated_reviews_count_toward_sentiment_after_merging():
+    # NOTE: the middle chunk has no rated review
+    df = get_reviews()
+    chunks = [df.iloc[:4], df.iloc[4:7], df.iloc[7:]]
+    aggregates = merge_all_aggregates(aggregate(chunk) for chunk in chunks)
+    assert_baseline_numbers(aggregates, df)
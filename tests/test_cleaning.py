@@ -0,0 +1,83 @@
+# standard library imports
+from pathlib import Path
+
+# third party imports
+import pandas as pd
+import pytest
+
+# local application imports
+from services.cleaning import clean_text_values, clean_texts
+from services.dataloaders import CSV_OPTIONS
+from services.formatting import (
+    remove_accents,
+    remove_quotes,
+    replace_umlaute,
+    transform_text,
+)
+
+DATASET_FILE = Path(__file__).parent.parent / "resources" / "dataset" / "bonprix.csv"
+
+ADVERSARIAL_TEXTS = [
+    "",
+    " ",
+    "a\x00b",
+    "\x00",
+    "\x00 \x00",
+    "Ärger über Größe, ÖL und ÜBEL",
+    "Fußball",
+    "\x01\x7f​",
+    "super 😀 toll",
+    "tab\tnew\nline\r\nend",
+    "3.000 Euro am 12. Mai... oder 1.5-2.5 kg",
+    "Dr. A. Müller sagt: gut!",
+    "Kommas, (Klammern) | pipes: ja; nein? doch!",
+    "ﬁne ½ ²",
+    "\"doppelt\" 'einfach' „deutsch“ ‚halb‘",
+    "café naïve",
+    "a / b - c – d",
+    " . . . ",
+]
+
+
+def clean_text_per_row(text: str) -> str:
+    functions = [
+        remove_quotes,
+        replace_umlaute,
+        remove_accents,
+        transform_text,
+        str.strip,
+        str.lower,
+    ]
+    for function in functions:
+        text = function(text)
+    return text
+
+
+def test_clean_texts_matches_per_row_on_dataset():
+    df = pd.read_csv(DATASET_FILE, **CSV_OPTIONS)
+    texts = df.text.tolist()
+    expected = [clean_text_per_row(text) for text in texts]
+    assert clean_texts(texts) == expected
+    # NOTE: small chunks put reviews on both sides of a chunk boundary
+    assert clean_texts(texts, chunksize=7) == expected
+
+
+@pytest.mark.parametrize("text", ADVERSARIAL_TEXTS)
+def test_clean_texts_matches_per_row_on_adversarial_text(text):
+    assert clean_texts([text]) == [clean_text_per_row(text)]
+
+
+def test_clean_texts_keeps_review_boundaries():
+    expected = [clean_text_per_row(text) for text in ADVERSARIAL_TEXTS]
+    assert clean_texts(ADVERSARIAL_TEXTS) == expected
+    assert clean_texts(ADVERSARIAL_TEXTS, chunksize=3) == expected
+
+
+def test_clean_text_values_keeps_raw_texts():
+    df = pd.DataFrame(
+        {"product_id": [1, 2], "text": ["Größe: GUT!", "a\x00b"], "rating": [5, 1]}
+    )
+    cleaned_df = clean_text_values(df)
+    assert list(cleaned_df.columns) == ["product_id", "text", "rating"]
+    assert cleaned_df.text.tolist() == [clean_text_per_row(t) for t in df.text]
+    assert df.text.tolist() == ["Größe: GUT!", "a\x00b"]
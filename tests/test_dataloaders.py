@@ -0,0 +1,33 @@
+# standard library imports
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# local application imports
+import services.dataloaders as dataloaders
+
+
+def test_compound_matcher_is_built_once_by_concurrent_stages(monkeypatch):
+    calls = []
+
+    def load_word_forms(filenames, tags, rebuild_cache=False):
+        calls.append(filenames)
+        # NOTE: a slow build, the second thread asks for the matcher meanwhile
+        time.sleep(0.1)
+        return {"kleid", "leid"}
+
+    monkeypatch.setattr(dataloaders, "load_word_forms", load_word_forms)
+    dataloaders.build_compound_matcher.cache_clear()
+    barrier = threading.Barrier(2)
+
+    def load_matcher(_):
+        barrier.wait()
+        return dataloaders.load_compound_matcher(("forms.txt",))
+
+    try:
+        with ThreadPoolExecutor(2) as executor:
+            first, second = executor.map(load_matcher, range(2))
+    finally:
+        dataloaders.build_compound_matcher.cache_clear()
+    assert first is second
+    assert calls == [("forms.txt",)]
@@ -0,0 +1,44 @@
+# third party imports
+import numpy as np
+
+# local application imports
+from services.deduplication import find_near_duplicates, get_bucket_pairs
+
+FIRST = (
+    "die hose sitzt sehr gut und die farbe ist genau wie auf dem bild, "
+    "sehr zu empfehlen"
+)
+# NOTE: shares the only band of FIRST and LAST that they have in common, but
+# is not similar enough to either of them
+BETWEEN = (
+    "passt hose sitzt sehr gut und stoff farbe ist genau wie auf dem bild, "
+    "sehr zu empfehlen"
+)
+LAST = (
+    "die hose sitzt sehr gut und die nicht ist genau wie auf dem bild, "
+    "sehr zu empfehlen"
+)
+
+
+def test_pairs_beyond_sort_order_neighbours_are_found():
+    clusters, counts = find_near_duplicates([FIRST, BETWEEN, LAST])
+    assert clusters.tolist() == [0, -1, 0]
+    assert counts["candidate_pairs"] == 3
+    assert counts["verified_pairs"] == 1
+
+
+def test_exact_copies_are_linked_per_group():
+    texts = [FIRST, LAST, FIRST, FIRST, BETWEEN]
+    clusters, counts = find_near_duplicates(texts, np.array([0, 0, 0, 1, 1]))
+    assert clusters.tolist() == [0, 0, 0, -1, -1]
+    assert counts["exact_copies"] == 1
+
+
+def test_large_buckets_are_compared_with_their_first_member():
+    order = np.array([4, 2, 0, 1, 3])
+    starts = np.array([0, 0, 2, 2, 2])
+    ends = np.array([2, 2, 5, 5, 5])
+    pairs = get_bucket_pairs(order, starts, ends, max_bucket_size=2)
+    assert pairs.tolist() == [[4, 2], [0, 1], [0, 3]]
+    pairs = get_bucket_pairs(order, starts, ends, max_bucket_size=3)
+    assert pairs.tolist() == [[4, 2], [0, 1], [0, 3], [1, 3]]
@@ -0,0 +1,84 @@
+# standard library imports
+import os
+from unittest import mock
+
+# third party imports
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+# local application imports
+from services.export import PART_FILE, read_table, write_table
+
+
+@pytest.fixture
+def reviews_df() -> pd.DataFrame:
+    product_ids = np.repeat(["515928", "434886", "1709054"], 4)
+    return pd.DataFrame(
+        {
+            "product_id": pd.Categorical(product_ids),
+            "text": [f"review {i}" for i in range(12)],
+            "rating": (np.arange(12) % 5 + 1).astype("int8"),
+            "score": np.linspace(-1, 1, 12),
+            "filtered": [["hose", "farbe"]] * 11 + [None],
+        }
+    )
+
+
+def test_write_table_writes_parquet_row_groups(tmp_path, reviews_df):
+    folder = write_table(reviews_df, tmp_path / "reviews", "product_id", 4)
+    parquet_file = pq.ParquetFile(str(folder / PART_FILE))
+    assert parquet_file.metadata.num_row_groups == 3
+    assert len(pd.read_parquet(folder)) == 12
+
+
+def test_read_table_round_trip(tmp_path, reviews_df):
+    folder = write_table(reviews_df, tmp_path / "reviews", row_group_size=5)
+    df = read_table(folder)
+    assert df.product_id.dtype == "category"
+    assert df.rating.dtype == "int8"
+    assert df.filtered.tolist() == reviews_df.filtered.tolist()
+    pd.testing.assert_frame_equal(
+        df.drop(columns="filtered").astype({"product_id": object, "text": object}),
+        reviews_df.drop(columns="filtered").astype(
+            {"product_id": object, "text": object}
+        ),
+    )
+
+
+def test_read_table_filters_skip_row_groups(tmp_path, reviews_df):
+    folder = write_table(reviews_df, tmp_path / "reviews", "product_id", 4)
+    with mock.patch.object(
+        pq.ParquetFile,
+        "read_row_group",
+        autospec=True,
+        side_effect=pq.ParquetFile.read_row_group,
+    ) as read_row_group:
+        df = read_table(folder, ["score"], [("product_id", "==", "434886")])
+    assert read_row_group.call_count == 1
+    expected = reviews_df.score[reviews_df.product_id == "434886"]
+    assert df.score.tolist() == expected.tolist()
+    df = read_table(folder, ["text"], [("rating", "in", [1, 2]), ("score", "<", 0)])
+    assert df.text.tolist() == ["review 5", "review 0", "review 1"]
+    assert read_table(folder, ["rating"], [("product_id", "==", "0")]).empty
+
+
+def test_read_table_rejects_unknown_columns(tmp_path, reviews_df):
+    folder = write_table(reviews_df, tmp_path / "reviews")
+    with pytest.raises(ValueError):
+        read_table(folder, ["unknown"])
+    with pytest.raises(ValueError):
+        read_table(folder, filters=[("score", "~", 0)])
+
+
+def test_failed_write_keeps_previous_table(tmp_path, reviews_df):
+    folder = write_table(reviews_df, tmp_path / "reviews")
+    with mock.patch("pyarrow.parquet.write_table", side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            write_table(reviews_df.head(2), folder)
+    assert len(read_table(folder)) == 12
+    assert os.listdir(tmp_path) == ["reviews"]
+    write_table(reviews_df.head(2), folder)
+    assert len(read_table(folder)) == 2
+    assert os.listdir(tmp_path) == ["reviews"]
@@ -0,0 +1,119 @@
+# standard library imports
+import asyncio
+
+# third party imports
+import pandas as pd
+import pytest
+
+# local application imports
+from services.cleaning import clean_text_values
+from services.ingestion import (
+    BatchSizer,
+    BatchStats,
+    ScoredReview,
+    score_reviews,
+    score_reviews_async,
+)
+from services.transformation import get_review_sentiment_scores
+
+SENTIMENT_WORDS = {
+    "gut": {"score": 0.5},
+    "super": {"score": 0.8},
+    "schlecht": {"score": -0.5},
+    "kratzt": {"score": -0.3},
+}
+TEXTS = [
+    "Die Hose ist super, passt gut!",
+    "Schlechte Qualität, die Jacke ist zu klein.",
+    "Farbe ist schön aber der Stoff kratzt",
+    "Leider nicht gut, zurückgeschickt",
+    "",
+    "schlecht schlecht gut",
+]
+
+
+@pytest.fixture
+def records():
+    return [
+        {"product_id": 1000 + i % 3, "text": TEXTS[i % len(TEXTS)]} for i in range(10)
+    ]
+
+
+def get_expected(records) -> list:
+    df = pd.DataFrame(records).astype({"product_id": str})
+    scores_df = get_review_sentiment_scores(clean_text_values(df), SENTIMENT_WORDS)
+    return [
+        ScoredReview(product_id, score, str(encoded_score))
+        for product_id, score, encoded_score in zip(
+            df.product_id, scores_df.score, scores_df.encoded_score
+        )
+    ]
+
+
+def test_score_reviews_matches_batch_scores(records):
+    # NOTE: 10 reviews in batches of 4, the last batch is not full
+    stats = BatchStats()
+    results = list(
+        score_reviews(
+            records, SENTIMENT_WORDS, min_batch_size=4, max_batch_size=4, stats=stats
+        )
+    )
+    assert results == get_expected(records)
+    assert list(stats.batch_sizes) == [4, 4, 2]
+    assert stats.reviews == 10
+
+
+def test_score_reviews_accepts_tuples(records):
+    tuples = [(record["product_id"], record["text"], 5) for record in records]
+    assert list(score_reviews(tuples, SENTIMENT_WORDS)) == get_expected(records)
+
+
+def test_score_reviews_async_matches_batch_scores(records):
+    async def produce():
+        for record in records:
+            await asyncio.sleep(0)
+            yield record
+
+    async def consume(stats):
+        # NOTE: a queue of two records makes the producer wait for the
+        # consumer, the deadline is long enough to fill every batch
+        return [
+            result
+            async for result in score_reviews_async(
+                produce(),
+                SENTIMENT_WORDS,
+                min_batch_size=4,
+                max_batch_size=4,
+                max_wait_seconds=10,
+                queue_size=2,
+                stats=stats,
+            )
+        ]
+
+    stats = BatchStats()
+    assert asyncio.run(consume(stats)) == get_expected(records)
+    assert list(stats.batch_sizes) == [4, 4, 2]
+
+
+def test_score_reviews_async_raises_errors_of_the_records():
+    def fail():
+        yield {"product_id": 1, "text": "gut"}
+        raise ValueError("broken record")
+
+    async def consume():
+        return [result async for result in score_reviews_async(fail(), {})]
+
+    with pytest.raises(ValueError, match="broken record"):
+        asyncio.run(consume())
+
+
+def test_batch_sizer_stays_within_bounds():
+    sizer = BatchSizer(min_size=16, max_size=100, target_seconds=1.0)
+    assert sizer.size == 16
+    # NOTE: fast batches grow the size at most twofold per batch
+    assert sizer.update(16, 0.001) == 32
+    assert sizer.update(32, 0.0) == 64
+    assert sizer.update(64, 0.001) == 100
+    # NOTE: slow batches shrink it to the target time, not below min_size
+    assert sizer.update(100, 2.0) == 50
+    assert sizer.update(50, 100.0) == 16
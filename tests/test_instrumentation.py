@@ -0,0 +1,75 @@
+# standard library imports
+import atexit
+import json
+import multiprocessing
+
+# third party imports
+import pytest
+
+# local application imports
+from services.instrumentation import (
+    SETTINGS,
+    disable_instrumentation,
+    emit_event,
+    enable_instrumentation,
+    write_events_to,
+)
+
+
+def read_events(filename) -> list:
+    with open(filename, "r") as json_file:
+        return [json.loads(line) for line in json_file]
+
+
+def test_events_file_is_flushed_after_every_event(tmp_path):
+    filename = tmp_path / "events" / "events.json"
+    sink = write_events_to(filename)
+    sink({"event": "first"})
+    assert read_events(filename) == [{"event": "first"}]
+    sink.close()
+    sink({"event": "second"})
+    assert read_events(filename) == [{"event": "first"}, {"event": "second"}]
+    sink.close()
+
+
+@pytest.mark.parametrize(
+    "start_method",
+    [
+        method
+        for method in ("fork", "forkserver", "spawn")
+        if method in multiprocessing.get_all_start_methods()
+    ],
+)
+def test_events_file_is_reopened_per_process(tmp_path, start_method):
+    filename = tmp_path / "events.json"
+    sink = write_events_to(filename)
+    sink({"event": "parent"})
+    context = multiprocessing.get_context(start_method)
+    process = context.Process(target=sink, args=({"event": "child"},))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    sink({"event": "parent"})
+    sink.close()
+    events = [event["event"] for event in read_events(filename)]
+    assert events == ["parent", "child", "parent"]
+
+
+def test_disable_instrumentation_closes_events_file(tmp_path):
+    filename = tmp_path / "events.json"
+    enable_instrumentation(write_events_to(filename))
+    sink = SETTINGS["sink"]
+    emit_event({"event": "call"})
+    disable_instrumentation()
+    assert sink.events_file is None
+    assert read_events(filename) == [{"event": "call"}]
+
+
+def test_events_file_registers_one_exit_handler(tmp_path, monkeypatch):
+    handlers = []
+    monkeypatch.setattr(atexit, "register", handlers.append)
+    sink = write_events_to(tmp_path / "events.json")
+    for event in ("first", "second", "third"):
+        sink({"event": event})
+        sink.close()
+    assert handlers == [sink.close]
@@ -0,0 +1,76 @@
+# standard library imports
+import pickle
+
+# third party imports
+import pytest
+
+# local application imports
+from services.lexicon import CompoundLexicon, CompoundMatcher
+
+HEADS = ["kleid", "leid", "mut", "qualitaet", "ende", "sucht", "bequem", "hose"]
+
+
+@pytest.fixture
+def matcher():
+    return CompoundMatcher(HEADS)
+
+
+def find_head_brute_force(matcher: CompoundMatcher, token: str):
+    # NOTE: every split of the token, the longest allowed head wins
+    for start in range(matcher.min_modifier_length, len(token)):
+        modifier, head = token[:start], token[start:]
+        if (
+            head in matcher.heads
+            and len(head) >= matcher.min_head_length
+            and modifier not in matcher.excluded_modifiers
+        ):
+            return head
+    return None
+
+
+@pytest.mark.parametrize(
+    "token, parts",
+    [
+        ("sommerkleid", ("sommer", "kleid")),
+        ("stoffqualitaet", ("stoff", "qualitaet")),
+        ("superbequem", ("super", "bequem")),
+        ("jeanshose", ("jeans", "hose")),
+        # NOTE: "mut" is shorter than the shortest head
+        ("armut", None),
+        # NOTE: "ende" is excluded as head, "aus" as modifier
+        ("passende", None),
+        ("ausgesucht", None),
+        # NOTE: the modifier is too short, and a head alone is no compound
+        ("empleid", None),
+        ("kleid", None),
+    ],
+)
+def test_decompose_splits_off_the_longest_head(matcher, token, parts):
+    assert matcher.decompose(token) == parts
+
+
+def test_reversed_trie_matches_brute_force(matcher):
+    tokens = [
+        f"{modifier}{head}"
+        for modifier in ["", "a", "som", "somm", "sommer", "aus", "ausge", "stoff"]
+        for head in HEADS + ["leidx", "eid", ""]
+    ]
+    for token in tokens:
+        assert matcher.match(token) == find_head_brute_force(matcher, token), token
+
+
+def test_pickled_matcher_splits_the_same(matcher):
+    matcher.match("sommerkleid")
+    copy = pickle.loads(pickle.dumps(matcher))
+    assert copy.memo == {}
+    assert copy.decompose("sommerkleid") == ("sommer", "kleid")
+    assert copy.decompose("ausgesucht") is None
+
+
+def test_compound_lexicon_contains_compounds_of_its_words(matcher):
+    nouns = CompoundLexicon(["hose", "qualitaet"], matcher).difference(["jeanshose"])
+    assert "hose" in nouns
+    assert "stoffqualitaet" in nouns
+    # NOTE: the head is known to the matcher, but not a word of the lexicon
+    assert "sommerkleid" not in nouns
+    assert "jeanshose" not in nouns
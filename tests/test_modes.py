@@ -0,0 +1,135 @@
+# standard library imports
+import csv
+import shutil
+
+# third party imports
+import pandas as pd
+import pytest
+
+# local application imports
+import main
+
+TARGETS = [
+    "product_stats",
+    "overall_sentiment",
+    "sentiment_per_product",
+    "average_rating",
+    "rating_distribution",
+    "top_ten_words",
+]
+MODES = {
+    "multiprocessed": {"workers": 2},
+    "streaming": {"chunksize": 7},
+    "shards": {"workers": 2},
+    "deduplicated": {},
+}
+TEXTS = [
+    "Die Hose ist super, passt gut!",
+    "Schlechte Qualität, die Jacke ist zu klein.",
+    "Farbe ist schön aber der Stoff kratzt",
+    "Leider nicht gut, zurückgeschickt",
+    "Tolles Kleid. Gerne wieder!",
+]
+
+
+def write_reviews(filename, rows) -> None:
+    with open(filename, "w", encoding="latin-1", newline="") as csv_file:
+        writer = csv.writer(csv_file, delimiter=";")
+        writer.writerow(["product_id", "text", "rating"])
+        writer.writerows(rows)
+
+
+@pytest.fixture(scope="module")
+def reviews_csv(tmp_path_factory):
+    # NOTE: every seventh review has no rating, in the first chunk of the
+    # streaming mode as well as in every shard
+    filename = tmp_path_factory.mktemp("dataset") / "reviews.csv"
+    write_reviews(
+        filename,
+        [
+            [1000 + i % 4, f"{TEXTS[i % 5]} {i}", "" if i % 7 == 3 else 1 + i % 5]
+            for i in range(60)
+        ],
+    )
+    return filename
+
+
+@pytest.fixture(scope="module")
+def sequential_results(reviews_csv):
+    return main.run_pipeline("sequential", TARGETS, input_files=[reviews_csv])
+
+
+@pytest.mark.parametrize("mode", list(MODES))
+def test_modes_match_sequential_with_missing_ratings(
+    reviews_csv, sequential_results, mode
+):
+    results = main.run_pipeline(mode, TARGETS, input_files=[reviews_csv], **MODES[mode])
+    for target in TARGETS:
+        expected, result = sequential_results[target], results[target]
+        if isinstance(expected, pd.DataFrame):
+            pd.testing.assert_frame_equal(result, expected)
+        else:
+            assert result == expected, target
+    # NOTE: 60 reviews of 4 products, 9 of them without a rating. Like in the
+    # per-row baseline, all of them count toward the sentiment and the review
+    # count, only the rated ones toward the rating distribution and the mean
+    product_stats = results["product_stats"]
+    assert product_stats.review_count.sum() == 60
+    assert results["overall_sentiment"]["count"].sum() == 60
+    assert results["sentiment_per_product"].counts.sum() == 60
+    assert results["rating_distribution"]["count"].sum() == 51
+    assert "rating_0" not in product_stats.columns
+    assert "rating_-1" not in product_stats.columns
+    rating_columns = product_stats.filter(like="rating_")
+    assert rating_columns.sum().sum() == 51
+    reviews_df = pd.read_csv(reviews_csv, sep=";", encoding="latin-1")
+    ratings = reviews_df.groupby("product_id").rating
+    assert ratings.count().tolist() == rating_columns.sum(axis=1).tolist()
+    assert ratings.mean().round(2).tolist() == (
+        results["average_rating"].rating.tolist()
+    )
+
+
+@pytest.fixture(scope="module")
+def shards_folder(tmp_path_factory):
+    # NOTE: 45 reviews in 3 shards, every shard repeats one of its own reviews
+    # and the first 5 reviews of the previous shard with rating 5
+    folder = tmp_path_factory.mktemp("shards")
+    rows = [
+        [1000 + i % 4, f"{TEXTS[i % 5]} {i}", "" if i % 7 == 3 else 1 + i % 5]
+        for i in range(45)
+    ]
+    for shard in range(3):
+        shard_rows = rows[shard * 15 : (shard + 1) * 15]
+        if shard:
+            previous_rows = rows[(shard - 1) * 15 : (shard - 1) * 15 + 5]
+            shard_rows = [[p, text, 5] for p, text, _ in previous_rows] + shard_rows
+        shard_rows.append(shard_rows[-1])
+        write_reviews(folder / f"reviews-{shard}.csv", shard_rows)
+    return folder
+
+
+@pytest.mark.parametrize("mode", ["shards", "streaming"])
+@pytest.mark.parametrize("pattern", ["", "*.csv"])
+def test_sharded_inputs_match_single_file(tmp_path, shards_folder, mode, pattern):
+    # NOTE: the shards one after the other in a single file, where the
+    # sequential mode also keeps the first copy of every review
+    single_file = tmp_path / "reviews.csv"
+    with open(single_file, "wb") as single:
+        for i, filename in enumerate(sorted(shards_folder.glob("*.csv"))):
+            with open(filename, "rb") as shard:
+                if i:
+                    shard.readline()
+                shutil.copyfileobj(shard, single)
+    expected = main.run_pipeline("sequential", TARGETS, input_files=[single_file])
+    assert expected["product_stats"].review_count.sum() == 45
+    input_files = main.get_input_files(str(shards_folder / pattern))
+    assert len(input_files) == 3
+    results = main.run_pipeline(
+        mode, TARGETS, input_files=input_files, chunksize=4, workers=2
+    )
+    for target in TARGETS:
+        if isinstance(expected[target], pd.DataFrame):
+            pd.testing.assert_frame_equal(results[target], expected[target])
+        else:
+            assert results[target] == expected[target], target
@@ -0,0 +1,59 @@
+# third party imports
+import numpy as np
+import pandas as pd
+
+# local application imports
+from services.persistence import (
+    empty_review_store,
+    get_review_keys,
+    update_review_store,
+)
+
+SENTIMENT_WORDS = {"gut": {"score": 0.5}, "schlecht": {"score": -0.5}}
+STOPWORDS = {"ist"}
+NOUNS = {"hose", "jacke"}
+
+
+def get_reviews(texts, ratings) -> pd.DataFrame:
+    return pd.DataFrame(
+        {"product_id": [1] * len(texts), "text": texts, "rating": ratings}
+    )
+
+
+def test_review_keys_do_not_depend_on_rating_dtype():
+    int_df = get_reviews(["Hose ist gut"], np.array([5], dtype="int8"))
+    float_df = get_reviews(["Hose ist gut"], np.array([5.0]))
+    assert get_review_keys(int_df).equals(get_review_keys(float_df))
+
+
+def test_review_keys_of_missing_ratings():
+    df = get_reviews(["Hose ist gut", "Hose ist gut"], [np.nan, 5.0])
+    keys = get_review_keys(df)
+    assert keys[0] != keys[1]
+    assert keys[0] == get_review_keys(df.iloc[:1])[0]
+
+
+def test_update_review_store_hits_across_rating_dtypes():
+    float_df = get_reviews(["Hose ist gut", "Jacke schlecht"], [5.0, np.nan])
+    store, _, stats = update_review_store(
+        empty_review_store(), float_df, SENTIMENT_WORDS, STOPWORDS, NOUNS
+    )
+    assert (stats.hits, stats.misses) == (0, 2)
+    int_df = get_reviews(["Hose ist gut"], np.array([5], dtype="int8"))
+    _, review_results_df, stats = update_review_store(
+        store, int_df, SENTIMENT_WORDS, STOPWORDS, NOUNS
+    )
+    assert (stats.hits, stats.misses) == (1, 0)
+    assert review_results_df.score.tolist() == [0.5]
+
+
+def test_update_review_store_prunes_reviews_absent_from_input():
+    df = get_reviews(["Hose ist gut", "Jacke schlecht"], [5, 1])
+    store, _, _ = update_review_store(
+        empty_review_store(), df, SENTIMENT_WORDS, STOPWORDS, NOUNS
+    )
+    store, _, stats = update_review_store(
+        store, df.iloc[1:], SENTIMENT_WORDS, STOPWORDS, NOUNS
+    )
+    assert stats.pruned == 1
+    assert store.results.index.equals(get_review_keys(df.iloc[1:]))
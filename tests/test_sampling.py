@@ -0,0 +1,99 @@
+# third party imports
+import numpy as np
+import pandas as pd
+import pytest
+
+# local application imports
+from services.sampling import (
+    estimate_average_rating_per_id,
+    estimate_overall_sentiment,
+    estimate_ratings_in_total,
+    sample_reviews_per_product,
+)
+
+SAMPLE_SIZE = 40
+SEED = 1
+
+
+@pytest.fixture(scope="module")
+def reviews_df() -> pd.DataFrame:
+    # NOTE: two products larger than the sample size, one smaller, every
+    # product with its own rating distribution, every tenth review unrated
+    rng = np.random.RandomState(1)
+    sizes = {"1001": 400, "1002": 150, "1003": 25}
+    weights = {
+        "1001": [0.05, 0.05, 0.1, 0.3, 0.5],
+        "1002": [0.4, 0.3, 0.1, 0.1, 0.1],
+        "1003": [0.2, 0.2, 0.2, 0.2, 0.2],
+    }
+    frames = [
+        pd.DataFrame(
+            {
+                "product_id": product_id,
+                "rating": rng.choice(np.arange(1, 6), size, p=weights[product_id]),
+            }
+        )
+        for product_id, size in sizes.items()
+    ]
+    df = pd.concat(frames).sample(frac=1, random_state=rng).reset_index(drop=True)
+    df["rating"] = df.rating.astype("float64").where(df.index % 10 != 9)
+    df["text"] = np.where(df.rating.fillna(3) >= 4, "good", "bad")
+    return df[["product_id", "text", "rating"]]
+
+
+def sample_chunks(reviews_df, seed):
+    chunks = (reviews_df.iloc[i : i + 100] for i in range(0, len(reviews_df), 100))
+    return sample_reviews_per_product(chunks, SAMPLE_SIZE, seed)
+
+
+@pytest.fixture(scope="module")
+def sample(reviews_df):
+    return sample_chunks(reviews_df, SEED)
+
+
+def test_sample_keeps_sample_size_per_product(sample, reviews_df):
+    assert sample.population.to_dict() == {"1001": 400, "1002": 150, "1003": 25}
+    assert sample.sampled.to_dict() == {"1001": 40, "1002": 40, "1003": 25}
+    # NOTE: unrated reviews are sampled as well
+    assert sample.df.rating.isna().any()
+
+
+def test_average_rating_intervals_contain_exact_means(sample, reviews_df):
+    exact = reviews_df.groupby("product_id").rating.mean().round(2)
+    estimates = estimate_average_rating_per_id(sample).set_index("article")
+    assert (estimates.ci_low <= exact).all()
+    assert (exact <= estimates.ci_high).all()
+    # NOTE: the small product is sampled completely, its mean is exact
+    assert estimates.loc["1003", "rating"] == exact["1003"]
+    assert estimates.loc["1003", "ci_low"] == estimates.loc["1003", "ci_high"]
+
+
+def test_rating_count_intervals_contain_exact_counts(sample, reviews_df):
+    exact = reviews_df.rating.value_counts()
+    estimates = estimate_ratings_in_total(sample).set_index("rating")
+    assert sorted(estimates.index) == sorted(exact.index)
+    assert (estimates.ci_low <= exact[estimates.index]).all()
+    assert (exact[estimates.index] <= estimates.ci_high).all()
+
+
+def test_sentiment_count_intervals_contain_exact_counts(sample, reviews_df):
+    # NOTE: every review counts toward the sentiment, rated or not
+    exact = reviews_df.text.value_counts()
+    sentiment_df = pd.DataFrame({"encoded_score": sample.df.text})
+    estimates = estimate_overall_sentiment(sample, sentiment_df).set_index("sentiment")
+    assert estimates["count"].sum() == pytest.approx(len(reviews_df), abs=1)
+    assert (estimates.ci_low <= exact[estimates.index]).all()
+    assert (exact[estimates.index] <= estimates.ci_high).all()
+
+
+def test_rating_count_intervals_cover_exact_counts_across_seeds(reviews_df):
+    # NOTE: a single seed may miss with 5% per interval, over many seeds
+    # about 95% of the intervals contain the exact count
+    exact = reviews_df.rating.value_counts()
+    covered = []
+    for seed in range(40):
+        estimates = estimate_ratings_in_total(sample_chunks(reviews_df, seed))
+        estimates = estimates.set_index("rating")
+        counts = exact[estimates.index]
+        covered.extend((estimates.ci_low <= counts) & (counts <= estimates.ci_high))
+    assert np.mean(covered) >= 0.85
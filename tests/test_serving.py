@@ -0,0 +1,162 @@
+# standard library imports
+import csv
+import threading
+
+# third party imports
+import pytest
+
+# local application imports
+import main
+from services.serving import (
+    ReviewIndex,
+    ReviewServiceClient,
+    ServiceError,
+    create_server,
+)
+
+SENTIMENT_WORDS = {"gut": {"score": 0.5}, "schlecht": {"score": -0.5}}
+STOPWORDS = {"ist"}
+NOUNS = {"hose", "jacke"}
+
+
+class FailingIndex:
+    version = 1
+
+    def get_stats(self, words: int) -> dict:
+        raise RuntimeError("broken aggregates")
+
+    def get_product(self, product_id: str) -> dict:
+        raise KeyError(product_id)
+
+    def reload(self) -> dict:
+        raise OSError("csv is gone")
+
+
+def serve_index(index):
+    server = create_server(index, ("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, ReviewServiceClient(server.server_address, timeout=10)
+
+
+def append_reviews(filename, rows) -> None:
+    with open(filename, "a", encoding="latin-1", newline="") as csv_file:
+        csv.writer(csv_file, delimiter=";").writerows(rows)
+
+
+@pytest.fixture
+def client():
+    server, client = serve_index(FailingIndex())
+    yield client
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def reviews_csv(tmp_path):
+    filename = tmp_path / "reviews.csv"
+    append_reviews(
+        filename,
+        [
+            ["product_id", "text", "rating"],
+            ["1", "Die Hose ist gut", "5"],
+            ["1", "Die Hose ist schlecht", "1"],
+            ["2", "Jacke gut", "4"],
+        ],
+    )
+    return filename
+
+
+@pytest.fixture
+def index_client(reviews_csv):
+    index = ReviewIndex(
+        reviews_csv,
+        SENTIMENT_WORDS,
+        STOPWORDS,
+        NOUNS,
+        product_charts={"sentiment": main.get_product_sentiment_plot_job},
+    )
+    server, client = serve_index(index)
+    yield index, client
+    server.shutdown()
+    server.server_close()
+
+
+def test_unexpected_errors_are_answered_with_500(client, caplog):
+    with pytest.raises(ServiceError) as error:
+        client.stats()
+    assert error.value.status == 500
+    assert "broken aggregates" not in str(error.value)
+    assert "broken aggregates" in caplog.text
+    with pytest.raises(ServiceError) as error:
+        client.request("POST", "/reload")
+    assert error.value.status == 500
+    assert client.health() == {"status": "ok", "version": 1}
+
+
+def test_known_errors_keep_their_status(client):
+    with pytest.raises(ServiceError) as error:
+        client.product("123")
+    assert error.value.status == 404
+
+
+def test_serve_reads_the_input_file(tmp_path):
+    args = main.get_argument_parser().parse_args(
+        ["serve", "--input", str(tmp_path / "reviews.csv")]
+    )
+    assert args.input == tmp_path / "reviews.csv"
+    args = main.get_argument_parser().parse_args(["serve"])
+    assert args.input == main.DEFAULT_INPUT_FILE
+
+
+def test_review_index_answers_queries(index_client):
+    _, client = index_client
+    stats = client.stats()
+    assert stats["review_count"] == 3
+    assert stats["product_count"] == 2
+    assert stats["mean_rating"] == pytest.approx(10 / 3)
+    assert stats["top_words"] == [["hose", 2], ["jacke", 1]]
+    assert client.products() == [
+        {"product_id": "1", "review_count": 2},
+        {"product_id": "2", "review_count": 1},
+    ]
+    product = client.product("1")
+    assert product["review_count"] == 2
+    assert product["mean_rating"] == 3
+    assert product["ratings"] == {"1": 1, "5": 1}
+    assert sum(product["sentiment"].values()) == 2
+    with pytest.raises(ServiceError) as error:
+        client.product("3")
+    assert error.value.status == 404
+
+
+def test_reload_aggregates_appended_reviews(index_client, reviews_csv):
+    index, client = index_client
+    # NOTE: an unrated review counts toward the review count, not the mean
+    append_reviews(reviews_csv, [["2", "Jacke schlecht", "2"], ["3", "Hose", ""]])
+    reload_stats = client.reload()
+    assert reload_stats["new_reviews"] == 2
+    assert reload_stats["reviews"] == 5
+    assert client.stats()["review_count"] == 5
+    assert client.stats()["mean_rating"] == 3
+    assert client.product("2")["review_count"] == 2
+    product = client.product("3")
+    assert product["review_count"] == 1
+    assert product["mean_rating"] is None
+    assert product["ratings"] == {}
+    assert client.reload()["new_reviews"] == 0
+
+
+def test_reload_invalidates_cached_charts(index_client, reviews_csv):
+    index, client = index_client
+    png = client.chart("sentiment", "1")
+    assert png.startswith(b"\x89PNG")
+    assert client.chart("sentiment", "1") == png
+    assert (index.charts.hits, index.charts.misses, len(index.charts)) == (1, 1, 1)
+    append_reviews(reviews_csv, [["1", "Hose wieder gut", "4"]])
+    version = index.version
+    client.reload()
+    assert index.version == version + 1
+    assert len(index.charts) == 0
+    client.chart("sentiment", "1")
+    assert index.charts.misses == 2
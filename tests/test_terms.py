@@ -0,0 +1,69 @@
+# standard library imports
+import math
+
+# third party imports
+import pandas as pd
+import pytest
+
+# local application imports
+from services.terms import (
+    build_product_term_matrix,
+    get_distinctive_terms,
+    get_top_terms,
+)
+from services.transformation import tokenize_text_values
+
+
+@pytest.fixture
+def matrix():
+    # NOTE: product a has hose 3, farbe 1 and stoff 1, product b jacke 3 and
+    # farbe 1, the terms in order of first occurrence
+    df = pd.DataFrame(
+        {
+            "product_id": ["b", "a", "a", "b"],
+            "text": ["jacke farbe", "hose hose farbe", "hose stoff", "jacke jacke"],
+        }
+    )
+    return build_product_term_matrix(df.product_id, tokenize_text_values(df))
+
+
+def get_words(terms_df: pd.DataFrame) -> dict:
+    return terms_df.groupby("product_id").word.apply(list).to_dict()
+
+
+def test_product_term_matrix_counts(matrix):
+    assert matrix.shape == (2, 4)
+    assert list(matrix.rows) == ["a", "b"]
+    assert matrix.row("a").to_dict() == {"hose": 3, "farbe": 1, "stoff": 1}
+    assert matrix.row("b").to_dict() == {"jacke": 3, "farbe": 1}
+
+
+def test_top_terms_break_ties_by_first_occurrence(matrix):
+    terms_df = get_top_terms(matrix, k=2)
+    assert get_words(terms_df) == {"a": ["hose", "farbe"], "b": ["jacke", "farbe"]}
+    assert terms_df["count"].tolist() == [3, 1, 3, 1]
+    assert terms_df["rank"].tolist() == [1, 2, 1, 2]
+
+
+def test_distinctive_terms_rank_by_log_odds(matrix):
+    prior = 4.0
+    terms_df = get_distinctive_terms(matrix, prior=prior)
+    # NOTE: farbe occurs in both products and is least distinctive in both
+    assert get_words(terms_df) == {
+        "a": ["hose", "stoff", "farbe"],
+        "b": ["jacke", "farbe"],
+    }
+    hose = terms_df.iloc[0]
+    # NOTE: hose is 3 of the 5 terms of a and of the 9 terms overall, so it
+    # gets a third of the 4 pseudo counts, b has the other 4 terms; smoothed
+    # idf of 2 rows
+    alpha = prior * 3 / 9
+    log_odds = math.log((3 + alpha) / (5 + prior - 3 - alpha))
+    rest_log_odds = math.log(alpha / (4 + prior - alpha))
+    variance = 1 / (3 + alpha) + 1 / alpha
+    assert hose.log_odds == pytest.approx(
+        (log_odds - rest_log_odds) / math.sqrt(variance)
+    )
+    assert hose.tf_idf == pytest.approx(3 / 5 * (math.log(3 / 2) + 1))
+    farbe = terms_df[(terms_df.product_id == "a") & (terms_df.word == "farbe")]
+    assert farbe.tf_idf.item() == pytest.approx(1 / 5)
@@ -0,0 +1,52 @@
+# standard library imports
+import functools
+from collections import Counter
+
+# third party imports
+import numpy as np
+import pytest
+
+# local application imports
+from services.transformation import WordFrequencies
+
+
+@pytest.fixture
+def chunks():
+    # NOTE: a skewed stream of 50 words in 8 chunks, word 0 is the most
+    # frequent one and the rare words differ between chunks
+    rng = np.random.RandomState(0)
+    words = [f"word{i}" for i in rng.zipf(1.5, 4000) % 50]
+    return [words[i : i + 500] for i in range(0, len(words), 500)]
+
+
+def merge_chunks(chunks, capacity) -> WordFrequencies:
+    return functools.reduce(
+        WordFrequencies.merge,
+        (WordFrequencies.from_words(chunk, capacity) for chunk in chunks),
+    )
+
+
+def test_word_frequencies_without_capacity_are_exact(chunks):
+    merged = merge_chunks(chunks, None)
+    exact = Counter(word for chunk in chunks for word in chunk)
+    assert merged.counts == dict(exact)
+    assert merged.missing_count == 0
+    assert merged.most_common(10) == exact.most_common(10)
+
+
+@pytest.mark.parametrize("capacity", [5, 10, 20])
+def test_word_frequencies_stay_within_error_bounds_after_merging(chunks, capacity):
+    merged = merge_chunks(chunks, capacity)
+    exact = Counter(word for chunk in chunks for word in chunk)
+    assert len(merged) <= capacity
+    assert merged.missing_count > 0
+    # NOTE: kept words are overestimated by at most missing_count, and an
+    # evicted word cannot have occurred more often than missing_count
+    for word, count in exact.items():
+        if word in merged.counts:
+            assert count <= merged.counts[word] <= count + merged.missing_count
+        else:
+            assert count <= merged.missing_count
+    # NOTE: words occurring more often than missing_count are always kept
+    frequent = [word for word, count in exact.items() if count > merged.missing_count]
+    assert frequent and set(frequent) <= set(merged.counts)